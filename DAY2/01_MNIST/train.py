@@ -1,6 +1,10 @@
 """
 MNIST 手寫數字辨識 - 訓練腳本
 使用 PyTorch 建立簡單的 CNN 模型進行 0-9 數字分類
+
+使用方式:
+python train.py            # 訓練
+python train.py --resume   # 從上次中斷的檢查點繼續訓練
 """
 
 import torch
@@ -9,14 +13,19 @@ import torch.optim as optim
 from torch.utils.data import DataLoader
 from torchvision import datasets, transforms
 import os
+import sys
+import argparse
 import matplotlib.pyplot as plt
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from train_utils import EarlyStopping, atomic_save, load_training_state, save_training_state
+
 # ============== 取得腳本所在目錄 (相對路徑基準) ==============
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # ============== 設定區 ==============
 BATCH_SIZE = 64          # 批次大小
-EPOCHS = 20              # 訓練輪數
+EPOCHS = 20              # 訓練輪數 (最多)
 LEARNING_RATE = 0.001    # 學習率
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
@@ -24,6 +33,11 @@ DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 DATA_DIR = os.path.join(SCRIPT_DIR, "data")
 MODEL_DIR = os.path.join(SCRIPT_DIR, "..", "models")
 MODEL_SAVE_PATH = os.path.join(MODEL_DIR, "mnist_cnn.pth")
+CHECKPOINT_PATH = os.path.join(MODEL_DIR, "mnist_cnn_state.pth")
+
+# 檢查點與早停
+CHECKPOINT_EVERY = 1     # 每 N 個 epoch 儲存完整訓練狀態 (供 --resume 使用)
+EARLY_STOP_PATIENCE = 3  # 測試準確率連續 N 個 epoch 沒進步就停止 (0 = 停用)
 
 # ============== 資料準備 ==============
 def get_data_loaders():
@@ -233,6 +247,11 @@ def visualize_samples(test_loader, model):
 
 # ============== 主程式 ==============
 def main():
+    parser = argparse.ArgumentParser(description='MNIST 手寫數字辨識訓練')
+    parser.add_argument('--resume', action='store_true',
+                        help='從上次儲存的訓練狀態繼續')
+    args = parser.parse_args()
+
     print("=" * 50)
     print("MNIST 手寫數字辨識 - CNN 訓練")
     print("=" * 50)
@@ -258,14 +277,34 @@ def main():
     optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
 
     # 訓練歷史紀錄
-    train_losses, train_accs = [], []
-    test_losses, test_accs = [], []
+    history = {'train_losses': [], 'train_accs': [], 'test_losses': [], 'test_accs': []}
+    start_epoch = 1
+    early_stopping = EarlyStopping(patience=EARLY_STOP_PATIENCE, mode='max')
+
+    # 從檢查點繼續
+    if args.resume:
+        if os.path.exists(CHECKPOINT_PATH):
+            last_epoch, history, extra = load_training_state(
+                CHECKPOINT_PATH, model, optimizer, None, DEVICE
+            )
+            early_stopping.load_state_dict(extra['early_stopping'])
+            start_epoch = last_epoch + 1
+            print(f"從檢查點繼續: 已完成 {last_epoch} 個 epoch")
+        else:
+            print(f"找不到檢查點 {CHECKPOINT_PATH}，從頭開始訓練")
+        print()
+
+    train_losses, train_accs = history['train_losses'], history['train_accs']
+    test_losses, test_accs = history['test_losses'], history['test_accs']
 
     # 開始訓練
     print("[3] 開始訓練...")
     print("-" * 50)
 
-    for epoch in range(1, EPOCHS + 1):
+    for epoch in range(start_epoch, EPOCHS + 1):
+        if early_stopping.should_stop:
+            break
+
         print(f"\nEpoch {epoch}/{EPOCHS}")
 
         # 訓練
@@ -285,12 +324,24 @@ def main():
         print(f"  Train Loss: {train_loss:.4f} | Train Acc: {train_acc:.2f}%")
         print(f"  Test Loss:  {test_loss:.4f} | Test Acc:  {test_acc:.2f}%")
 
+        early_stopping.step(test_acc)
+
+        # 儲存完整訓練狀態
+        if epoch % CHECKPOINT_EVERY == 0 or epoch == EPOCHS or early_stopping.should_stop:
+            save_training_state(
+                CHECKPOINT_PATH, model, optimizer, None, epoch, history,
+                early_stopping=early_stopping.state_dict()
+            )
+
+        if early_stopping.should_stop:
+            print(f"  >> 測試準確率已 {EARLY_STOP_PATIENCE} 個 epoch 沒有進步，提前結束訓練")
+
     print("-" * 50)
     print()
 
     # 儲存模型
     print("[4] 儲存模型...")
-    torch.save({
+    atomic_save({
         'model_state_dict': model.state_dict(),
         'optimizer_state_dict': optimizer.state_dict(),
         'train_losses': train_losses,
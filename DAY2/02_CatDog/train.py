@@ -2,24 +2,38 @@
 貓狗分類器 - 訓練腳本
 使用 PyTorch 建立 CNN 模型進行貓狗二分類
 支援使用預訓練模型 (Transfer Learning)
+
+使用方式:
+python train.py            # 訓練
+python train.py --resume   # 從上次中斷的檢查點繼續訓練
 """
 
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, random_split
+from torch.utils.data import DataLoader, Subset, TensorDataset, random_split
 from torchvision import datasets, transforms, models
 import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 import shutil
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from train_utils import (EarlyStopping, atomic_save, autocast, configure_threads,
+                         describe_cpu_options, load_training_state, optimize_model,
+                         save_training_state, to_channels_last)
+
 # ============== 取得腳本所在目錄 (相對路徑基準) ==============
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # ============== 設定區 ==============
 BATCH_SIZE = 32          # 批次大小
-EPOCHS = 10              # 訓練輪數
+EPOCHS = 10              # 訓練輪數 (最多)
 LEARNING_RATE = 0.001    # 學習率
 IMAGE_SIZE = 224         # 影像大小 (配合預訓練模型)
 TRAIN_SPLIT = 0.8        # 訓練集比例
@@ -29,8 +43,25 @@ DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 DATA_DIR = os.path.join(SCRIPT_DIR, "data")
 MODEL_DIR = os.path.join(SCRIPT_DIR, "..", "models")
 MODEL_SAVE_PATH = os.path.join(MODEL_DIR, "catdog_model.pth")
+CHECKPOINT_PATH = os.path.join(MODEL_DIR, "catdog_model_state.pth")
 USE_PRETRAINED = True                  # 是否使用預訓練模型
 
+# 特徵快取 (USE_PRETRAINED 時骨幹凍結，只需跑一次)
+USE_FEATURE_CACHE = True # 骨幹特徵存成 memmap，之後只訓練 fc 分類頭
+FEATURE_VIEWS = 1        # 每張訓練圖快取幾個資料增強視角 (1 = 不做資料增強)
+HEAD_EPOCHS = 50         # 特徵快取模式下的訓練輪數 (每輪只需數秒)
+FEATURE_CACHE_DIR = os.path.join(SCRIPT_DIR, "feature_cache")
+
+# CPU 最佳化設定 (見 ../benchmark_cpu_training.py 選擇最快組合)
+USE_BF16 = True          # bfloat16 自動混合精度 (僅 CPU，且支援時)
+CHANNELS_LAST = True     # channels-last 記憶體格式
+COMPILE_MODEL = False    # torch.compile (第一個 epoch 需額外編譯時間)
+NUM_THREADS = None       # 運算執行緒數 (None = PyTorch 預設)
+
+# 檢查點與早停
+CHECKPOINT_EVERY = 1     # 每 N 個 epoch 儲存完整訓練狀態 (供 --resume 使用)
+EARLY_STOP_PATIENCE = 3  # 驗證準確率連續 N 個 epoch 沒進步就停止 (0 = 停用)
+
 
 # ============== 資料準備 ==============
 def setup_data_directory():
@@ -75,8 +106,8 @@ def setup_data_directory():
     return True
 
 
-def get_data_loaders():
-    """準備訓練和驗證資料載入器"""
+def get_transforms():
+    """取得訓練和驗證的資料轉換"""
 
     # 訓練資料轉換 (包含資料增強)
     train_transform = transforms.Compose([
@@ -97,6 +128,13 @@ def get_data_loaders():
                              [0.229, 0.224, 0.225])
     ])
 
+    return train_transform, val_transform
+
+
+def get_data_loaders():
+    """準備訓練和驗證資料載入器"""
+    train_transform, val_transform = get_transforms()
+
     # 載入資料集
     full_dataset = datasets.ImageFolder(DATA_DIR, transform=train_transform)
 
@@ -104,8 +142,10 @@ def get_data_loaders():
     train_size = int(TRAIN_SPLIT * len(full_dataset))
     val_size = len(full_dataset) - train_size
 
+    # 固定亂數種子，--resume 時才會得到相同的切分
     train_dataset, val_dataset = random_split(
-        full_dataset, [train_size, val_size]
+        full_dataset, [train_size, val_size],
+        generator=torch.Generator().manual_seed(42)
     )
 
     # 為驗證集設定不同的轉換
@@ -126,6 +166,111 @@ def get_data_loaders():
     return train_loader, val_loader, full_dataset.classes
 
 
+# ============== 特徵快取 ==============
+def get_feature_cache_key(dataset, indices, views):
+    """依檔案清單 (含修改時間)、視角數與影像大小產生快取識別碼"""
+    h = hashlib.sha1(f"{views}|{IMAGE_SIZE}".encode())
+    for i in indices:
+        path = dataset.samples[i][0]
+        stat = os.stat(path)
+        h.update(f"{path}|{stat.st_mtime_ns}|{stat.st_size}\n".encode())
+    return h.hexdigest()
+
+
+def cache_features(backbone, dataset, views, name, feature_dim):
+    """
+    以凍結骨幹擷取特徵並寫入 memmap 快取，資料沒變時直接讀取
+
+    Args:
+        backbone: 輸出 (N, feature_dim) 特徵的骨幹
+        dataset: 影像資料集 (Subset)
+        views: 每張圖擷取幾次 (搭配隨機資料增強即為 K 個增強視角)
+        name: 快取名稱 (train / val)
+
+    Returns:
+        features: (len(dataset) * views, feature_dim) float32
+        labels: (len(dataset) * views,) int64
+    """
+    features_path = os.path.join(FEATURE_CACHE_DIR, f"{name}_features.npy")
+    labels_path = os.path.join(FEATURE_CACHE_DIR, f"{name}_labels.npy")
+    meta_path = os.path.join(FEATURE_CACHE_DIR, f"{name}_meta.json")
+
+    key = get_feature_cache_key(dataset.dataset, dataset.indices, views)
+
+    if os.path.exists(meta_path) and os.path.exists(features_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f).get("key") == key:
+                print(f"  使用既有特徵快取: {features_path}")
+                return np.load(features_path), np.load(labels_path)
+
+    os.makedirs(FEATURE_CACHE_DIR, exist_ok=True)
+    num_samples = len(dataset) * views
+    tmp_path = features_path + ".tmp.npy"
+    features = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float32, shape=(num_samples, feature_dim)
+    )
+    labels = np.empty(num_samples, dtype=np.int64)
+
+    loader = DataLoader(dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=0)
+    backbone.eval()
+    offset = 0
+
+    with torch.no_grad():
+        for view in range(views):
+            for data, target in tqdm(loader, desc=f"擷取 {name} 特徵 ({view + 1}/{views})"):
+                data = to_channels_last(data.to(DEVICE), CHANNELS_LAST)
+                with autocast(DEVICE, USE_BF16):
+                    output = backbone(data)
+
+                n = data.size(0)
+                features[offset:offset + n] = output.float().cpu().numpy()
+                labels[offset:offset + n] = target.numpy()
+                offset += n
+
+    features.flush()
+    del features
+    os.replace(tmp_path, features_path)
+    np.save(labels_path, labels)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "views": views, "num_samples": num_samples}, f)
+
+    print(f"  特徵快取已儲存: {features_path} ({num_samples} 筆)")
+    return np.load(features_path), labels
+
+
+def get_feature_loaders(model, train_indices, val_indices):
+    """
+    凍結的 ResNet18 骨幹只跑一次，回傳 512 維特徵的資料載入器
+    之後只需訓練 model.fc
+    """
+    train_transform, val_transform = get_transforms()
+
+    # 只有快取多個視角時才需要隨機資料增強
+    train_images = Subset(
+        datasets.ImageFolder(DATA_DIR, transform=train_transform if FEATURE_VIEWS > 1 else val_transform),
+        train_indices
+    )
+    val_images = Subset(datasets.ImageFolder(DATA_DIR, transform=val_transform), val_indices)
+
+    # 去掉 fc 的 ResNet18 (到 avgpool 為止)
+    backbone = nn.Sequential(*list(model.children())[:-1], nn.Flatten())
+    feature_dim = model.fc[0].in_features
+
+    train_features, train_labels = cache_features(backbone, train_images, FEATURE_VIEWS, "train", feature_dim)
+    val_features, val_labels = cache_features(backbone, val_images, 1, "val", feature_dim)
+
+    train_loader = DataLoader(
+        TensorDataset(torch.from_numpy(train_features), torch.from_numpy(train_labels)),
+        batch_size=BATCH_SIZE, shuffle=True
+    )
+    val_loader = DataLoader(
+        TensorDataset(torch.from_numpy(val_features), torch.from_numpy(val_labels)),
+        batch_size=BATCH_SIZE, shuffle=False
+    )
+
+    return train_loader, val_loader
+
+
 # ============== 模型定義 ==============
 class SimpleCNN(nn.Module):
     """自定義簡單 CNN 模型"""
@@ -205,10 +350,12 @@ def train_one_epoch(model, train_loader, optimizer, criterion, epoch):
 
     for data, target in pbar:
         data, target = data.to(DEVICE), target.to(DEVICE)
+        data = to_channels_last(data, CHANNELS_LAST)
 
         optimizer.zero_grad()
-        output = model(data)
-        loss = criterion(output, target)
+        with autocast(DEVICE, USE_BF16):
+            output = model(data)
+            loss = criterion(output, target)
         loss.backward()
         optimizer.step()
 
@@ -238,9 +385,11 @@ def evaluate(model, val_loader, criterion):
     with torch.no_grad():
         for data, target in val_loader:
             data, target = data.to(DEVICE), target.to(DEVICE)
+            data = to_channels_last(data, CHANNELS_LAST)
 
-            output = model(data)
-            loss = criterion(output, target)
+            with autocast(DEVICE, USE_BF16):
+                output = model(data)
+                loss = criterion(output, target)
 
             val_loss += loss.item()
             _, predicted = output.max(1)
@@ -328,11 +477,18 @@ def visualize_predictions(val_loader, model, classes):
 
 # ============== 主程式 ==============
 def main():
+    parser = argparse.ArgumentParser(description='貓狗分類器訓練')
+    parser.add_argument('--resume', action='store_true',
+                        help='從上次儲存的訓練狀態繼續')
+    args = parser.parse_args()
+
     print("=" * 50)
     print("貓狗分類器 - CNN 訓練")
     print("=" * 50)
+    configure_threads(NUM_THREADS)
     print(f"使用裝置: {DEVICE}")
     print(f"使用預訓練模型: {USE_PRETRAINED}")
+    print(f"最佳化: {describe_cpu_options(DEVICE, USE_BF16, CHANNELS_LAST, COMPILE_MODEL)}")
     print()
 
     # 確保模型目錄存在
@@ -357,8 +513,24 @@ def main():
     else:
         model = SimpleCNN(num_classes=len(classes)).to(DEVICE)
         print("使用自定義 CNN 模型")
+    model, run_model = optimize_model(model, CHANNELS_LAST, COMPILE_MODEL)
     print()
 
+    # 特徵快取模式: 骨幹只跑一次，之後只訓練分類頭
+    use_feature_cache = USE_PRETRAINED and USE_FEATURE_CACHE
+    epochs = EPOCHS
+    fit_model, fit_train_loader, fit_val_loader = run_model, train_loader, val_loader
+
+    if use_feature_cache:
+        print("[3-1] 建立骨幹特徵快取...")
+        fit_train_loader, fit_val_loader = get_feature_loaders(
+            model, train_loader.dataset.indices, val_loader.dataset.indices
+        )
+        fit_model = model.fc
+        epochs = HEAD_EPOCHS
+        print(f"  只訓練分類頭，共 {epochs} 個 epoch")
+        print()
+
     # 定義損失函數和優化器
     criterion = nn.CrossEntropyLoss()
 
@@ -369,25 +541,49 @@ def main():
         optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
 
     # 學習率調度器
-    scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=5, gamma=0.5)
+    scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=max(1, epochs // 2), gamma=0.5)
 
     # 訓練歷史紀錄
-    train_losses, train_accs = [], []
-    val_losses, val_accs = [], []
+    history = {'train_losses': [], 'train_accs': [], 'val_losses': [], 'val_accs': []}
     best_val_acc = 0.0
+    start_epoch = 1
+    early_stopping = EarlyStopping(patience=EARLY_STOP_PATIENCE, mode='max')
+
+    # 從檢查點繼續
+    if args.resume:
+        if os.path.exists(CHECKPOINT_PATH):
+            last_epoch, history, extra = load_training_state(
+                CHECKPOINT_PATH, model, optimizer, scheduler, DEVICE
+            )
+            best_val_acc = extra['best_val_acc']
+            early_stopping.load_state_dict(extra['early_stopping'])
+            start_epoch = last_epoch + 1
+            print(f"從檢查點繼續: 已完成 {last_epoch} 個 epoch (最佳 Val Acc: {best_val_acc:.2f}%)")
+        else:
+            print(f"找不到檢查點 {CHECKPOINT_PATH}，從頭開始訓練")
+        print()
+
+    train_losses, train_accs = history['train_losses'], history['train_accs']
+    val_losses, val_accs = history['val_losses'], history['val_accs']
 
     # 開始訓練
     print("[4] 開始訓練...")
     print("-" * 50)
 
-    for epoch in range(1, EPOCHS + 1):
+    if early_stopping.should_stop:
+        print("檢查點已達早停條件，不再繼續訓練")
+
+    for epoch in range(start_epoch, epochs + 1):
+        if early_stopping.should_stop:
+            break
+
         # 訓練
         train_loss, train_acc = train_one_epoch(
-            model, train_loader, optimizer, criterion, epoch
+            fit_model, fit_train_loader, optimizer, criterion, epoch
         )
 
         # 評估
-        val_loss, val_acc = evaluate(model, val_loader, criterion)
+        val_loss, val_acc = evaluate(fit_model, fit_val_loader, criterion)
 
         # 更新學習率
         scheduler.step()
@@ -404,13 +600,25 @@ def main():
         # 儲存最佳模型
         if val_acc > best_val_acc:
             best_val_acc = val_acc
-            torch.save({
+            atomic_save({
                 'model_state_dict': model.state_dict(),
                 'classes': classes,
                 'val_acc': val_acc,
             }, MODEL_SAVE_PATH)
             print(f"         >> 儲存最佳模型 (Val Acc: {val_acc:.2f}%)")
 
+        early_stopping.step(val_acc)
+
+        # 儲存完整訓練狀態
+        if epoch % CHECKPOINT_EVERY == 0 or epoch == epochs or early_stopping.should_stop:
+            save_training_state(
+                CHECKPOINT_PATH, model, optimizer, scheduler, epoch, history,
+                best_val_acc=best_val_acc, early_stopping=early_stopping.state_dict()
+            )
+
+        if early_stopping.should_stop:
+            print(f"         >> 驗證準確率已 {EARLY_STOP_PATIENCE} 個 epoch 沒有進步，提前結束訓練")
+
         print()
 
     print("-" * 50)
@@ -7,6 +7,14 @@
 2. 將硬幣對準畫面
 3. 按「擷取」按鈕或按空白鍵拍照
 4. 圖片會自動儲存到對應資料夾
+5. 需要大量資料時使用「連拍」(B 鍵)，每秒自動擷取 N 張
+6. 「自動裁切硬幣」: 偵測畫面中的硬幣，每枚硬幣各存一張裁切圖 (不含背景)
+7. 「略過重複畫面」: 與資料夾中既有圖片幾乎相同時不儲存
+
+架構:
+- 擷取執行緒 (FrameGrabber) 獨佔攝影機，只保留最新畫面
+- 寫入執行緒池 (ImageWriter) 在背景裁切、過濾重複、編碼並存檔，佇列滿時丟棄並計數
+- Tk 主執行緒只負責顯示，存檔不會卡住預覽畫面
 """
 
 import tkinter as tk
@@ -14,9 +22,13 @@ from tkinter import ttk, messagebox
 import cv2
 from PIL import Image, ImageTk
 import os
+import queue
+import time
 from datetime import datetime
 import threading
 
+from coin_crops import CoinCropper, DHashIndex, dhash
+
 # ============== 取得腳本所在目錄 ==============
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -31,22 +43,194 @@ CAMERA_HEIGHT = 480
 PREVIEW_WIDTH = 640
 PREVIEW_HEIGHT = 480
 
+# 存檔設定
+JPEG_QUALITY = 95
+WRITER_THREADS = 2       # 背景寫入執行緒數
+WRITE_QUEUE_SIZE = 64    # 寫入佇列長度 (滿了就丟棄新的畫面)
+
+# 連拍設定
+BURST_FPS = 5            # 預設每秒擷取張數
+BURST_MAX_FPS = 30
+
+# 資料清理
+AUTO_CROP = True         # 只儲存偵測到的硬幣區域
+SKIP_DUPLICATES = True   # 略過與既有圖片近似重複的畫面
+
+
+# ============== 擷取執行緒 ==============
+class FrameGrabber:
+    """
+    背景執行緒持續讀取攝影機，只保留最新一張畫面
+    讀取 (cap.read) 會阻塞到下一張畫面，不能放在 Tk 主執行緒
+    """
+
+    def __init__(self, camera_index=0, width=CAMERA_WIDTH, height=CAMERA_HEIGHT):
+        self.cap = cv2.VideoCapture(camera_index)
+        if self.cap.isOpened():
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        self._lock = threading.Lock()
+        self._frame = None
+        self.frame_id = 0        # 每讀到一張新畫面 +1
+        self._running = False
+        self._thread = None
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+
+            with self._lock:
+                self._frame = frame
+                self.frame_id += 1
+
+    def latest(self):
+        """回傳 (畫面編號, 最新畫面)，尚未讀到畫面時為 (0, None)"""
+        with self._lock:
+            return self.frame_id, self._frame
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self.cap.release()
+
+
+# ============== 寫入執行緒池 ==============
+class ImageWriter:
+    """
+    背景執行緒池: 硬幣裁切 + 重複過濾 + JPEG 編碼 + 寫檔
+    submit() 不會阻塞，佇列已滿時丟棄該畫面並計入 dropped
+    """
+
+    def __init__(self, num_threads=WRITER_THREADS, queue_size=WRITE_QUEUE_SIZE, quality=JPEG_QUALITY):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.quality = quality
+
+        self._lock = threading.Lock()
+        self.saved = {}          # 類別 -> 已儲存張數
+        self.dropped = 0
+        self.failed = 0
+        self.duplicates = 0      # 重複而略過的圖片數
+        self.no_coin = 0         # 自動裁切時沒偵測到硬幣的畫面數
+        self.last_saved = None
+
+        self.cropper = CoinCropper()
+        self.dedup_index = DHashIndex()
+
+        self._threads = [threading.Thread(target=self._worker, daemon=True)
+                         for _ in range(num_threads)]
+        for t in self._threads:
+            t.start()
+
+    @property
+    def pending(self):
+        """佇列中等待寫入的張數"""
+        return self.queue.qsize()
+
+    def submit(self, frame, save_dir, class_name, crop=AUTO_CROP, dedup=SKIP_DUPLICATES):
+        """加入寫入佇列，成功回傳 True，佇列已滿回傳 False"""
+        try:
+            self.queue.put_nowait((frame, save_dir, class_name, crop, dedup))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+
+            frame, save_dir, class_name, crop, dedup = job
+            try:
+                self._process(frame, save_dir, class_name, crop, dedup)
+            except Exception as e:
+                print(f"寫入失敗: {e}")
+                with self._lock:
+                    self.failed += 1
+
+    def _process(self, frame, save_dir, class_name, crop, dedup):
+        """裁切硬幣、略過重複後存檔"""
+        if crop:
+            images = self.cropper.crop(frame)
+            if not images:
+                with self._lock:
+                    self.no_coin += 1
+                return
+        else:
+            images = [frame]
+
+        for image in images:
+            if dedup and not self.dedup_index.add_if_new(save_dir, dhash(image)):
+                with self._lock:
+                    self.duplicates += 1
+                continue
+
+            filepath = self._save(image, save_dir)
+            with self._lock:
+                self.saved[class_name] = self.saved.get(class_name, 0) + 1
+                self.last_saved = filepath
+
+    def _save(self, frame, save_dir):
+        """編碼並寫檔 (imencode + 寫入二進位，Windows 中文路徑也能存)"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filepath = os.path.join(save_dir, f"coin_{timestamp}.jpg")
+
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise RuntimeError("JPEG 編碼失敗")
+
+        with open(filepath, "wb") as f:
+            f.write(buffer.tobytes())
+        return filepath
+
+    def close(self):
+        """等待佇列中的畫面寫完後結束"""
+        for _ in self._threads:
+            self.queue.put(None)
+        for t in self._threads:
+            t.join()
+
 
 class CaptureToolGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("硬幣資料蒐集工具")
-        self.root.geometry("900x600")
+        self.root.geometry("900x760")
         self.root.resizable(False, False)
 
         # 攝影機相關
-        self.cap = None
+        self.grabber = None
         self.is_running = False
         self.current_frame = None
+        self.current_frame_id = 0
 
-        # 計數器
+        # 背景寫入
+        self.writer = ImageWriter()
+
+        # 連拍
+        self.burst_active = False
+        self.burst_last_frame_id = 0
+
+        # 計數器 (開啟程式時資料夾內的張數，之後加上背景寫入的張數)
         self.heads_count = 0
         self.tails_count = 0
+        self.base_counts = {"heads": 0, "tails": 0}
+        self.writer_base = {}
 
         # 確保資料夾存在
         self._setup_directories()
@@ -59,6 +243,7 @@ class CaptureToolGUI:
 
         # 綁定鍵盤事件
         self.root.bind('<space>', self._on_space_press)
+        self.root.bind('<b>', lambda e: self._toggle_burst())
         self.root.bind('<Escape>', lambda e: self._on_closing())
 
         # 視窗關閉事件
@@ -146,6 +331,35 @@ class CaptureToolGUI:
         )
         self.btn_capture.pack(pady=10, ipadx=20, ipady=10)
 
+        # 連拍
+        burst_frame = ttk.Frame(right_frame)
+        burst_frame.pack(pady=5)
+
+        ttk.Label(burst_frame, text="連拍 張/秒:").pack(side=tk.LEFT)
+        self.burst_fps = tk.IntVar(value=BURST_FPS)
+        ttk.Spinbox(burst_frame, from_=1, to=BURST_MAX_FPS, width=4,
+                    textvariable=self.burst_fps).pack(side=tk.LEFT, padx=5)
+
+        self.btn_burst = ttk.Button(
+            right_frame,
+            text="開始連拍 (B)",
+            command=self._toggle_burst,
+            state=tk.DISABLED
+        )
+        self.btn_burst.pack(pady=5)
+
+        # 資料清理選項
+        self.auto_crop = tk.BooleanVar(value=AUTO_CROP)
+        ttk.Checkbutton(right_frame, text="自動裁切硬幣",
+                        variable=self.auto_crop).pack(anchor=tk.W)
+        self.skip_duplicates = tk.BooleanVar(value=SKIP_DUPLICATES)
+        ttk.Checkbutton(right_frame, text="略過重複畫面",
+                        variable=self.skip_duplicates).pack(anchor=tk.W)
+
+        # 寫入佇列狀態
+        self.lbl_writer = ttk.Label(right_frame, text="", font=("Arial", 9))
+        self.lbl_writer.pack(pady=5)
+
         # 分隔線
         ttk.Separator(right_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=15)
 
@@ -178,6 +392,7 @@ class CaptureToolGUI:
             "3. 對準硬幣後按空白鍵",
             "   或點擊「擷取照片」",
             "4. 圖片自動儲存",
+            "5. B 鍵開始/停止連拍",
         ]
         for inst in instructions:
             ttk.Label(right_frame, text=inst, font=("Arial", 9)).pack(anchor=tk.W)
@@ -196,33 +411,50 @@ class CaptureToolGUI:
             self.lbl_current.config(text="目前: 反面", foreground="blue")
 
     def _update_counts(self):
-        """更新計數顯示"""
+        """從資料夾重新計算圖片數量 (之後由 _refresh_stats 加上背景寫入的張數)"""
         # 計算各資料夾的圖片數量
-        self.heads_count = len([f for f in os.listdir(HEADS_DIR)
-                                if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))])
-        self.tails_count = len([f for f in os.listdir(TAILS_DIR)
-                                if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))])
+        self.base_counts["heads"] = len([f for f in os.listdir(HEADS_DIR)
+                                         if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))])
+        self.base_counts["tails"] = len([f for f in os.listdir(TAILS_DIR)
+                                         if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp'))])
+        self.writer_base = dict(self.writer.saved)
+
+        self._refresh_stats()
+
+    def _refresh_stats(self):
+        """更新計數與寫入佇列狀態 (不讀取資料夾)"""
+        saved = self.writer.saved
+        base = self.writer_base
+        self.heads_count = self.base_counts["heads"] + saved.get("heads", 0) - base.get("heads", 0)
+        self.tails_count = self.base_counts["tails"] + saved.get("tails", 0) - base.get("tails", 0)
 
         self.lbl_heads_count.config(text=str(self.heads_count))
         self.lbl_tails_count.config(text=str(self.tails_count))
         self.lbl_total_count.config(text=str(self.heads_count + self.tails_count))
 
+        self.lbl_writer.config(
+            text=f"寫入佇列: {self.writer.pending}/{WRITE_QUEUE_SIZE} | "
+                 f"丟棄: {self.writer.dropped} | 失敗: {self.writer.failed}\n"
+                 f"重複略過: {self.writer.duplicates} | 無硬幣: {self.writer.no_coin}"
+        )
+
     def _start_camera(self):
         """開啟攝影機"""
-        self.cap = cv2.VideoCapture(0)
+        self.grabber = FrameGrabber(0)
 
-        if not self.cap.isOpened():
+        if not self.grabber.is_opened():
+            self.grabber.stop()
+            self.grabber = None
             messagebox.showerror("錯誤", "無法開啟攝影機\n請確認攝影機已連接")
             return
 
-        # 設定攝影機解析度
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+        self.grabber.start()
 
         self.is_running = True
         self.btn_start.config(state=tk.DISABLED)
         self.btn_stop.config(state=tk.NORMAL)
         self.btn_capture.config(state=tk.NORMAL)
+        self.btn_burst.config(state=tk.NORMAL)
 
         self.status_var.set("攝影機已開啟 - 選擇類別後按空白鍵擷取")
 
@@ -232,14 +464,17 @@ class CaptureToolGUI:
     def _stop_camera(self):
         """關閉攝影機"""
         self.is_running = False
+        self._stop_burst()
 
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
+        self.current_frame = None
 
         self.btn_start.config(state=tk.NORMAL)
         self.btn_stop.config(state=tk.DISABLED)
         self.btn_capture.config(state=tk.DISABLED)
+        self.btn_burst.config(state=tk.DISABLED)
 
         # 清空畫面
         self.canvas.delete("all")
@@ -255,11 +490,13 @@ class CaptureToolGUI:
         if not self.is_running:
             return
 
-        ret, frame = self.cap.read()
+        frame_id, frame = self.grabber.latest()
 
-        if ret:
+        # 只有新畫面才需要重新繪製 (擷取執行緒不會修改已交出的畫面)
+        if frame is not None and frame_id != self.current_frame_id:
             # 儲存原始畫面用於擷取
-            self.current_frame = frame.copy()
+            self.current_frame = frame
+            self.current_frame_id = frame_id
 
             # 水平翻轉 (鏡像)
             frame = cv2.flip(frame, 1)
@@ -281,46 +518,74 @@ class CaptureToolGUI:
             img = Image.fromarray(frame_rgb)
 
             # 調整大小
-            img = img.resize((PREVIEW_WIDTH, PREVIEW_HEIGHT), Image.Resampling.LANCZOS)
+            if img.size != (PREVIEW_WIDTH, PREVIEW_HEIGHT):
+                img = img.resize((PREVIEW_WIDTH, PREVIEW_HEIGHT), Image.Resampling.BILINEAR)
 
             self.photo = ImageTk.PhotoImage(image=img)
+            self.canvas.delete("all")
             self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
 
+        self._refresh_stats()
+
         # 繼續更新
         if self.is_running:
             self.root.after(30, self._update_frame)
 
+    def _submit_frame(self, frame):
+        """將畫面交給背景寫入，回傳是否成功加入佇列"""
+        selected = self.selected_class.get()
+        save_dir = HEADS_DIR if selected == "heads" else TAILS_DIR
+        return self.writer.submit(frame, save_dir, selected,
+                                  self.auto_crop.get(), self.skip_duplicates.get())
+
     def _capture_image(self):
-        """擷取並儲存圖片"""
+        """擷取圖片 (交給背景執行緒儲存，不會卡住畫面)"""
         if self.current_frame is None:
             messagebox.showwarning("警告", "沒有可用的畫面")
             return
 
-        # 決定儲存路徑
-        selected = self.selected_class.get()
-        if selected == "heads":
-            save_dir = HEADS_DIR
-            class_name = "正面"
-        else:
-            save_dir = TAILS_DIR
-            class_name = "反面"
+        class_name = "正面" if self.selected_class.get() == "heads" else "反面"
 
-        # 產生檔名 (時間戳記)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        filename = f"coin_{timestamp}.jpg"
-        filepath = os.path.join(save_dir, filename)
+        if self._submit_frame(self.current_frame):
+            self.status_var.set(f"已擷取: {class_name} (背景儲存中)")
+            # 視覺回饋 (閃爍效果)
+            self._flash_feedback()
+        else:
+            self.status_var.set("寫入佇列已滿，此張已丟棄")
+
+    def _toggle_burst(self):
+        """開始/停止連拍"""
+        if self.burst_active:
+            self._stop_burst()
+        elif self.is_running:
+            self.burst_active = True
+            self.burst_last_frame_id = 0
+            self.btn_burst.config(text="停止連拍 (B)")
+            self.status_var.set("連拍中...")
+            self._burst_tick()
+
+    def _stop_burst(self):
+        if not self.burst_active:
+            return
+        self.burst_active = False
+        self.btn_burst.config(text="開始連拍 (B)")
+        self.status_var.set("連拍已停止")
 
-        # 儲存圖片
-        cv2.imwrite(filepath, self.current_frame)
+    def _burst_tick(self):
+        """連拍: 依設定的張數/秒擷取最新畫面 (同一張畫面不重複儲存)"""
+        if not self.burst_active or not self.is_running:
+            return
 
-        # 更新計數
-        self._update_counts()
+        try:
+            fps = min(max(int(self.burst_fps.get()), 1), BURST_MAX_FPS)
+        except (tk.TclError, ValueError):
+            fps = BURST_FPS
 
-        # 更新狀態
-        self.status_var.set(f"已儲存: {class_name} - {filename}")
+        if self.current_frame is not None and self.current_frame_id != self.burst_last_frame_id:
+            self._submit_frame(self.current_frame)
+            self.burst_last_frame_id = self.current_frame_id
 
-        # 視覺回饋 (閃爍效果)
-        self._flash_feedback()
+        self.root.after(int(1000 / fps), self._burst_tick)
 
     def _flash_feedback(self):
         """擷取時的視覺回饋"""
@@ -336,9 +601,15 @@ class CaptureToolGUI:
     def _on_closing(self):
         """視窗關閉事件"""
         self.is_running = False
+        self.burst_active = False
+
+        if self.grabber is not None:
+            self.grabber.stop()
 
-        if self.cap is not None:
-            self.cap.release()
+        # 等待佇列中的圖片寫完
+        if self.writer.pending:
+            print(f"等待 {self.writer.pending} 張圖片寫入...")
+        self.writer.close()
 
         self.root.destroy()
 
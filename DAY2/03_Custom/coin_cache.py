@@ -0,0 +1,279 @@
+"""
+硬幣資料集快取 - 預先解碼與打包
+將資料集圖片一次性解碼並縮放，存成 memory-mapped uint8 陣列 (.npy) 與標籤索引 (.json)
+訓練時直接從快取讀取，不必每個 epoch 重新解碼 JPEG/PNG
+
+快取結構:
+dataset_cache/
+├── coin_256.npy          # (N, 256, 256, 3) uint8 RGB 影像
+├── coin_256.json         # 標籤索引 (路徑、類別、修改時間)
+└── decode_failures.json  # 解碼失敗報告 (有失敗時才產生)
+
+使用方式:
+python train_coin.py --pack   # 只建立快取
+python train_coin.py          # 訓練 (快取不存在或過期時會自動建立)
+"""
+
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import Dataset
+from tqdm import tqdm
+
+from image_decoders import DecodeError, decode_image
+
+# ImageNet 正規化參數 (與 torchvision transforms 相同)
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+# ============== 快取路徑 ==============
+def get_cache_paths(cache_dir, pack_size):
+    """取得影像陣列與索引檔路徑"""
+    base = os.path.join(cache_dir, f"coin_{pack_size}")
+    return base + ".npy", base + ".json"
+
+
+def get_failure_report_path(cache_dir):
+    return os.path.join(cache_dir, "decode_failures.json")
+
+
+def _file_signature(filepath):
+    """檔案簽章 (修改時間 + 大小)，用來判斷快取是否過期"""
+    stat = os.stat(filepath)
+    return [int(stat.st_mtime), stat.st_size]
+
+
+def is_cache_fresh(samples, cache_dir, pack_size):
+    """檢查快取是否存在且與目前資料集一致"""
+    images_path, index_path = get_cache_paths(cache_dir, pack_size)
+    if not (os.path.exists(images_path) and os.path.exists(index_path)):
+        return False
+
+    with open(index_path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+
+    # 解碼失敗的檔案也記錄在索引中，檔案沒變就不必重新嘗試
+    cached = {(e["path"], e["label"]): e["signature"]
+              for e in index["samples"] + index.get("failures", [])}
+    if len(cached) != len(samples):
+        return False
+
+    for filepath, label in samples:
+        signature = cached.get((os.path.abspath(filepath), label))
+        if signature is None or signature != _file_signature(filepath):
+            return False
+
+    return True
+
+
+# ============== 打包 ==============
+def _decode_and_resize(filepath, pack_size):
+    """(子程序) 解碼並縮放單張圖片，失敗時回傳錯誤訊息"""
+    try:
+        image = decode_image(filepath)
+    except DecodeError as e:
+        return None, str(e)
+
+    image = image.resize((pack_size, pack_size), Image.Resampling.BILINEAR)
+    return np.asarray(image, dtype=np.uint8), None
+
+
+def pack_samples(samples, class_names, cache_dir, pack_size, num_workers=1):
+    """
+    將 (路徑, 標籤) 列表解碼、縮放成 pack_size x pack_size 後寫入快取
+
+    - num_workers > 1 時以多個程序平行解碼 (HEIC 等格式解碼很耗 CPU)
+    - 解碼失敗的檔案不會中斷打包，會寫入 decode_failures.json
+    - 先寫入暫存檔再改名，中途中斷不會留下損壞的快取
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    images_path, index_path = get_cache_paths(cache_dir, pack_size)
+    tmp_images_path = images_path + ".tmp.npy"
+
+    images = np.lib.format.open_memmap(
+        tmp_images_path, mode="w+", dtype=np.uint8,
+        shape=(len(samples), pack_size, pack_size, 3)
+    )
+
+    paths = [filepath for filepath, _ in samples]
+    if num_workers > 1 and len(samples) > 1:
+        executor = ProcessPoolExecutor(max_workers=num_workers)
+        chunksize = max(1, len(samples) // (num_workers * 8))
+        results = executor.map(_decode_and_resize, paths,
+                               [pack_size] * len(paths), chunksize=chunksize)
+    else:
+        executor = None
+        results = (_decode_and_resize(p, pack_size) for p in paths)
+
+    entries, failures = [], []
+    try:
+        for (filepath, label), (array, error) in tqdm(
+                zip(samples, results), total=len(samples), desc="打包資料集"):
+            entry = {
+                "path": os.path.abspath(filepath),
+                "label": label,
+                "signature": _file_signature(filepath),
+            }
+            if error is not None:
+                entry["error"] = error
+                failures.append(entry)
+                continue
+
+            images[len(entries)] = array
+            entries.append(entry)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # 失敗的檔案不佔位置，陣列尾端多出的列不會被讀取
+    images.flush()
+    del images
+    os.replace(tmp_images_path, images_path)
+
+    index = {
+        "class_names": class_names,
+        "pack_size": pack_size,
+        "samples": entries,
+        "failures": failures,
+    }
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+    print(f"快取已建立: {images_path} ({len(entries)} 張)")
+    write_failure_report(failures, cache_dir)
+
+    return images_path, index_path
+
+
+def write_failure_report(failures, cache_dir):
+    """輸出解碼失敗報告"""
+    report_path = get_failure_report_path(cache_dir)
+
+    if not failures:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+        return
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(failures, f, ensure_ascii=False, indent=2)
+
+    print(f"警告: {len(failures)} 張圖片解碼失敗，詳見 {report_path}")
+    for entry in failures[:5]:
+        print(f"  {entry['error']}")
+    if len(failures) > 5:
+        print(f"  ... 其餘 {len(failures) - 5} 筆")
+
+
+# ============== 快取資料集 ==============
+class PackedCoinDataset(Dataset):
+    """
+    從 memory-mapped 快取讀取的硬幣資料集
+    回傳 (3, H, W) uint8 tensor，資料增強交給 BatchAugment 在整個 batch 上執行
+    """
+
+    def __init__(self, cache_dir, pack_size):
+        self.images_path, index_path = get_cache_paths(cache_dir, pack_size)
+
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+
+        self.class_names = index["class_names"]
+        self.samples = [(e["path"], e["label"]) for e in index["samples"]]
+        self.targets = [label for _, label in self.samples]
+
+        # memmap 在每個 worker 中各自開啟 (避免 pickle 時複製整個陣列)
+        self._images = None
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, idx):
+        if self._images is None:
+            self._images = np.load(self.images_path, mmap_mode="r")
+
+        image = torch.from_numpy(np.ascontiguousarray(self._images[idx]))
+        return image.permute(2, 0, 1), self.targets[idx]
+
+
+# ============== 批次資料增強 ==============
+class BatchAugment:
+    """
+    在裝置 (GPU 或 CPU) 上對整個 uint8 batch 做資料增強與正規化
+
+    訓練: 隨機裁切 + 水平/垂直翻轉 + 旋轉 (合併成單次 affine 取樣) + 色彩抖動
+    驗證: 只縮放到 image_size
+    """
+
+    def __init__(self, image_size, device, train=True, rotation=30,
+                 brightness=0.3, contrast=0.3, saturation=0.3):
+        self.image_size = image_size
+        self.device = device
+        self.train = train
+        self.rotation = math.radians(rotation)
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+
+        self.mean = torch.tensor(IMAGENET_MEAN, device=device).view(1, 3, 1, 1)
+        self.std = torch.tensor(IMAGENET_STD, device=device).view(1, 3, 1, 1)
+        self.gray_weights = torch.tensor([0.299, 0.587, 0.114], device=device).view(1, 3, 1, 1)
+
+    def __call__(self, batch):
+        x = batch.to(self.device, non_blocking=True).float().div_(255.0)
+
+        if self.train:
+            x = self._random_affine(x)
+            x = self._color_jitter(x)
+        elif x.shape[-1] != self.image_size or x.shape[-2] != self.image_size:
+            x = F.interpolate(x, size=(self.image_size, self.image_size),
+                              mode="bilinear", align_corners=False, antialias=True)
+
+        return (x - self.mean) / self.std
+
+    def _uniform(self, n, low, high):
+        return torch.empty(n, device=self.device).uniform_(low, high)
+
+    def _random_affine(self, x):
+        """隨機裁切、翻轉、旋轉，一次 grid_sample 完成"""
+        n = x.size(0)
+        scale = self.image_size / x.shape[-1]      # 裁切範圍 (相對於快取影像)
+        max_shift = 1.0 - scale
+
+        angle = self._uniform(n, -self.rotation, self.rotation)
+        tx = self._uniform(n, -max_shift, max_shift)
+        ty = self._uniform(n, -max_shift, max_shift)
+        flip_x = torch.where(torch.rand(n, device=self.device) < 0.5, -1.0, 1.0)
+        flip_y = torch.where(torch.rand(n, device=self.device) < 0.5, -1.0, 1.0)
+
+        cos, sin = torch.cos(angle) * scale, torch.sin(angle) * scale
+        theta = torch.stack([
+            torch.stack([cos * flip_x, -sin * flip_y, tx], dim=1),
+            torch.stack([sin * flip_x, cos * flip_y, ty], dim=1),
+        ], dim=1)
+
+        grid = F.affine_grid(theta, (n, 3, self.image_size, self.image_size), align_corners=False)
+        return F.grid_sample(x, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+    def _color_jitter(self, x):
+        """亮度、對比、飽和度抖動 (每張圖各自的隨機係數)"""
+        n = x.size(0)
+
+        brightness = self._uniform(n, 1 - self.brightness, 1 + self.brightness).view(n, 1, 1, 1)
+        x = x * brightness
+
+        contrast = self._uniform(n, 1 - self.contrast, 1 + self.contrast).view(n, 1, 1, 1)
+        gray_mean = (x * self.gray_weights).sum(dim=1, keepdim=True).mean(dim=(2, 3), keepdim=True)
+        x = (x - gray_mean) * contrast + gray_mean
+
+        saturation = self._uniform(n, 1 - self.saturation, 1 + self.saturation).view(n, 1, 1, 1)
+        gray = (x * self.gray_weights).sum(dim=1, keepdim=True)
+        x = (x - gray) * saturation + gray
+
+        return x.clamp_(0.0, 1.0)
@@ -0,0 +1,124 @@
+"""
+資料蒐集用的硬幣裁切與重複畫面過濾
+- CoinCropper: 使用 OCS 系統的 ImageProcessor 偵測硬幣，裁出每枚硬幣的正方形區域
+- DHashIndex: 以感知雜湊 (dHash) 判斷近似重複的圖片 (連拍時相鄰畫面幾乎相同)
+
+使用方式 (capture_tool.py 的背景寫入執行緒):
+cropper = CoinCropper()
+index = DHashIndex()
+for crop in cropper.crop(frame):
+    if index.add_if_new(save_dir, dhash(crop)):
+        cv2.imwrite(...)
+"""
+
+import os
+import sys
+import threading
+
+import cv2
+import numpy as np
+
+# OCS 硬幣辨識系統 (專案根目錄的 ocs_system/)
+OCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ocs_system")
+sys.path.append(OCS_DIR)
+
+from core.image_processor import ImageProcessor
+
+# ============== 設定區 ==============
+CROP_PADDING = 1.15      # 裁切範圍 = 半徑 x 此係數 (保留一點邊緣)
+MIN_CROP_SIZE = 48       # 太小的裁切 (誤偵測) 不儲存
+DEDUP_DISTANCE = 5       # dHash 漢明距離 <= 此值視為重複 (64 位元)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+# ============== 硬幣裁切 ==============
+class CoinCropper:
+    """偵測畫面中的硬幣並裁出正方形區域"""
+
+    def __init__(self, padding=CROP_PADDING, min_size=MIN_CROP_SIZE):
+        self.processor = ImageProcessor()
+        self.padding = padding
+        self.min_size = min_size
+
+    def detect(self, frame):
+        """回傳硬幣列表 [{x, y, radius}, ...]"""
+        return self.processor.detect_coins_hybrid(frame)
+
+    def crop(self, frame):
+        """回傳每枚硬幣的裁切影像 (被畫面邊緣截斷的硬幣會略過)"""
+        crops = []
+        for coin in self.detect(frame):
+            roi = self.processor.extract_coin_roi(
+                frame, coin['x'], coin['y'], coin['radius'], self.padding
+            )
+            h, w = roi.shape[:2]
+
+            # extract_coin_roi 在畫面邊緣會截斷，非正方形代表硬幣不完整
+            if min(h, w) < self.min_size or abs(h - w) > 2:
+                continue
+
+            crops.append(roi.copy())
+
+        return crops
+
+
+# ============== 感知雜湊 ==============
+def dhash(image, hash_size=8):
+    """
+    差異雜湊 (difference hash): 縮成 (hash_size+1) x hash_size 灰階，比較左右相鄰像素
+    回傳 64 位元整數，相似圖片的漢明距離很小
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distances(hashes, value):
+    """hashes (uint64 陣列) 與 value 的漢明距離"""
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class DHashIndex:
+    """
+    每個資料夾各自的 dHash 索引，執行緒安全
+    第一次用到某資料夾時，會先計算資料夾內既有圖片的雜湊
+    """
+
+    def __init__(self, max_distance=DEDUP_DISTANCE):
+        self.max_distance = max_distance
+        self._hashes = {}        # 資料夾 -> uint64 陣列
+        self._lock = threading.Lock()
+
+    def _load_dir(self, directory):
+        """計算資料夾內既有圖片的雜湊 (以 1/8 大小解碼，速度很快)"""
+        hashes = []
+        for filename in os.listdir(directory):
+            if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+
+            path = os.path.join(directory, filename)
+            data = np.fromfile(path, dtype=np.uint8)
+            image = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+            if image is not None:
+                hashes.append(dhash(image))
+
+        return np.array(hashes, dtype=np.uint64)
+
+    def add_if_new(self, directory, value):
+        """不與既有圖片重複時加入索引並回傳 True，重複時回傳 False"""
+        with self._lock:
+            hashes = self._hashes.get(directory)
+            if hashes is None:
+                hashes = self._load_dir(directory)
+
+            if len(hashes) and hamming_distances(hashes, value).min() <= self.max_distance:
+                self._hashes[directory] = hashes
+                return False
+
+            self._hashes[directory] = np.append(hashes, np.uint64(value))
+            return True
@@ -0,0 +1,80 @@
+"""
+影像解碼器
+依副檔名選擇解碼方式，回傳 RGB 的 PIL Image
+可透過 register_decoder() 加入新格式
+
+HEIC/HEIF (手機直接拍攝的照片) 需要額外安裝:
+pip install pillow-heif
+"""
+
+import os
+
+from PIL import Image, ImageOps
+
+# 副檔名 -> 解碼函數
+DECODERS = {}
+
+# 已知但目前無法解碼的格式 -> 原因 (用於回報，而不是默默略過)
+UNAVAILABLE_FORMATS = {}
+
+
+class DecodeError(Exception):
+    """影像解碼失敗"""
+
+
+def register_decoder(extensions, decoder):
+    """註冊解碼函數 decoder(filepath) -> PIL.Image (RGB)"""
+    for ext in extensions:
+        ext = ext.lower()
+        DECODERS[ext] = decoder
+        UNAVAILABLE_FORMATS.pop(ext, None)
+
+
+def decode_pil(filepath):
+    """使用 PIL 解碼，並依 EXIF 方向資訊轉正 (手機照片常見)"""
+    with Image.open(filepath) as image:
+        image = ImageOps.exif_transpose(image)
+        return image.convert('RGB')
+
+
+register_decoder(('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'), decode_pil)
+
+# HEIC/HEIF: 有安裝 pillow-heif 時註冊為 PIL 外掛
+try:
+    import pillow_heif
+    pillow_heif.register_heif_opener()
+    register_decoder(('.heic', '.heif'), decode_pil)
+except ImportError:
+    for _ext in ('.heic', '.heif'):
+        UNAVAILABLE_FORMATS[_ext] = "需要安裝 pillow-heif (pip install pillow-heif)"
+
+
+def get_extension(filepath):
+    return os.path.splitext(filepath)[1].lower()
+
+
+def is_supported(filepath):
+    """是否有可用的解碼器"""
+    return get_extension(filepath) in DECODERS
+
+
+def unavailable_reason(filepath):
+    """已知影像格式但缺少解碼器時回傳原因，否則回傳 None"""
+    return UNAVAILABLE_FORMATS.get(get_extension(filepath))
+
+
+def supported_extensions():
+    return tuple(sorted(DECODERS))
+
+
+def decode_image(filepath):
+    """解碼影像為 RGB PIL Image，失敗時拋出 DecodeError"""
+    decoder = DECODERS.get(get_extension(filepath))
+    if decoder is None:
+        reason = unavailable_reason(filepath) or "不支援的格式"
+        raise DecodeError(f"{filepath}: {reason}")
+
+    try:
+        return decoder(filepath)
+    except Exception as e:
+        raise DecodeError(f"{filepath}: {e}") from e
@@ -5,6 +5,10 @@
 使用方式:
 python predict_coin.py --image path/to/coin.jpg
 python predict_coin.py --folder path/to/images/
+python predict_coin.py --folder path/to/images/ --csv results.csv --batch-size 64
+python predict_coin.py --folder path/to/images/ --benchmark
+python predict_coin.py --folder path/to/images/ --backend onnxruntime   # 使用 export_onnx.py 匯出的模型
+python predict_coin.py --image coin.jpg --model ../models/coin_classifier_int8.pth  # quantize_coin.py 的 int8 模型
 """
 
 import torch
@@ -13,7 +17,18 @@ from torchvision import transforms
 from PIL import Image
 import matplotlib.pyplot as plt
 import argparse
+import csv
 import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from image_decoders import DecodeError, decode_image, is_supported
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
 
 # ============== 取得腳本所在目錄 ==============
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -22,6 +37,19 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 IMAGE_SIZE = 224
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 MODEL_PATH = os.path.join(SCRIPT_DIR, "..", "models", "coin_classifier.pth")
+CSV_PATH = os.path.join(SCRIPT_DIR, "predictions.csv")
+
+# 推論後端: "torch" (.pth) / "onnxruntime" / "opencv" (後兩者使用 ../export_onnx.py 匯出的 .onnx)
+BACKEND = "torch"
+BACKENDS = ("torch", "onnxruntime", "opencv")
+
+# int8 量化引擎 (x86 CPU 用 "x86"，ARM 用 "qnnpack")，需與 quantize_coin.py 相同
+QUANT_BACKEND = "x86"
+
+# 批次預測設定
+BATCH_SIZE = 64          # 每次送進模型的影像數
+NUM_LOADER_WORKERS = 4   # 解碼 + 預處理的執行緒數
+PREFETCH_BATCHES = 4     # 預先準備好的批次數 (佇列長度)
 
 
 # ============== 模型定義 (與訓練相同) ==============
@@ -82,26 +110,88 @@ def get_transform(image_size=IMAGE_SIZE):
 
 
 def preprocess_image(image_path, transform):
-    """預處理輸入影像"""
-    image = Image.open(image_path).convert('RGB')
+    """預處理輸入影像 (與訓練相同的解碼方式，含 EXIF 方向修正)"""
+    image = decode_image(image_path)
     image_tensor = transform(image)
     image_tensor = image_tensor.unsqueeze(0)
     return image_tensor
 
 
 # ============== 載入模型 ==============
-def load_model(model_path):
+class CPUModel:
+    """只能在 CPU 執行的模型 (ONNX、int8 量化)，輸入自動移到 CPU，呼叫方式與 PyTorch 模型相同"""
+
+    def __init__(self, forward):
+        self.forward = forward
+
+    def __call__(self, x):
+        return self.forward(x.cpu())
+
+    def eval(self):
+        return self
+
+
+def prepare_for_quantization(model, image_size, quant_backend=QUANT_BACKEND):
+    """
+    插入觀察器 (FX 模式，Conv + BN + ReLU 會自動融合)
+    校正後以 convert_fx() 轉為 int8 模型
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx
+
+    torch.backends.quantized.engine = quant_backend
+    example_inputs = (torch.randn(1, 3, image_size, image_size),)
+    return prepare_fx(model.cpu().eval(), get_default_qconfig_mapping(quant_backend), example_inputs)
+
+
+def build_quantized_model(num_classes, image_size, quant_backend=QUANT_BACKEND):
+    """建立 int8 量化模型的骨架，用來載入 quantize_coin.py 儲存的權重"""
+    from torch.ao.quantization.quantize_fx import convert_fx
+
+    prepared = prepare_for_quantization(CoinCNN(num_classes=num_classes), image_size, quant_backend)
+    return convert_fx(prepared)
+
+
+def load_onnx_model(model_path, backend):
+    """載入 ONNX 模型 (model_path 為 .pth 時改用同名的 .onnx)"""
+    from onnx_backend import OnnxClassifier
+
+    onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+    classifier = OnnxClassifier(onnx_path, backend=backend)
+
+    print(f"模型已從 {onnx_path} 載入 ({classifier.backend})")
+    print(f"類別: {classifier.class_names}")
+
+    model = CPUModel(lambda x: torch.from_numpy(classifier.run(x.numpy())))
+    return model, classifier.class_names, classifier.image_size
+
+
+def load_model(model_path, backend=BACKEND):
     """載入訓練好的模型"""
+    if backend != "torch":
+        return load_onnx_model(model_path, backend)
+
     if not os.path.exists(model_path):
         raise FileNotFoundError(
             f"找不到模型檔案: {model_path}\n"
             "請先執行 train_coin.py 訓練模型"
         )
 
-    checkpoint = torch.load(model_path, map_location=DEVICE, weights_only=False)
+    checkpoint = torch.load(model_path, map_location="cpu", weights_only=False)
     class_names = checkpoint['class_names']
     image_size = checkpoint.get('image_size', IMAGE_SIZE)
 
+    if checkpoint.get('quantized', False):
+        # quantize_coin.py 產生的 int8 模型 (只能在 CPU 執行)
+        quantized = build_quantized_model(
+            len(class_names), image_size, checkpoint.get('quant_backend', QUANT_BACKEND)
+        )
+        quantized.load_state_dict(checkpoint['model_state_dict'])
+        model = CPUModel(quantized)
+        print(f"模型已從 {model_path} 載入 (int8 量化)")
+        print(f"類別: {class_names}")
+        return model, class_names, image_size
+
     model = CoinCNN(num_classes=len(class_names)).to(DEVICE)
     model.load_state_dict(checkpoint['model_state_dict'])
     model.eval()
@@ -168,8 +258,8 @@ def visualize_prediction(image_path, predicted_class, confidence, probs, class_n
 
 
 # ============== 批次預測 ==============
-def predict_batch(model, image_paths, class_names, transform):
-    """批次預測多張影像"""
+def predict_one_by_one(model, image_paths, class_names, transform):
+    """逐張預測多張影像 (舊版做法，保留作為效能比較基準)"""
     results = []
 
     for path in image_paths:
@@ -188,6 +278,186 @@ def predict_batch(model, image_paths, class_names, transform):
     return results
 
 
+def _load_and_transform(path, transform):
+    """(載入執行緒) 解碼並預處理單張影像，失敗時回傳錯誤訊息"""
+    try:
+        return transform(decode_image(path)), None
+    except DecodeError as e:
+        return None, str(e)
+
+
+def _batch_producer(image_paths, transform, batch_size, num_workers, batch_queue, stop_event):
+    """
+    (背景執行緒) 以執行緒池平行解碼，組成固定大小的批次放入佇列
+    佇列滿時會阻塞，避免載入速度遠超過推論時佔用大量記憶體
+    """
+    # 同時進行中的解碼工作數上限 (executor.map 會一次送出全部工作，圖片多時記憶體會爆)
+    max_pending = max(batch_size, num_workers * 2)
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            pending = deque()
+            path_iter = iter(image_paths)
+
+            def submit_next():
+                path = next(path_iter, None)
+                if path is not None:
+                    pending.append((path, executor.submit(_load_and_transform, path, transform)))
+
+            for _ in range(max_pending):
+                submit_next()
+
+            paths, tensors, failures = [], [], []
+            while pending:
+                if stop_event.is_set():
+                    for _, future in pending:
+                        future.cancel()
+                    return
+
+                # 依輸入順序取出結果，同時補上一個新工作
+                path, future = pending.popleft()
+                tensor, error = future.result()
+                submit_next()
+
+                if error is not None:
+                    failures.append((path, error))
+                    continue
+
+                paths.append(path)
+                tensors.append(tensor)
+                if len(tensors) == batch_size:
+                    batch_queue.put((paths, torch.stack(tensors), failures))
+                    paths, tensors, failures = [], [], []
+
+            if tensors or failures:
+                batch_queue.put((paths, torch.stack(tensors) if tensors else None, failures))
+    except Exception as e:
+        batch_queue.put(e)
+    finally:
+        batch_queue.put(None)
+
+
+def iter_batches(image_paths, transform, batch_size=BATCH_SIZE,
+                 num_workers=NUM_LOADER_WORKERS, prefetch=PREFETCH_BATCHES):
+    """
+    產生 (路徑列表, 影像 batch, 失敗列表)
+    解碼與預處理在背景執行緒進行，推論時下一批已經在準備中
+    """
+    batch_queue = queue.Queue(maxsize=prefetch)
+    stop_event = threading.Event()
+    producer = threading.Thread(
+        target=_batch_producer,
+        args=(image_paths, transform, batch_size, num_workers, batch_queue, stop_event),
+        daemon=True
+    )
+    producer.start()
+
+    try:
+        while True:
+            item = batch_queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # 提前中斷時 (例如 Ctrl+C) 通知背景執行緒結束
+        stop_event.set()
+        while producer.is_alive():
+            try:
+                batch_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def predict_batch(model, image_paths, class_names, transform, batch_size=BATCH_SIZE,
+                  num_workers=NUM_LOADER_WORKERS, csv_path=None):
+    """
+    批次預測多張影像
+
+    - 背景執行緒平行解碼 + 預處理，放入預取佇列
+    - 每次以 batch_size 張送進模型 (inference_mode)
+    - csv_path 不為 None 時，每個批次的結果立即寫入 CSV
+
+    Returns:
+        results: [{'path', 'prediction', 'confidence'}, ...]
+    """
+    results = []
+    csv_file = None
+    writer = None
+
+    if csv_path:
+        csv_file = open(csv_path, "w", newline="", encoding="utf-8")
+        writer = csv.writer(csv_file)
+        writer.writerow(["path", "prediction", "confidence", "error"])
+
+    try:
+        for paths, images, failures in iter_batches(image_paths, transform, batch_size, num_workers):
+            for path, error in failures:
+                print(f"警告: {error}, 跳過")
+                if writer:
+                    writer.writerow([path, "", "", error])
+
+            if images is None:
+                continue
+
+            with torch.inference_mode():
+                output = model(images.to(DEVICE, non_blocking=True))
+                probabilities = torch.softmax(output, dim=1)
+                confidences, predicted = torch.max(probabilities, 1)
+
+            for path, idx, conf in zip(paths, predicted.tolist(), confidences.tolist()):
+                result = {
+                    'path': path,
+                    'prediction': class_names[idx],
+                    'confidence': conf
+                }
+                results.append(result)
+                if writer:
+                    writer.writerow([path, result['prediction'], f"{conf:.6f}", ""])
+
+            if csv_file:
+                csv_file.flush()
+    finally:
+        if csv_file:
+            csv_file.close()
+
+    return results
+
+
+def benchmark_folder(model, image_paths, class_names, transform, batch_size, num_workers):
+    """比較逐張預測與批次預測的速度，並確認兩者結果一致"""
+    print(f"[效能比較] {len(image_paths)} 張圖片")
+    print("-" * 50)
+
+    # 暖機 (第一次前向傳播較慢)
+    predict_batch(model, image_paths[:batch_size], class_names, transform, batch_size, num_workers)
+
+    start = time.perf_counter()
+    serial_results = predict_one_by_one(model, image_paths, class_names, transform)
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_results = predict_batch(model, image_paths, class_names, transform,
+                                  batch_size, num_workers)
+    batch_time = time.perf_counter() - start
+
+    serial_speed = len(serial_results) / serial_time if serial_time > 0 else 0
+    batch_speed = len(batch_results) / batch_time if batch_time > 0 else 0
+
+    print(f"逐張預測:   {serial_time:7.2f} 秒 ({serial_speed:7.1f} 張/秒)")
+    print(f"批次預測:   {batch_time:7.2f} 秒 ({batch_speed:7.1f} 張/秒) "
+          f"[batch={batch_size}, workers={num_workers}]")
+    if batch_time > 0:
+        print(f"加速:       {serial_time / batch_time:.2f}x")
+
+    serial_predictions = {r['path']: r['prediction'] for r in serial_results}
+    mismatches = sum(1 for r in batch_results
+                     if serial_predictions.get(r['path']) != r['prediction'])
+    print(f"預測不一致: {mismatches} 張")
+    print("-" * 50)
+
+
 # ============== 主程式 ==============
 def main():
     parser = argparse.ArgumentParser(description='硬幣正反面分類器預測')
@@ -197,6 +467,16 @@ def main():
                         help='批次預測資料夾路徑')
     parser.add_argument('--model', '-m', type=str, default=MODEL_PATH,
                         help='模型檔案路徑')
+    parser.add_argument('--csv', type=str, default=CSV_PATH,
+                        help='批次預測結果 CSV 路徑')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='批次預測的批次大小')
+    parser.add_argument('--workers', type=int, default=NUM_LOADER_WORKERS,
+                        help='解碼 + 預處理的執行緒數')
+    parser.add_argument('--backend', type=str, default=BACKEND, choices=BACKENDS,
+                        help='推論後端 (onnxruntime / opencv 需先執行 ../export_onnx.py)')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='比較逐張預測與批次預測的速度 (需搭配 --folder)')
 
     args = parser.parse_args()
 
@@ -214,8 +494,8 @@ def main():
     # 載入模型
     print("[1] 載入模型...")
     try:
-        model, class_names, image_size = load_model(args.model)
-    except FileNotFoundError as e:
+        model, class_names, image_size = load_model(args.model, args.backend)
+    except (FileNotFoundError, ImportError) as e:
         print(f"錯誤: {e}")
         return
     print()
@@ -254,11 +534,10 @@ def main():
             return
 
         # 找出所有圖片
-        image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
         image_paths = [
             os.path.join(args.folder, f)
-            for f in os.listdir(args.folder)
-            if f.lower().endswith(image_extensions)
+            for f in sorted(os.listdir(args.folder))
+            if is_supported(f)
         ]
 
         if not image_paths:
@@ -268,7 +547,15 @@ def main():
         print(f"找到 {len(image_paths)} 張圖片")
         print()
 
-        results = predict_batch(model, image_paths, class_names, transform)
+        if args.benchmark:
+            benchmark_folder(model, image_paths, class_names, transform,
+                             args.batch_size, args.workers)
+            return
+
+        start = time.perf_counter()
+        results = predict_batch(model, image_paths, class_names, transform,
+                                args.batch_size, args.workers, csv_path=args.csv)
+        elapsed = time.perf_counter() - start
 
         print("=" * 50)
         print("預測結果:")
@@ -277,18 +564,25 @@ def main():
         heads_count = 0
         tails_count = 0
 
-        for r in results:
-            filename = os.path.basename(r['path'])
-            display_name = "正面" if r['prediction'] == "heads" else "反面"
-            print(f"  {filename}: {display_name} ({r['confidence']*100:.1f}%)")
-
+        for i, r in enumerate(results):
             if r['prediction'] == 'heads':
                 heads_count += 1
             else:
                 tails_count += 1
 
+            # 圖片很多時只列出前面幾張，完整結果見 CSV
+            if i < 20:
+                filename = os.path.basename(r['path'])
+                display_name = "正面" if r['prediction'] == "heads" else "反面"
+                print(f"  {filename}: {display_name} ({r['confidence']*100:.1f}%)")
+
+        if len(results) > 20:
+            print(f"  ... 其餘 {len(results) - 20} 張")
+
         print("-" * 50)
         print(f"統計: 正面 {heads_count} 張, 反面 {tails_count} 張")
+        print(f"耗時: {elapsed:.2f} 秒 ({len(results) / max(elapsed, 1e-9):.1f} 張/秒)")
+        print(f"完整結果已儲存至 {args.csv}")
         print("=" * 50)
 
 
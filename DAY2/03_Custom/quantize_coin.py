@@ -0,0 +1,207 @@
+"""
+硬幣正反面分類器 - int8 訓練後量化 (Post-Training Static Quantization)
+以部分訓練資料校正 (calibration) 後，將 CoinCNN 轉為 int8，降低低階 CPU 上的推論時間
+
+流程:
+1. 載入 train_coin.py 訓練好的 fp32 模型
+2. 插入觀察器 (Conv + BN + ReLU 自動融合)，以訓練集樣本校正量化範圍
+3. 轉為 int8 模型並儲存 (predict_coin.py 的 load_model 可直接載入)
+4. 在驗證集上比較 fp32 與 int8 的準確率與推論時間
+
+使用方式:
+python quantize_coin.py
+python quantize_coin.py --calibration 300 --engine qnnpack   # ARM CPU
+python predict_coin.py --folder path/to/images/ --model ../models/coin_classifier_int8.pth
+"""
+
+import argparse
+import copy
+import json
+import os
+import time
+
+import torch
+from torch.ao.quantization.quantize_fx import convert_fx
+from torch.utils.data import DataLoader, Subset
+from tqdm import tqdm
+
+from predict_coin import MODEL_PATH, QUANT_BACKEND, get_transform, load_model, prepare_for_quantization
+from train_coin import DATA_DIR, MODEL_DIR, CoinDataset, split_dataset
+from train_utils import atomic_save
+
+# ============== 設定區 ==============
+CALIBRATION_SAMPLES = 200   # 校正用的訓練集影像數
+BATCH_SIZE = 32
+LATENCY_RUNS = 50           # 單張推論計時次數
+QUANTIZED_MODEL_PATH = os.path.join(MODEL_DIR, "coin_classifier_int8.pth")
+REPORT_PATH = os.path.join(MODEL_DIR, "quantization_report.json")
+
+
+# ============== 資料 ==============
+def get_datasets(image_size):
+    """與 train_coin.py 相同的切分 (固定亂數種子)，使用不含資料增強的轉換"""
+    dataset = CoinDataset(DATA_DIR, transform=get_transform(image_size))
+    if len(dataset) == 0:
+        return None, None
+
+    train_dataset, val_dataset = split_dataset(dataset)
+    return train_dataset, val_dataset
+
+
+# ============== 量化 ==============
+def quantize(model, calibration_loader, image_size, engine):
+    """校正並轉為 int8 模型"""
+    # 複製一份，保留原本的 fp32 模型
+    prepared = prepare_for_quantization(copy.deepcopy(model), image_size, engine)
+
+    with torch.inference_mode():
+        for images, _ in tqdm(calibration_loader, desc="校正"):
+            prepared(images)
+
+    return convert_fx(prepared)
+
+
+# ============== 評估 ==============
+def evaluate_accuracy(model, loader):
+    """驗證集準確率 (%)"""
+    correct = 0
+    total = 0
+
+    with torch.inference_mode():
+        for images, labels in loader:
+            predicted = model(images).argmax(dim=1)
+            correct += (predicted == labels).sum().item()
+            total += labels.size(0)
+
+    return 100.0 * correct / max(total, 1)
+
+
+def measure_latency(model, image_size, runs=LATENCY_RUNS, batch_size=BATCH_SIZE):
+    """回傳 (單張推論毫秒, 批次推論每秒張數)"""
+    single = torch.randn(1, 3, image_size, image_size)
+    batch = torch.randn(batch_size, 3, image_size, image_size)
+
+    with torch.inference_mode():
+        for _ in range(5):
+            model(single)
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(single)
+        latency_ms = (time.perf_counter() - start) / runs * 1000
+
+        model(batch)
+        start = time.perf_counter()
+        for _ in range(max(1, runs // 10)):
+            model(batch)
+        throughput = batch_size * max(1, runs // 10) / (time.perf_counter() - start)
+
+    return latency_ms, throughput
+
+
+def model_size_mb(path):
+    return os.path.getsize(path) / (1024 * 1024)
+
+
+# ============== 主程式 ==============
+def main():
+    parser = argparse.ArgumentParser(description='CoinCNN int8 訓練後量化')
+    parser.add_argument('--model', '-m', type=str, default=MODEL_PATH,
+                        help='fp32 模型路徑')
+    parser.add_argument('--output', '-o', type=str, default=QUANTIZED_MODEL_PATH,
+                        help='int8 模型輸出路徑')
+    parser.add_argument('--calibration', type=int, default=CALIBRATION_SAMPLES,
+                        help='校正用的影像數')
+    parser.add_argument('--engine', type=str, default=QUANT_BACKEND,
+                        choices=['x86', 'fbgemm', 'qnnpack'],
+                        help='量化引擎 (x86 CPU 用 x86，ARM 用 qnnpack)')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("硬幣正反面分類器 - int8 量化")
+    print("=" * 50)
+
+    # 載入 fp32 模型 (量化只支援 CPU)
+    print("[1] 載入 fp32 模型...")
+    try:
+        model, class_names, image_size = load_model(args.model)
+    except FileNotFoundError as e:
+        print(f"錯誤: {e}")
+        return
+    model = model.cpu().eval()
+    print()
+
+    print("[2] 載入資料集...")
+    train_dataset, val_dataset = get_datasets(image_size)
+    if train_dataset is None:
+        print("錯誤: 沒有找到任何圖片")
+        return
+
+    num_calibration = min(args.calibration, len(train_dataset))
+    generator = torch.Generator().manual_seed(0)
+    calibration_indices = torch.randperm(len(train_dataset), generator=generator)[:num_calibration]
+    calibration_loader = DataLoader(Subset(train_dataset, calibration_indices.tolist()),
+                                    batch_size=BATCH_SIZE, shuffle=False)
+    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False)
+
+    print(f"校正: {num_calibration} 張 (訓練集) | 驗證: {len(val_dataset)} 張")
+    print()
+
+    print(f"[3] 量化 (引擎: {args.engine})...")
+    fp32_acc = evaluate_accuracy(model, val_loader)
+    fp32_latency, fp32_throughput = measure_latency(model, image_size)
+
+    quantized = quantize(model, calibration_loader, image_size, args.engine)
+
+    int8_acc = evaluate_accuracy(quantized, val_loader)
+    int8_latency, int8_throughput = measure_latency(quantized, image_size)
+
+    atomic_save({
+        'model_state_dict': quantized.state_dict(),
+        'class_names': class_names,
+        'image_size': image_size,
+        'quantized': True,
+        'quant_backend': args.engine,
+        'val_acc': int8_acc,
+    }, args.output)
+    print(f"int8 模型已儲存至 {args.output}")
+    print()
+
+    # 報告
+    report = {
+        'engine': args.engine,
+        'calibration_samples': num_calibration,
+        'val_samples': len(val_dataset),
+        'threads': torch.get_num_threads(),
+        'fp32': {
+            'val_acc': fp32_acc,
+            'latency_ms': fp32_latency,
+            'throughput': fp32_throughput,
+            'size_mb': model_size_mb(args.model),
+        },
+        'int8': {
+            'val_acc': int8_acc,
+            'latency_ms': int8_latency,
+            'throughput': int8_throughput,
+            'size_mb': model_size_mb(args.output),
+        },
+    }
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("=" * 50)
+    print(f"{'':6} {'驗證準確率':>10} {'單張 (ms)':>10} {'張/秒':>8} {'大小 (MB)':>10}")
+    print("-" * 50)
+    for name in ('fp32', 'int8'):
+        r = report[name]
+        print(f"{name:6} {r['val_acc']:>9.2f}% {r['latency_ms']:>10.2f} "
+              f"{r['throughput']:>8.1f} {r['size_mb']:>10.2f}")
+    print("-" * 50)
+    print(f"準確率變化: {int8_acc - fp32_acc:+.2f}% | "
+          f"單張加速: {fp32_latency / max(int8_latency, 1e-9):.2f}x")
+    print(f"報告已儲存至 {REPORT_PATH}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,10 @@ dataset/
 └── tails/    # 放入硬幣反面圖片
 
 使用方式:
-python train_coin.py
+python train_coin.py            # 訓練 (自動建立/使用資料集快取)
+python train_coin.py --pack     # 只建立資料集快取
+python train_coin.py --no-cache # 不使用快取，每個 epoch 重新解碼圖片
+python train_coin.py --resume   # 從上次中斷的檢查點繼續訓練
 """
 
 import torch
@@ -16,28 +19,53 @@ import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import DataLoader, random_split, Dataset
 from torchvision import transforms, models
-from PIL import Image
 import os
 import sys
+import argparse
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 import random
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from train_utils import (EarlyStopping, atomic_save, autocast, configure_threads,
+                         describe_cpu_options, load_training_state, optimize_model,
+                         save_training_state, to_channels_last)
+from coin_cache import BatchAugment, PackedCoinDataset, is_cache_fresh, pack_samples
+from image_decoders import decode_image, is_supported, unavailable_reason
+
 # ============== 取得腳本所在目錄 (相對路徑基準) ==============
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # ============== 設定區 ==============
 BATCH_SIZE = 32          # 批次大小
-EPOCHS = 20              # 訓練輪數
+EPOCHS = 20              # 訓練輪數 (最多)
 LEARNING_RATE = 0.001    # 學習率
 IMAGE_SIZE = 224         # 統一影像大小
 TRAIN_SPLIT = 0.8        # 訓練集比例
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
+# 資料集快取設定
+USE_PACKED_CACHE = True              # 使用預先解碼的 memmap 快取
+PACK_SIZE = IMAGE_SIZE + 32          # 快取影像大小 (隨機裁切前的尺寸)
+NUM_WORKERS = min(4, os.cpu_count() or 1)  # DataLoader 平行讀取數
+PACK_WORKERS = os.cpu_count() or 1         # 打包快取時的平行解碼程序數
+
+# CPU 最佳化設定 (見 ../benchmark_cpu_training.py 選擇最快組合)
+USE_BF16 = True          # bfloat16 自動混合精度 (僅 CPU，且支援時)
+CHANNELS_LAST = True     # channels-last 記憶體格式
+COMPILE_MODEL = False    # torch.compile (第一個 epoch 需額外編譯時間)
+NUM_THREADS = None       # 運算執行緒數 (None = PyTorch 預設)
+
+# 檢查點與早停
+CHECKPOINT_EVERY = 1     # 每 N 個 epoch 儲存完整訓練狀態 (供 --resume 使用)
+EARLY_STOP_PATIENCE = 5  # 驗證準確率連續 N 個 epoch 沒進步就停止 (0 = 停用)
+
 # 相對路徑設定
 DATA_DIR = os.path.join(SCRIPT_DIR, "dataset")
 MODEL_DIR = os.path.join(SCRIPT_DIR, "..", "models")
 MODEL_SAVE_PATH = os.path.join(MODEL_DIR, "coin_classifier.pth")
+CHECKPOINT_PATH = os.path.join(MODEL_DIR, "coin_classifier_state.pth")
+CACHE_DIR = os.path.join(SCRIPT_DIR, "dataset_cache")
 
 # 類別名稱
 CLASS_NAMES = ["heads", "tails"]  # 正面, 反面
@@ -47,13 +75,15 @@ CLASS_NAMES = ["heads", "tails"]  # 正面, 反面
 class CoinDataset(Dataset):
     """
     硬幣資料集
-    自動處理不同大小的圖片
+    自動處理不同大小的圖片，依副檔名交給 image_decoders 解碼 (含 HEIC)
     """
 
-    def __init__(self, data_dir, transform=None):
+    def __init__(self, data_dir, transform=None, decode=decode_image):
         self.data_dir = data_dir
         self.transform = transform
+        self.decode = decode
         self.samples = []
+        self.skipped = []    # (路徑, 原因): 影像格式已知但沒有可用的解碼器
         self.class_to_idx = {cls: idx for idx, cls in enumerate(CLASS_NAMES)}
 
         # 掃描所有圖片
@@ -64,23 +94,31 @@ class CoinDataset(Dataset):
                 continue
 
             for filename in os.listdir(class_dir):
-                if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')):
-                    filepath = os.path.join(class_dir, filename)
+                filepath = os.path.join(class_dir, filename)
+                if is_supported(filename):
                     self.samples.append((filepath, self.class_to_idx[class_name]))
+                elif unavailable_reason(filename):
+                    self.skipped.append((filepath, unavailable_reason(filename)))
 
         print(f"載入資料集: {len(self.samples)} 張圖片")
         for cls in CLASS_NAMES:
             count = sum(1 for s in self.samples if s[1] == self.class_to_idx[cls])
             print(f"  {cls}: {count} 張")
 
+        if self.skipped:
+            print(f"警告: 略過 {len(self.skipped)} 張無法解碼的圖片")
+            for reason in sorted(set(r for _, r in self.skipped)):
+                count = sum(1 for _, r in self.skipped if r == reason)
+                print(f"  {count} 張: {reason}")
+
     def __len__(self):
         return len(self.samples)
 
     def __getitem__(self, idx):
         filepath, label = self.samples[idx]
 
-        # 載入圖片 (自動處理不同大小)
-        image = Image.open(filepath).convert('RGB')
+        # 載入圖片 (自動處理不同大小與格式)
+        image = self.decode(filepath)
 
         if self.transform:
             image = self.transform(image)
@@ -188,8 +226,8 @@ def get_pretrained_model(num_classes=2):
 
 
 # ============== 訓練函數 ==============
-def train_one_epoch(model, train_loader, optimizer, criterion, epoch):
-    """訓練一個 epoch"""
+def train_one_epoch(model, train_loader, optimizer, criterion, epoch, batch_transform=None):
+    """訓練一個 epoch (batch_transform: 快取模式下的批次資料增強)"""
     model.train()
     running_loss = 0.0
     correct = 0
@@ -198,11 +236,14 @@ def train_one_epoch(model, train_loader, optimizer, criterion, epoch):
     pbar = tqdm(train_loader, desc=f"Epoch {epoch}")
 
     for data, target in pbar:
-        data, target = data.to(DEVICE), target.to(DEVICE)
+        data = batch_transform(data) if batch_transform else data.to(DEVICE)
+        data = to_channels_last(data, CHANNELS_LAST)
+        target = target.to(DEVICE, non_blocking=True)
 
         optimizer.zero_grad()
-        output = model(data)
-        loss = criterion(output, target)
+        with autocast(DEVICE, USE_BF16):
+            output = model(data)
+            loss = criterion(output, target)
         loss.backward()
         optimizer.step()
 
@@ -219,7 +260,7 @@ def train_one_epoch(model, train_loader, optimizer, criterion, epoch):
     return running_loss / len(train_loader), 100. * correct / total
 
 
-def evaluate(model, val_loader, criterion):
+def evaluate(model, val_loader, criterion, batch_transform=None):
     """評估模型"""
     model.eval()
     val_loss = 0.0
@@ -228,10 +269,13 @@ def evaluate(model, val_loader, criterion):
 
     with torch.no_grad():
         for data, target in val_loader:
-            data, target = data.to(DEVICE), target.to(DEVICE)
+            data = batch_transform(data) if batch_transform else data.to(DEVICE)
+            data = to_channels_last(data, CHANNELS_LAST)
+            target = target.to(DEVICE, non_blocking=True)
 
-            output = model(data)
-            loss = criterion(output, target)
+            with autocast(DEVICE, USE_BF16):
+                output = model(data)
+                loss = criterion(output, target)
 
             val_loss += loss.item()
             _, predicted = output.max(1)
@@ -270,12 +314,13 @@ def plot_training_history(train_losses, train_accs, val_losses, val_accs, save_p
     print(f"訓練歷史已儲存至 {save_path}")
 
 
-def visualize_predictions(val_loader, model, class_names, save_path):
+def visualize_predictions(val_loader, model, class_names, save_path, batch_transform=None):
     """視覺化預測結果"""
     model.eval()
 
     data, target = next(iter(val_loader))
-    data, target = data.to(DEVICE), target.to(DEVICE)
+    data = batch_transform(data) if batch_transform else data.to(DEVICE)
+    target = target.to(DEVICE)
 
     with torch.no_grad():
         output = model(data)
@@ -333,9 +378,10 @@ def check_data():
     for cls in CLASS_NAMES:
         cls_dir = os.path.join(DATA_DIR, cls)
         if os.path.exists(cls_dir):
-            count = len([f for f in os.listdir(cls_dir)
-                        if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff'))])
-            print(f"  {cls}: {count} 張")
+            files = os.listdir(cls_dir)
+            count = len([f for f in files if is_supported(f)])
+            unavailable = len([f for f in files if unavailable_reason(f)])
+            print(f"  {cls}: {count} 張" + (f" (另有 {unavailable} 張無法解碼)" if unavailable else ""))
             total += count
         else:
             os.makedirs(cls_dir, exist_ok=True)
@@ -350,12 +396,96 @@ def check_data():
     return True
 
 
+# ============== 資料載入器 ==============
+def split_dataset(dataset):
+    """固定亂數種子切分訓練集和驗證集"""
+    train_size = int(TRAIN_SPLIT * len(dataset))
+    val_size = len(dataset) - train_size
+
+    return random_split(
+        dataset, [train_size, val_size],
+        generator=torch.Generator().manual_seed(42)
+    )
+
+
+def get_packed_loaders():
+    """
+    從 memmap 快取建立資料載入器
+    快取不存在或與資料夾內容不一致時，先重新打包
+    """
+    source = CoinDataset(DATA_DIR)
+    if len(source) == 0:
+        return None
+
+    if not is_cache_fresh(source.samples, CACHE_DIR, PACK_SIZE):
+        print("資料集快取不存在或已過期，重新打包...")
+        pack_samples(source.samples, CLASS_NAMES, CACHE_DIR, PACK_SIZE, PACK_WORKERS)
+
+    full_dataset = PackedCoinDataset(CACHE_DIR, PACK_SIZE)
+    if len(full_dataset) == 0:
+        return None
+
+    train_dataset, val_dataset = split_dataset(full_dataset)
+
+    loader_kwargs = dict(
+        batch_size=BATCH_SIZE,
+        num_workers=NUM_WORKERS,
+        pin_memory=DEVICE.type == "cuda",
+        persistent_workers=NUM_WORKERS > 0,
+    )
+    train_loader = DataLoader(train_dataset, shuffle=True, **loader_kwargs)
+    val_loader = DataLoader(val_dataset, shuffle=False, **loader_kwargs)
+
+    train_augment = BatchAugment(IMAGE_SIZE, DEVICE, train=True)
+    val_augment = BatchAugment(IMAGE_SIZE, DEVICE, train=False)
+
+    return train_loader, val_loader, train_augment, val_augment
+
+
+def get_image_loaders():
+    """每個 epoch 從原始圖片解碼的資料載入器 (不使用快取)"""
+    train_transform, val_transform = get_transforms()
+
+    full_dataset = CoinDataset(DATA_DIR, transform=train_transform)
+    if len(full_dataset) == 0:
+        return None
+
+    train_dataset, val_dataset = split_dataset(full_dataset)
+
+    # 為驗證集設定不同的轉換
+    val_dataset.dataset.transform = val_transform
+
+    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=0)
+    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=0)
+
+    return train_loader, val_loader, None, None
+
+
 # ============== 主程式 ==============
 def main():
+    parser = argparse.ArgumentParser(description='硬幣正反面分類器訓練')
+    parser.add_argument('--pack', action='store_true',
+                        help='只建立資料集快取後結束')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用資料集快取')
+    parser.add_argument('--resume', action='store_true',
+                        help='從上次儲存的訓練狀態繼續')
+    args = parser.parse_args()
+
+    if args.pack:
+        source = CoinDataset(DATA_DIR)
+        if len(source) == 0:
+            print("錯誤: 沒有找到任何圖片")
+            return
+        pack_samples(source.samples, CLASS_NAMES, CACHE_DIR, PACK_SIZE, PACK_WORKERS)
+        return
+
     print("=" * 50)
     print("硬幣正反面分類器 - CNN 訓練")
     print("=" * 50)
+    configure_threads(NUM_THREADS)
     print(f"使用裝置: {DEVICE}")
+    print(f"最佳化: {describe_cpu_options(DEVICE, USE_BF16, CHANNELS_LAST, COMPILE_MODEL)}")
     print(f"腳本目錄: {SCRIPT_DIR}")
     print()
 
@@ -370,29 +500,17 @@ def main():
 
     # 載入資料集
     print("[2] 載入資料集...")
-    train_transform, val_transform = get_transforms()
+    use_cache = USE_PACKED_CACHE and not args.no_cache
+    loaders = get_packed_loaders() if use_cache else get_image_loaders()
 
-    full_dataset = CoinDataset(DATA_DIR, transform=train_transform)
-
-    if len(full_dataset) == 0:
+    if loaders is None:
         print("錯誤: 沒有找到任何圖片")
         return
 
-    # 分割訓練集和驗證集
-    train_size = int(TRAIN_SPLIT * len(full_dataset))
-    val_size = len(full_dataset) - train_size
-
-    train_dataset, val_dataset = random_split(
-        full_dataset, [train_size, val_size],
-        generator=torch.Generator().manual_seed(42)
-    )
-
-    # 為驗證集設定不同的轉換
-    val_dataset.dataset.transform = val_transform
-
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=0)
+    train_loader, val_loader, train_augment, val_augment = loaders
+    train_dataset, val_dataset = train_loader.dataset, val_loader.dataset
 
+    print(f"資料來源: {'memmap 快取' if use_cache else '原始圖片'}")
     print(f"訓練集: {len(train_dataset)} 張")
     print(f"驗證集: {len(val_dataset)} 張")
     print()
@@ -402,6 +520,7 @@ def main():
     # 使用自定義 CNN (也可以改用 get_pretrained_model())
     model = CoinCNN(num_classes=len(CLASS_NAMES)).to(DEVICE)
     # model = get_pretrained_model(num_classes=len(CLASS_NAMES)).to(DEVICE)
+    model, run_model = optimize_model(model, CHANNELS_LAST, COMPILE_MODEL)
     print(f"模型參數量: {sum(p.numel() for p in model.parameters()):,}")
     print()
 
@@ -411,20 +530,44 @@ def main():
     scheduler = optim.lr_scheduler.StepLR(optimizer, step_size=10, gamma=0.5)
 
     # 訓練歷史
-    train_losses, train_accs = [], []
-    val_losses, val_accs = [], []
+    history = {'train_losses': [], 'train_accs': [], 'val_losses': [], 'val_accs': []}
     best_val_acc = 0.0
+    start_epoch = 1
+    early_stopping = EarlyStopping(patience=EARLY_STOP_PATIENCE, mode='max')
+
+    # 從檢查點繼續
+    if args.resume:
+        if os.path.exists(CHECKPOINT_PATH):
+            last_epoch, history, extra = load_training_state(
+                CHECKPOINT_PATH, model, optimizer, scheduler, DEVICE
+            )
+            best_val_acc = extra['best_val_acc']
+            early_stopping.load_state_dict(extra['early_stopping'])
+            start_epoch = last_epoch + 1
+            print(f"從檢查點繼續: 已完成 {last_epoch} 個 epoch (最佳 Val Acc: {best_val_acc:.2f}%)")
+        else:
+            print(f"找不到檢查點 {CHECKPOINT_PATH}，從頭開始訓練")
+        print()
+
+    train_losses, train_accs = history['train_losses'], history['train_accs']
+    val_losses, val_accs = history['val_losses'], history['val_accs']
 
     # 開始訓練
     print("[4] 開始訓練...")
     print("-" * 50)
 
-    for epoch in range(1, EPOCHS + 1):
+    if early_stopping.should_stop:
+        print("檢查點已達早停條件，不再繼續訓練")
+
+    for epoch in range(start_epoch, EPOCHS + 1):
+        if early_stopping.should_stop:
+            break
+
         train_loss, train_acc = train_one_epoch(
-            model, train_loader, optimizer, criterion, epoch
+            run_model, train_loader, optimizer, criterion, epoch, train_augment
         )
 
-        val_loss, val_acc = evaluate(model, val_loader, criterion)
+        val_loss, val_acc = evaluate(run_model, val_loader, criterion, val_augment)
 
         scheduler.step()
 
@@ -439,7 +582,7 @@ def main():
         # 儲存最佳模型
         if val_acc > best_val_acc:
             best_val_acc = val_acc
-            torch.save({
+            atomic_save({
                 'model_state_dict': model.state_dict(),
                 'class_names': CLASS_NAMES,
                 'val_acc': val_acc,
@@ -447,6 +590,18 @@ def main():
             }, MODEL_SAVE_PATH)
             print(f"         >> 儲存最佳模型 (Val Acc: {val_acc:.2f}%)")
 
+        early_stopping.step(val_acc)
+
+        # 儲存完整訓練狀態
+        if epoch % CHECKPOINT_EVERY == 0 or epoch == EPOCHS or early_stopping.should_stop:
+            save_training_state(
+                CHECKPOINT_PATH, model, optimizer, scheduler, epoch, history,
+                best_val_acc=best_val_acc, early_stopping=early_stopping.state_dict()
+            )
+
+        if early_stopping.should_stop:
+            print(f"         >> 驗證準確率已 {EARLY_STOP_PATIENCE} 個 epoch 沒有進步，提前結束訓練")
+
         print()
 
     print("-" * 50)
@@ -460,7 +615,7 @@ def main():
     plot_training_history(train_losses, train_accs, val_losses, val_accs, history_path)
 
     if len(val_dataset) > 0:
-        visualize_predictions(val_loader, model, CLASS_NAMES, samples_path)
+        visualize_predictions(val_loader, model, CLASS_NAMES, samples_path, val_augment)
 
     print()
     print("=" * 50)
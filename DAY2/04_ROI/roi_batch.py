@@ -0,0 +1,296 @@
+"""
+ROI 批次處理
+將 ROI 工具儲存的範本 (多個矩形 / 多邊形 ROI) 套用到整個資料夾的圖片
+適用於固定攝影機的檢測產線 (每張畫面的 ROI 位置都相同)
+
+效能重點:
+- 遮罩依圖片大小只建立一次並快取，不會每張圖重新配置
+- 矩形裁切直接使用 NumPy view (不複製)，多邊形只在外接矩形範圍內套用遮罩
+- 多執行緒平行讀取、處理與寫檔 (OpenCV 的讀寫與位元運算會釋放 GIL)
+
+範本格式 (roi_template.json):
+{
+  "image_size": [1920, 1080],
+  "rois": [
+    {"name": "label", "type": "rect", "x": 100, "y": 80, "w": 300, "h": 200},
+    {"name": "cap", "type": "polygon", "points": [[500, 100], [700, 120], [650, 300]]}
+  ]
+}
+
+使用方式:
+python roi_batch.py --template roi_template.json --input frames/ --output roi_output/
+python roi_batch.py --template roi_template.json --input frames/ --output roi_output/ --modes crop --workers 8
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# ============== 取得腳本所在目錄 ==============
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ============== 設定區 ==============
+TEMPLATE_PATH = os.path.join(SCRIPT_DIR, "roi_template.json")
+NUM_WORKERS = min(8, os.cpu_count() or 1)
+OUTPUT_EXT = ".png"
+MODES = ("mask", "inverse", "crop")     # 保留 ROI / 遮蔽 ROI / 各 ROI 裁切
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+# ============== 範本 ==============
+def make_rect(x, y, w, h, name=None):
+    return {"name": name, "type": "rect", "x": int(x), "y": int(y), "w": int(w), "h": int(h)}
+
+
+def make_polygon(points, name=None):
+    return {"name": name, "type": "polygon", "points": [[int(px), int(py)] for px, py in points]}
+
+
+def save_template(path, rois, image_size=None):
+    """儲存 ROI 範本 (沒有名稱的 ROI 依序命名為 roi1, roi2, ...)"""
+    named = []
+    for i, roi in enumerate(rois, start=1):
+        roi = dict(roi)
+        roi["name"] = roi.get("name") or f"roi{i}"
+        named.append(roi)
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"image_size": list(image_size) if image_size else None, "rois": named},
+                  f, ensure_ascii=False, indent=2)
+
+
+def load_template(path):
+    """讀取 ROI 範本，回傳 ROITemplate"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    return ROITemplate(data["rois"], data.get("image_size"))
+
+
+def roi_bbox(roi, img_w, img_h):
+    """ROI 的外接矩形 (x1, y1, x2, y2)，限制在圖片範圍內"""
+    if roi["type"] == "rect":
+        x1, y1 = roi["x"], roi["y"]
+        x2, y2 = x1 + roi["w"], y1 + roi["h"]
+    else:
+        points = np.array(roi["points"])
+        x1, y1 = points.min(axis=0)
+        x2, y2 = points.max(axis=0) + 1
+
+    return (int(max(0, x1)), int(max(0, y1)), int(min(img_w, x2)), int(min(img_h, y2)))
+
+
+class ROITemplate:
+    """
+    一組 ROI 與其預先計算的遮罩
+    遮罩依圖片大小 (h, w) 快取，同一批圖片只會建立一次
+    """
+
+    def __init__(self, rois, image_size=None):
+        if not rois:
+            raise ValueError("範本中沒有任何 ROI")
+
+        self.rois = rois
+        self.image_size = image_size
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def names(self):
+        return [roi.get("name") or f"roi{i}" for i, roi in enumerate(self.rois, start=1)]
+
+    def get_masks(self, shape):
+        """
+        回傳指定圖片大小的遮罩資料 (快取):
+        - mask: 所有 ROI 聯集的遮罩 (ROI 內為 255)
+        - inverse: 反向遮罩
+        - regions: [(名稱, (x1, y1, x2, y2), 外接矩形內的局部遮罩或 None), ...]
+          矩形 ROI 的局部遮罩為 None (直接用 view 裁切)
+        """
+        key = shape[:2]
+        masks = self._cache.get(key)
+        if masks is not None:
+            return masks
+
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = self._build_masks(*key)
+            return self._cache[key]
+
+    def _build_masks(self, img_h, img_w):
+        mask = np.zeros((img_h, img_w), dtype=np.uint8)
+        regions = []
+
+        for name, roi in zip(self.names(), self.rois):
+            x1, y1, x2, y2 = roi_bbox(roi, img_w, img_h)
+            if x2 <= x1 or y2 <= y1:
+                print(f"警告: ROI {name} 超出圖片範圍 ({img_w}x{img_h})，略過")
+                continue
+
+            if roi["type"] == "rect":
+                mask[y1:y2, x1:x2] = 255
+                regions.append((name, (x1, y1, x2, y2), None))
+            else:
+                points = np.array(roi["points"], dtype=np.int32)
+                cv2.fillPoly(mask, [points], 255)
+
+                local = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+                cv2.fillPoly(local, [points - np.array([x1, y1], dtype=np.int32)], 255)
+                regions.append((name, (x1, y1, x2, y2), local))
+
+        return {"mask": mask, "inverse": cv2.bitwise_not(mask), "regions": regions}
+
+    def apply(self, image, modes=MODES):
+        """
+        套用到單張圖片，回傳 {輸出名稱: 影像}
+        crop 模式的矩形裁切是原圖的 view，寫檔前不可修改原圖
+        """
+        masks = self.get_masks(image.shape)
+        outputs = {}
+
+        if "mask" in modes:
+            outputs["mask"] = cv2.bitwise_and(image, image, mask=masks["mask"])
+        if "inverse" in modes:
+            outputs["inverse"] = cv2.bitwise_and(image, image, mask=masks["inverse"])
+        if "crop" in modes:
+            for name, (x1, y1, x2, y2), local in masks["regions"]:
+                view = image[y1:y2, x1:x2]
+                if local is not None:
+                    view = cv2.bitwise_and(view, view, mask=local)
+                outputs[f"crop/{name}"] = view
+
+        return outputs
+
+
+# ============== 批次處理 ==============
+def list_images(input_dir):
+    return [os.path.join(input_dir, f) for f in sorted(os.listdir(input_dir))
+            if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def read_image(path):
+    """讀取圖片 (imdecode，Windows 中文路徑也能讀)"""
+    data = np.fromfile(path, dtype=np.uint8)
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def write_image(path, image):
+    ok, buffer = cv2.imencode(os.path.splitext(path)[1], image)
+    if not ok:
+        raise RuntimeError(f"編碼失敗: {path}")
+    buffer.tofile(path)
+
+
+def process_image(template, path, output_dir, modes, ext=OUTPUT_EXT):
+    """處理單張圖片，回傳 (路徑, 錯誤訊息或 None)"""
+    image = read_image(path)
+    if image is None:
+        return path, "無法讀取"
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    try:
+        for name, result in template.apply(image, modes).items():
+            write_image(os.path.join(output_dir, name, stem + ext), result)
+    except Exception as e:
+        return path, str(e)
+
+    return path, None
+
+
+def process_directory(template, input_dir, output_dir, modes=MODES,
+                      workers=NUM_WORKERS, ext=OUTPUT_EXT):
+    """將範本套用到整個資料夾，回傳 (成功數, 失敗列表)"""
+    paths = list_images(input_dir)
+    if not paths:
+        return 0, []
+
+    # 先建立輸出資料夾 (避免每張圖片都檢查)
+    for mode in modes:
+        if mode == "crop":
+            for name in template.names():
+                os.makedirs(os.path.join(output_dir, "crop", name), exist_ok=True)
+        else:
+            os.makedirs(os.path.join(output_dir, mode), exist_ok=True)
+
+    done = 0
+    failures = []
+    report_every = max(1, len(paths) // 20)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda p: process_image(template, p, output_dir, modes, ext), paths
+        )
+        for i, (path, error) in enumerate(results, start=1):
+            if error is None:
+                done += 1
+            else:
+                failures.append((path, error))
+
+            if i % report_every == 0 or i == len(paths):
+                print(f"  進度: {i}/{len(paths)}")
+
+    return done, failures
+
+
+# ============== 主程式 ==============
+def main():
+    parser = argparse.ArgumentParser(description='ROI 批次處理')
+    parser.add_argument('--template', '-t', type=str, default=TEMPLATE_PATH,
+                        help='ROI 範本 (由 roi_tool.py 儲存)')
+    parser.add_argument('--input', '-i', type=str, required=True,
+                        help='輸入圖片資料夾')
+    parser.add_argument('--output', '-o', type=str, required=True,
+                        help='輸出資料夾')
+    parser.add_argument('--modes', type=str, default=','.join(MODES),
+                        help='輸出種類 (逗號分隔): mask, inverse, crop')
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help='平行處理的執行緒數')
+    parser.add_argument('--ext', type=str, default=OUTPUT_EXT,
+                        help='輸出格式 (.png / .jpg / .bmp)')
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        print(f"錯誤: 不支援的輸出種類 {unknown} (可用: {', '.join(MODES)})")
+        return
+
+    print("=" * 50)
+    print("ROI 批次處理")
+    print("=" * 50)
+
+    if not os.path.exists(args.template):
+        print(f"錯誤: 找不到範本 {args.template}")
+        return
+    if not os.path.isdir(args.input):
+        print(f"錯誤: 找不到資料夾 {args.input}")
+        return
+
+    template = load_template(args.template)
+    print(f"範本: {args.template} ({len(template.rois)} 個 ROI: {', '.join(template.names())})")
+    print(f"輸入: {args.input}")
+    print(f"輸出: {args.output} ({', '.join(modes)})")
+    print(f"執行緒: {args.workers}")
+    print()
+
+    start = time.perf_counter()
+    done, failures = process_directory(template, args.input, args.output,
+                                       modes, args.workers, args.ext)
+    elapsed = time.perf_counter() - start
+
+    print()
+    print("=" * 50)
+    print(f"完成: {done} 張 | 失敗: {len(failures)} 張 | "
+          f"耗時: {elapsed:.2f} 秒 ({done / max(elapsed, 1e-9):.1f} 張/秒)")
+    for path, error in failures[:5]:
+        print(f"  {os.path.basename(path)}: {error}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    main()
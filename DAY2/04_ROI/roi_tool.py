@@ -8,11 +8,18 @@ ROI (Region of Interest) 工具
 3. 顯示 ROI Mask (保留 ROI 區域)
 4. 顯示 Inverse ROI Mask (遮蔽 ROI 區域)
 5. 滑鼠拖曳選取 ROI
+6. ROI 範本: 多個矩形 / 多邊形 ROI 存成 JSON，供 roi_batch.py 批次套用到整個資料夾
 
 操作說明:
 - 載入圖片後，可以手動輸入 x, y, w, h
 - 或在圖片上用滑鼠拖曳選取 ROI 區域
 - 點擊「套用 ROI」查看結果
+- 多邊形模式: 左鍵逐點點選，右鍵完成並加入範本
+
+顯示效能:
+- 載入時建立一次影像金字塔，重繪時從最接近的層縮小，不必每次縮放原始大圖
+- 拖曳選取只移動畫布上的矩形物件，不重新繪製圖片
+- 遮罩只在按下「套用 ROI」時以原始解析度計算
 """
 
 import tkinter as tk
@@ -22,25 +29,69 @@ import numpy as np
 from PIL import Image, ImageTk
 import os
 
+from roi_batch import TEMPLATE_PATH, ROITemplate, load_template, make_polygon, make_rect, save_template
+
 # ============== 取得腳本所在目錄 ==============
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# ============== 設定區 ==============
+PYRAMID_MIN_SIDE = 256      # 顯示金字塔最小層的長邊
+RESIZE_DELAY_MS = 100       # 視窗縮放後延遲重繪 (避免拖曳視窗邊框時連續重算)
+
+
+# ============== 顯示用影像金字塔 ==============
+def build_pyramid(image, min_side=PYRAMID_MIN_SIDE):
+    """建立顯示用影像金字塔 (每層長寬減半，第 0 層為原圖)"""
+    levels = [image]
+    while max(levels[-1].shape[:2]) // 2 >= min_side:
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels
+
+
+def fit_to_canvas(pyramid, canvas_w, canvas_h):
+    """
+    縮放到畫布大小 (不放大)，回傳 (RGB 影像, 相對原圖的縮放比例)
+    從仍大於目標大小的最小層縮小，大圖也只需處理很少的像素
+    """
+    h, w = pyramid[0].shape[:2]
+    scale = min(canvas_w / w, canvas_h / h, 1.0)
+    new_w = max(1, int(w * scale))
+    new_h = max(1, int(h * scale))
+
+    level = pyramid[0]
+    for candidate in pyramid[1:]:
+        if candidate.shape[1] < new_w or candidate.shape[0] < new_h:
+            break
+        level = candidate
+
+    if level.shape[1] != new_w or level.shape[0] != new_h:
+        level = cv2.resize(level, (new_w, new_h), interpolation=cv2.INTER_AREA)
+
+    return cv2.cvtColor(level, cv2.COLOR_BGR2RGB), scale
+
 
 class ROIToolGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("ROI 工具 - Region of Interest")
-        self.root.geometry("1200x700")
+        self.root.geometry("1200x820")
 
         # 圖片相關
         self.original_image = None
-        self.display_image = None
+        self.pyramid = None
         self.image_path = None
 
         # ROI 相關
         self.roi_start = None
         self.roi_end = None
         self.is_drawing = False
+        self.selection_item = None      # 拖曳中的選取框 (畫布物件，只更新座標)
+        self.applied_roi = None         # 已套用的 ROI (原始圖片座標)
+        self._resize_job = None
+
+        # ROI 範本 (原始圖片座標)
+        self.template_rois = []
+        self.polygon_points = []
 
         # 顯示縮放比例
         self.scale = 1.0
@@ -98,6 +149,39 @@ class ROIToolGUI:
         # 套用按鈕
         ttk.Button(left_frame, text="套用 ROI", command=self._apply_roi).pack(fill=tk.X, pady=5)
 
+        # 選取模式
+        self.draw_mode = tk.StringVar(value="rect")
+        mode_frame = ttk.Frame(left_frame)
+        mode_frame.pack(fill=tk.X)
+        ttk.Radiobutton(mode_frame, text="矩形", variable=self.draw_mode, value="rect",
+                        command=self._on_mode_change).pack(side=tk.LEFT)
+        ttk.Radiobutton(mode_frame, text="多邊形", variable=self.draw_mode, value="polygon",
+                        command=self._on_mode_change).pack(side=tk.LEFT, padx=10)
+
+        # 分隔線
+        ttk.Separator(left_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
+
+        # ROI 範本
+        ttk.Label(left_frame, text="ROI 範本", font=("Arial", 11, "bold")).pack(anchor=tk.W)
+        self.list_template = tk.Listbox(left_frame, height=5)
+        self.list_template.pack(fill=tk.X, pady=2)
+
+        template_btns = ttk.Frame(left_frame)
+        template_btns.pack(fill=tk.X)
+        ttk.Button(template_btns, text="加入目前矩形",
+                   command=self._add_rect_to_template).pack(side=tk.LEFT, expand=True, fill=tk.X)
+        ttk.Button(template_btns, text="刪除選取",
+                   command=self._remove_template_roi).pack(side=tk.LEFT, expand=True, fill=tk.X)
+
+        template_io = ttk.Frame(left_frame)
+        template_io.pack(fill=tk.X)
+        ttk.Button(template_io, text="載入範本",
+                   command=self._load_template).pack(side=tk.LEFT, expand=True, fill=tk.X)
+        ttk.Button(template_io, text="儲存範本",
+                   command=self._save_template).pack(side=tk.LEFT, expand=True, fill=tk.X)
+
+        ttk.Button(left_frame, text="套用範本", command=self._apply_template).pack(fill=tk.X, pady=2)
+
         # 分隔線
         ttk.Separator(left_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
 
@@ -130,6 +214,8 @@ class ROIToolGUI:
             "   或手動輸入 X, Y, W, H",
             "3. 點擊「套用 ROI」",
             "4. 查看 Mask 和 Inverse 結果",
+            "5. 多個 ROI 可加入範本並儲存，",
+            "   再用 roi_batch.py 批次處理",
         ]
         for inst in instructions:
             ttk.Label(left_frame, text=inst, font=("Arial", 9)).pack(anchor=tk.W)
@@ -153,6 +239,8 @@ class ROIToolGUI:
         self.canvas_original.bind("<ButtonPress-1>", self._on_mouse_down)
         self.canvas_original.bind("<B1-Motion>", self._on_mouse_drag)
         self.canvas_original.bind("<ButtonRelease-1>", self._on_mouse_up)
+        self.canvas_original.bind("<ButtonPress-3>", self._on_right_click)
+        self.canvas_original.bind("<Configure>", self._on_canvas_resize)
 
         # ROI Mask 分頁
         self.tab_roi = ttk.Frame(self.notebook)
@@ -160,6 +248,7 @@ class ROIToolGUI:
 
         self.canvas_roi = tk.Canvas(self.tab_roi, bg="gray30")
         self.canvas_roi.pack(fill=tk.BOTH, expand=True)
+        self.canvas_roi.bind("<Configure>", self._on_canvas_resize)
 
         # Inverse Mask 分頁
         self.tab_inverse = ttk.Frame(self.notebook)
@@ -167,6 +256,7 @@ class ROIToolGUI:
 
         self.canvas_inverse = tk.Canvas(self.tab_inverse, bg="gray30")
         self.canvas_inverse.pack(fill=tk.BOTH, expand=True)
+        self.canvas_inverse.bind("<Configure>", self._on_canvas_resize)
 
         # 狀態列
         self.status_var = tk.StringVar(value="請載入圖片")
@@ -196,72 +286,181 @@ class ROIToolGUI:
         h, w = self.original_image.shape[:2]
         self.lbl_image_info.config(text=f"大小: {w} x {h}\n{os.path.basename(file_path)}")
 
+        # 建立顯示用金字塔 (之後的重繪都不再處理原圖)
+        self.pyramid = build_pyramid(self.original_image)
+        self.applied_roi = None
+        self._clear_selection()
+
         # 顯示圖片
         self._display_original()
         self.status_var.set(f"已載入: {os.path.basename(file_path)}")
 
-    def _display_original(self):
-        """顯示原始圖片"""
-        if self.original_image is None:
-            return
-
-        # 計算縮放比例
-        canvas_w = self.canvas_original.winfo_width()
-        canvas_h = self.canvas_original.winfo_height()
+    def _canvas_size(self, canvas):
+        canvas_w = canvas.winfo_width()
+        canvas_h = canvas.winfo_height()
 
         if canvas_w < 10:
             canvas_w = 800
         if canvas_h < 10:
             canvas_h = 600
 
-        h, w = self.original_image.shape[:2]
-        scale_w = canvas_w / w
-        scale_h = canvas_h / h
-        self.scale = min(scale_w, scale_h, 1.0)
+        return canvas_w, canvas_h
+
+    def _render(self, canvas, pyramid):
+        """
+        將影像顯示在畫布上，回傳縮放比例
+        同一張影像且畫布大小沒變時直接沿用上次的 PhotoImage
+        """
+        size = self._canvas_size(canvas)
+        view = getattr(canvas, "view", None)
+        if view is not None and view["pyramid"] is pyramid and view["size"] == size:
+            return view["scale"]
+
+        display, scale = fit_to_canvas(pyramid, *size)
+        photo = ImageTk.PhotoImage(Image.fromarray(display))
+
+        if view is None:
+            item = canvas.create_image(0, 0, image=photo, anchor=tk.NW)
+            canvas.tag_lower(item)
+        else:
+            item = view["item"]
+            canvas.itemconfig(item, image=photo)
+
+        # 保持 photo 參考避免被垃圾回收
+        canvas.view = {"pyramid": pyramid, "size": size, "scale": scale,
+                       "display_size": display.shape[1::-1], "photo": photo, "item": item}
+        return scale
+
+    def _display_original(self):
+        """顯示原始圖片 (只有畫布大小改變時才重新縮放)"""
+        if self.pyramid is None:
+            return
+
+        old_scale = self.scale
+        self.scale = self._render(self.canvas_original, self.pyramid)
+
+        if self.scale != old_scale:
+            self._clear_selection()
+        self._draw_applied_roi()
+        self._draw_template_overlay()
+
+    def _draw_applied_roi(self):
+        """以畫布物件畫出已套用的 ROI"""
+        self.canvas_original.delete("applied")
+        if self.applied_roi is None:
+            return
+
+        x, y, w, h = self.applied_roi
+        s = self.scale
+        self.canvas_original.create_rectangle(
+            x * s, y * s, (x + w) * s, (y + h) * s,
+            outline="lime", width=2, tags="applied"
+        )
 
-        new_w = int(w * self.scale)
-        new_h = int(h * self.scale)
+    def _clear_selection(self):
+        if self.selection_item is not None:
+            self.canvas_original.delete(self.selection_item)
+            self.selection_item = None
 
-        # 縮放圖片
-        display = cv2.resize(self.original_image, (new_w, new_h))
-        display_rgb = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
+    def _on_canvas_resize(self, event):
+        """視窗縮放: 延遲一段時間後重繪，連續的 Configure 事件只處理最後一次"""
+        if self._resize_job is not None:
+            self.root.after_cancel(self._resize_job)
+        self._resize_job = self.root.after(RESIZE_DELAY_MS, self._refresh_canvases)
 
-        self.display_image = display
+    def _refresh_canvases(self):
+        self._resize_job = None
+        self._display_original()
+        for canvas in (self.canvas_roi, self.canvas_inverse):
+            view = getattr(canvas, "view", None)
+            if view is not None:
+                self._render(canvas, view["pyramid"])
+
+    def _clamp_to_image(self, event):
+        """將滑鼠座標限制在顯示的圖片範圍內"""
+        display_w, display_h = self.canvas_original.view["display_size"]
+        return min(max(event.x, 0), display_w), min(max(event.y, 0), display_h)
+
+    def _draw_template_overlay(self):
+        """在原始圖片上畫出範本中的 ROI 與繪製中的多邊形"""
+        self.canvas_original.delete("template")
+        s = self.scale
+
+        for roi in self.template_rois:
+            if roi["type"] == "rect":
+                self.canvas_original.create_rectangle(
+                    roi["x"] * s, roi["y"] * s, (roi["x"] + roi["w"]) * s, (roi["y"] + roi["h"]) * s,
+                    outline="orange", width=2, tags="template"
+                )
+            else:
+                coords = [c * s for point in roi["points"] for c in point]
+                self.canvas_original.create_polygon(
+                    *coords, outline="orange", fill="", width=2, tags="template"
+                )
+
+        if self.polygon_points:
+            coords = [c * s for point in self.polygon_points for c in point]
+            if len(self.polygon_points) > 1:
+                self.canvas_original.create_line(*coords, fill="cyan", width=2, tags="template")
+            for px, py in self.polygon_points:
+                self.canvas_original.create_oval(px * s - 3, py * s - 3, px * s + 3, py * s + 3,
+                                                 fill="cyan", outline="", tags="template")
+
+    def _on_mode_change(self):
+        """切換矩形 / 多邊形模式"""
+        self.polygon_points = []
+        self._draw_template_overlay()
+        if self.draw_mode.get() == "polygon":
+            self.status_var.set("多邊形模式: 左鍵逐點點選，右鍵完成並加入範本")
+        else:
+            self.status_var.set("矩形模式: 拖曳滑鼠選取 ROI")
+
+    def _on_right_click(self, event):
+        """右鍵: 完成多邊形"""
+        if self.draw_mode.get() != "polygon" or self.original_image is None:
+            return
 
-        # 轉換為 Tkinter 格式
-        img = Image.fromarray(display_rgb)
-        self.photo_original = ImageTk.PhotoImage(img)
+        if len(self.polygon_points) < 3:
+            self.status_var.set("多邊形至少需要 3 個點")
+            return
 
-        self.canvas_original.delete("all")
-        self.canvas_original.create_image(0, 0, image=self.photo_original, anchor=tk.NW)
+        self.template_rois.append(make_polygon(self.polygon_points))
+        self.polygon_points = []
+        self._refresh_template_list()
+        self._draw_template_overlay()
+        self.status_var.set(f"已加入多邊形 ROI (範本共 {len(self.template_rois)} 個)")
 
     def _on_mouse_down(self, event):
         """滑鼠按下事件"""
         if self.original_image is None:
             return
 
+        if self.draw_mode.get() == "polygon":
+            # 轉換為原始圖片座標
+            self.polygon_points.append((int(event.x / self.scale), int(event.y / self.scale)))
+            self._draw_template_overlay()
+            return
+
         self.is_drawing = True
-        self.roi_start = (event.x, event.y)
-        self.roi_end = (event.x, event.y)
+        self.roi_start = self._clamp_to_image(event)
+        self.roi_end = self.roi_start
+
+        # 選取框只建立一次，拖曳時移動座標即可
+        if self.selection_item is None:
+            self.selection_item = self.canvas_original.create_rectangle(
+                *self.roi_start, *self.roi_end,
+                outline="lime", width=2, dash=(4, 4)
+            )
+        else:
+            self.canvas_original.coords(self.selection_item, *self.roi_start, *self.roi_end)
 
     def _on_mouse_drag(self, event):
-        """滑鼠拖曳事件"""
-        if not self.is_drawing or self.original_image is None:
+        """滑鼠拖曳事件 (不重新繪製圖片)"""
+        if not self.is_drawing or self.selection_item is None:
             return
 
-        self.roi_end = (event.x, event.y)
-
-        # 重新繪製
-        self._display_original()
-
-        # 繪製選取框
-        x1, y1 = self.roi_start
-        x2, y2 = self.roi_end
-
-        self.canvas_original.create_rectangle(
-            x1, y1, x2, y2,
-            outline="lime", width=2, dash=(4, 4)
-        )
+        self.roi_end = self._clamp_to_image(event)
+        self.canvas_original.coords(self.selection_item, *self.roi_start, *self.roi_end)
 
     def _on_mouse_up(self, event):
         """滑鼠放開事件"""
@@ -269,7 +468,7 @@ class ROIToolGUI:
             return
 
         self.is_drawing = False
-        self.roi_end = (event.x, event.y)
+        self.roi_end = self._clamp_to_image(event)
 
         # 計算 ROI 參數 (轉換回原始圖片座標)
         x1, y1 = self.roi_start
@@ -327,72 +526,144 @@ class ROIToolGUI:
             w = min(w, img_w - x)
             h = min(h, img_h - y)
 
-        # 建立 Mask
-        mask = np.zeros((img_h, img_w), dtype=np.uint8)
-        mask[y:y+h, x:x+w] = 255
+        # 矩形 ROI 直接以切片複製，效果等同 Mask + bitwise_and，但不需建立全圖遮罩
+        roi = self.original_image[y:y+h, x:x+w]
 
         # ROI Mask 結果 (保留 ROI 區域)
-        roi_result = cv2.bitwise_and(self.original_image, self.original_image, mask=mask)
+        roi_result = np.zeros_like(self.original_image)
+        roi_result[y:y+h, x:x+w] = roi
 
         # Inverse Mask 結果 (遮蔽 ROI 區域)
-        inverse_mask = cv2.bitwise_not(mask)
-        inverse_result = cv2.bitwise_and(self.original_image, self.original_image, mask=inverse_mask)
+        inverse_result = self.original_image.copy()
+        inverse_result[y:y+h, x:x+w] = 0
 
         # 儲存結果供儲存使用
         self.roi_result = roi_result
         self.inverse_result = inverse_result
+        self.crop_result = roi
         self.roi_params = (x, y, w, h)
 
         # 顯示結果
         self._display_result(self.canvas_roi, roi_result, "ROI Mask")
         self._display_result(self.canvas_inverse, inverse_result, "Inverse Mask")
 
-        # 更新原始圖片顯示 (加上 ROI 框)
-        self._display_original()
-        x1 = int(x * self.scale)
-        y1 = int(y * self.scale)
-        x2 = int((x + w) * self.scale)
-        y2 = int((y + h) * self.scale)
-
-        self.canvas_original.create_rectangle(
-            x1, y1, x2, y2,
-            outline="lime", width=2
-        )
+        # 更新原始圖片上的 ROI 框 (圖片本身不重繪)
+        self.applied_roi = (x, y, w, h)
+        self._clear_selection()
+        self._draw_applied_roi()
 
         self.status_var.set(f"已套用 ROI: X={x}, Y={y}, W={w}, H={h}")
 
         # 切換到 ROI Mask 分頁
         self.notebook.select(self.tab_roi)
 
-    def _display_result(self, canvas, image, title):
-        """顯示結果圖片"""
-        canvas_w = canvas.winfo_width()
-        canvas_h = canvas.winfo_height()
+    # ========== ROI 範本 ==========
+    def _refresh_template_list(self):
+        self.list_template.delete(0, tk.END)
+        for i, roi in enumerate(self.template_rois, start=1):
+            if roi["type"] == "rect":
+                text = f"{i}. 矩形 ({roi['x']}, {roi['y']}, {roi['w']}, {roi['h']})"
+            else:
+                text = f"{i}. 多邊形 ({len(roi['points'])} 點)"
+            self.list_template.insert(tk.END, text)
+
+    def _add_rect_to_template(self):
+        """將輸入框中的矩形加入範本"""
+        try:
+            x, y = int(self.entry_x.get()), int(self.entry_y.get())
+            w, h = int(self.entry_w.get()), int(self.entry_h.get())
+        except ValueError:
+            messagebox.showerror("錯誤", "請輸入有效的數字")
+            return
 
-        if canvas_w < 10:
-            canvas_w = 800
-        if canvas_h < 10:
-            canvas_h = 600
+        if x < 0 or y < 0 or w <= 0 or h <= 0:
+            messagebox.showerror("錯誤", "ROI 參數必須為正數")
+            return
 
-        h, w = image.shape[:2]
-        scale_w = canvas_w / w
-        scale_h = canvas_h / h
-        scale = min(scale_w, scale_h, 1.0)
+        self.template_rois.append(make_rect(x, y, w, h))
+        self._refresh_template_list()
+        self._draw_template_overlay()
+        self.status_var.set(f"已加入矩形 ROI (範本共 {len(self.template_rois)} 個)")
 
-        new_w = int(w * scale)
-        new_h = int(h * scale)
+    def _remove_template_roi(self):
+        selection = self.list_template.curselection()
+        if not selection:
+            return
 
-        display = cv2.resize(image, (new_w, new_h))
-        display_rgb = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
+        del self.template_rois[selection[0]]
+        self._refresh_template_list()
+        self._draw_template_overlay()
 
-        img = Image.fromarray(display_rgb)
-        photo = ImageTk.PhotoImage(img)
+    def _save_template(self):
+        if not self.template_rois:
+            messagebox.showwarning("警告", "範本中沒有 ROI")
+            return
 
-        canvas.delete("all")
-        canvas.create_image(0, 0, image=photo, anchor=tk.NW)
+        file_path = filedialog.asksaveasfilename(
+            title="儲存 ROI 範本",
+            defaultextension=".json",
+            initialdir=os.path.dirname(TEMPLATE_PATH),
+            initialfile=os.path.basename(TEMPLATE_PATH),
+            filetypes=[("JSON", "*.json")]
+        )
+        if not file_path:
+            return
+
+        image_size = None
+        if self.original_image is not None:
+            h, w = self.original_image.shape[:2]
+            image_size = (w, h)
+
+        save_template(file_path, self.template_rois, image_size)
+        self.status_var.set(f"範本已儲存: {os.path.basename(file_path)} (可用 roi_batch.py 批次套用)")
+
+    def _load_template(self):
+        file_path = filedialog.askopenfilename(
+            title="載入 ROI 範本",
+            initialdir=os.path.dirname(TEMPLATE_PATH),
+            filetypes=[("JSON", "*.json")]
+        )
+        if not file_path:
+            return
+
+        try:
+            self.template_rois = list(load_template(file_path).rois)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("錯誤", f"無法載入範本: {e}")
+            return
+
+        self._refresh_template_list()
+        self._draw_template_overlay()
+        self.status_var.set(f"已載入範本: {os.path.basename(file_path)} ({len(self.template_rois)} 個 ROI)")
 
-        # 保持參考避免被垃圾回收
-        canvas.photo = photo
+    def _apply_template(self):
+        """將範本中的所有 ROI 套用到目前圖片"""
+        if self.original_image is None:
+            messagebox.showwarning("警告", "請先載入圖片")
+            return
+        if not self.template_rois:
+            messagebox.showwarning("警告", "範本中沒有 ROI")
+            return
+
+        template = ROITemplate(self.template_rois)
+        outputs = template.apply(self.original_image, ("mask", "inverse"))
+
+        self.roi_result = outputs["mask"]
+        self.inverse_result = outputs["inverse"]
+
+        # 裁切: 所有 ROI 的外接矩形
+        x, y, w, h = cv2.boundingRect(template.get_masks(self.original_image.shape)["mask"])
+        self.crop_result = self.roi_result[y:y+h, x:x+w]
+
+        self._display_result(self.canvas_roi, self.roi_result, "ROI Mask")
+        self._display_result(self.canvas_inverse, self.inverse_result, "Inverse Mask")
+
+        self.status_var.set(f"已套用範本 ({len(self.template_rois)} 個 ROI)")
+        self.notebook.select(self.tab_roi)
+
+    def _display_result(self, canvas, image, title):
+        """顯示結果圖片 (建立金字塔後，視窗縮放時不再處理原始解析度的結果)"""
+        self._render(canvas, build_pyramid(image))
 
     def _save_result(self, result_type):
         """儲存結果"""
@@ -416,8 +687,7 @@ class ROIToolGUI:
             default_name += "_inverse_mask.png"
             title = "儲存 Inverse Mask 結果"
         elif result_type == "crop":
-            x, y, w, h = self.roi_params
-            save_image = self.original_image[y:y+h, x:x+w]
+            save_image = self.crop_result
             default_name += "_crop.png"
             title = "儲存 ROI 裁切區域"
 
@@ -0,0 +1,160 @@
+"""
+CPU 訓練效能測試
+比較不同最佳化組合的訓練速度 (samples/sec)，協助選擇訓練腳本設定區的參數
+
+測試組合:
+- fp32 / bfloat16 autocast
+- 預設記憶體格式 / channels-last
+- 是否 torch.compile (--compile)
+- 不同執行緒數 (--threads)
+
+使用方式:
+python benchmark_cpu_training.py
+python benchmark_cpu_training.py --model coin --batch-size 32 --threads 4,8 --compile
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torchvision import models
+
+# ============== 取得腳本所在目錄 ==============
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(SCRIPT_DIR, "03_Custom"))
+
+from train_utils import autocast, bf16_supported, configure_threads, optimize_model, to_channels_last
+from train_coin import CoinCNN
+
+DEVICE = torch.device("cpu")
+
+
+# ============== 模型 ==============
+def build_catdog_resnet(num_classes=2):
+    """與 02_CatDog/train.py 相同結構的 ResNet18 (凍結骨幹，不下載預訓練權重)"""
+    model = models.resnet18(weights=None)
+
+    for param in model.parameters():
+        param.requires_grad = False
+
+    model.fc = nn.Sequential(
+        nn.Linear(model.fc.in_features, 256),
+        nn.ReLU(),
+        nn.Dropout(0.5),
+        nn.Linear(256, num_classes)
+    )
+    return model
+
+
+MODEL_BUILDERS = {
+    "coin": lambda: CoinCNN(num_classes=2),
+    "catdog": build_catdog_resnet,
+}
+
+
+# ============== 效能測試 ==============
+def benchmark(model_name, batch_size, image_size, steps, warmup,
+              use_bf16, channels_last, compile_model):
+    """執行數個訓練步驟，回傳 samples/sec"""
+    torch.manual_seed(0)
+    model = MODEL_BUILDERS[model_name]().to(DEVICE)
+    model, run_model = optimize_model(model, channels_last, compile_model)
+    model.train()
+
+    params = [p for p in model.parameters() if p.requires_grad]
+    optimizer = optim.Adam(params, lr=1e-3)
+    criterion = nn.CrossEntropyLoss()
+
+    data = torch.randn(batch_size, 3, image_size, image_size)
+    data = to_channels_last(data, channels_last)
+    target = torch.randint(0, 2, (batch_size,))
+
+    def step():
+        optimizer.zero_grad()
+        with autocast(DEVICE, use_bf16):
+            output = run_model(data)
+            loss = criterion(output, target)
+        loss.backward()
+        optimizer.step()
+
+    # 暖機 (compile 的編譯時間也在這裡)
+    for _ in range(warmup):
+        step()
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        step()
+    elapsed = time.perf_counter() - start
+
+    return batch_size * steps / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CPU 訓練效能測試')
+    parser.add_argument('--model', type=str, default='all',
+                        choices=['all'] + list(MODEL_BUILDERS),
+                        help='測試的模型')
+    parser.add_argument('--batch-size', type=int, default=32, help='批次大小')
+    parser.add_argument('--image-size', type=int, default=224, help='影像大小')
+    parser.add_argument('--steps', type=int, default=10, help='計時的訓練步數')
+    parser.add_argument('--warmup', type=int, default=3, help='暖機步數')
+    parser.add_argument('--threads', type=str, default=None,
+                        help='逗號分隔的執行緒數，例如 2,4,8 (預設: PyTorch 預設值)')
+    parser.add_argument('--compile', action='store_true',
+                        help='同時測試 torch.compile')
+    args = parser.parse_args()
+
+    model_names = list(MODEL_BUILDERS) if args.model == 'all' else [args.model]
+    thread_counts = ([int(t) for t in args.threads.split(',')]
+                     if args.threads else [torch.get_num_threads()])
+
+    configs = []
+    for use_bf16 in ([False, True] if bf16_supported(DEVICE) else [False]):
+        for channels_last in (False, True):
+            for compile_model in ([False, True] if args.compile else [False]):
+                configs.append((use_bf16, channels_last, compile_model))
+
+    print("=" * 70)
+    print("CPU 訓練效能測試")
+    print("=" * 70)
+    print(f"PyTorch: {torch.__version__}")
+    print(f"CPU bfloat16: {'支援' if bf16_supported(DEVICE) else '不支援 (只測試 fp32)'}")
+    print(f"批次大小: {args.batch_size} | 影像大小: {args.image_size} | 計時步數: {args.steps}")
+    print()
+
+    for model_name in model_names:
+        print(f"[{model_name}]")
+        print(f"{'執行緒':>6} {'精度':>6} {'channels-last':>14} {'compile':>8} {'samples/sec':>12}")
+        print("-" * 70)
+
+        results = []
+        for threads in thread_counts:
+            configure_threads(threads)
+            for use_bf16, channels_last, compile_model in configs:
+                try:
+                    speed = benchmark(model_name, args.batch_size, args.image_size,
+                                      args.steps, args.warmup,
+                                      use_bf16, channels_last, compile_model)
+                except Exception as e:
+                    print(f"{threads:>6} 失敗: {e}")
+                    continue
+
+                results.append((speed, threads, use_bf16, channels_last, compile_model))
+                print(f"{threads:>6} {'bf16' if use_bf16 else 'fp32':>6} "
+                      f"{str(channels_last):>14} {str(compile_model):>8} {speed:>12.1f}")
+
+        if results:
+            speed, threads, use_bf16, channels_last, compile_model = max(results)
+            print("-" * 70)
+            print(f"最快設定: NUM_THREADS = {threads}, USE_BF16 = {use_bf16}, "
+                  f"CHANNELS_LAST = {channels_last}, COMPILE_MODEL = {compile_model} "
+                  f"({speed:.1f} samples/sec)")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+將訓練好的 PyTorch 模型匯出為 ONNX
+匯出後可用 onnx_backend.py 以 onnxruntime / OpenCV DNN 推論，不需要載入 PyTorch
+
+支援模型:
+- coin:   03_Custom 硬幣正反面 CoinCNN    (models/coin_classifier.pth)
+- mnist:  01_MNIST 手寫數字 SimpleCNN     (models/mnist_cnn.pth)
+- catdog: 02_CatDog 貓狗 ResNet18         (models/catdog_model.pth)
+
+輸出 (與 .pth 同目錄):
+- xxx.onnx  模型 (batch 維度為動態)
+- xxx.json  預處理設定與類別名稱 (onnx_backend.py 讀取)
+
+使用方式:
+python export_onnx.py                 # 匯出所有已訓練的模型
+python export_onnx.py --model coin    # 只匯出硬幣模型
+python export_onnx.py --check         # 匯出後比對 PyTorch 與 ONNX 的輸出
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+# ============== 取得腳本所在目錄 ==============
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(SCRIPT_DIR, "models")
+sys.path.append(os.path.join(SCRIPT_DIR, "03_Custom"))
+
+# ============== 設定區 ==============
+OPSET_VERSION = 17
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+def load_module(name, relative_path):
+    """依路徑載入各單元的預測腳本 (01_MNIST 與 02_CatDog 的檔名都是 predict.py)"""
+    path = os.path.join(SCRIPT_DIR, relative_path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ============== 各模型的載入方式 ==============
+def load_coin(model_path):
+    """回傳 (模型, 設定檔內容)"""
+    checkpoint = torch.load(model_path, map_location="cpu", weights_only=False)
+    module = load_module("predict_coin", os.path.join("03_Custom", "predict_coin.py"))
+
+    class_names = checkpoint['class_names']
+    model = module.CoinCNN(num_classes=len(class_names))
+    model.load_state_dict(checkpoint['model_state_dict'])
+
+    return model, {
+        "class_names": class_names,
+        "input_size": checkpoint.get('image_size', module.IMAGE_SIZE),
+        "color_mode": "RGB",
+        "mean": IMAGENET_MEAN,
+        "std": IMAGENET_STD,
+    }
+
+
+def load_mnist(model_path):
+    checkpoint = torch.load(model_path, map_location="cpu", weights_only=False)
+    module = load_module("mnist_predict", os.path.join("01_MNIST", "predict.py"))
+
+    model = module.SimpleCNN()
+    model.load_state_dict(checkpoint['model_state_dict'])
+
+    return model, {
+        "class_names": [str(i) for i in range(10)],
+        "input_size": 28,
+        "color_mode": "L",
+        "mean": [0.1307],
+        "std": [0.3081],
+    }
+
+
+def load_catdog(model_path):
+    checkpoint = torch.load(model_path, map_location="cpu", weights_only=False)
+    module = load_module("catdog_predict", os.path.join("02_CatDog", "predict.py"))
+
+    classes = checkpoint['classes']
+    model = module.get_model(num_classes=len(classes))
+    model.load_state_dict(checkpoint['model_state_dict'])
+
+    return model, {
+        "class_names": classes,
+        "input_size": module.IMAGE_SIZE,
+        "color_mode": "RGB",
+        "mean": IMAGENET_MEAN,
+        "std": IMAGENET_STD,
+    }
+
+
+MODELS = {
+    "coin": (os.path.join(MODEL_DIR, "coin_classifier.pth"), load_coin),
+    "mnist": (os.path.join(MODEL_DIR, "mnist_cnn.pth"), load_mnist),
+    "catdog": (os.path.join(MODEL_DIR, "catdog_model.pth"), load_catdog),
+}
+
+
+# ============== 匯出 ==============
+def export_model(name, model_path, opset=OPSET_VERSION):
+    """匯出單一模型，回傳 (.onnx 路徑, PyTorch 模型, 輸入通道數, 輸入大小)"""
+    loader = MODELS[name][1]
+    model, config = loader(model_path)
+    model.eval()
+
+    channels = 1 if config["color_mode"] == "L" else 3
+    size = config["input_size"]
+    dummy = torch.randn(1, channels, size, size)
+
+    onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+    tmp_path = onnx_path + ".tmp"
+
+    torch.onnx.export(
+        model, dummy, tmp_path,
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+    )
+    os.replace(tmp_path, onnx_path)
+
+    config["model"] = name
+    config["source"] = os.path.basename(model_path)
+    with open(os.path.splitext(onnx_path)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+    print(f"  已匯出: {onnx_path}")
+    return onnx_path, model, channels, size
+
+
+def check_model(onnx_path, model, channels, size, batch_size=8, repeats=20):
+    """比對 PyTorch 與 ONNX 輸出，並比較單張推論時間"""
+    from onnx_backend import create_session
+
+    dummy = torch.randn(batch_size, channels, size, size)
+    with torch.inference_mode():
+        expected = model(dummy).numpy()
+
+    session, backend = create_session(onnx_path)
+    actual = np.asarray(session.run(dummy.numpy()))
+    max_diff = float(np.abs(expected - actual).max())
+    print(f"  [{backend}] 最大誤差: {max_diff:.2e}")
+
+    single = dummy[:1]
+    with torch.inference_mode():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(single)
+        torch_ms = (time.perf_counter() - start) / repeats * 1000
+
+    single_np = single.numpy()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        session.run(single_np)
+    onnx_ms = (time.perf_counter() - start) / repeats * 1000
+
+    print(f"  單張推論: PyTorch {torch_ms:.2f} ms | {backend} {onnx_ms:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='匯出 ONNX 模型')
+    parser.add_argument('--model', type=str, default='all',
+                        choices=['all'] + list(MODELS),
+                        help='要匯出的模型')
+    parser.add_argument('--path', type=str, default=None,
+                        help='模型檔案路徑 (只匯出單一模型時使用)')
+    parser.add_argument('--opset', type=int, default=OPSET_VERSION,
+                        help='ONNX opset 版本')
+    parser.add_argument('--check', action='store_true',
+                        help='匯出後比對 PyTorch 與 ONNX 輸出')
+    args = parser.parse_args()
+
+    names = list(MODELS) if args.model == 'all' else [args.model]
+
+    print("=" * 50)
+    print("匯出 ONNX 模型")
+    print("=" * 50)
+
+    for name in names:
+        model_path = args.path if args.path and args.model != 'all' else MODELS[name][0]
+        print(f"[{name}] {model_path}")
+
+        if not os.path.exists(model_path):
+            print("  找不到模型檔案，略過 (請先訓練模型)")
+            continue
+
+        onnx_path, model, channels, size = export_model(name, model_path, args.opset)
+        if args.check:
+            try:
+                check_model(onnx_path, model, channels, size)
+            except ImportError as e:
+                print(f"  無法比對: {e}")
+
+
+if __name__ == "__main__":
+    main()
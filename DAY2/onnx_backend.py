@@ -0,0 +1,168 @@
+"""
+ONNX 推論後端 (不需要 PyTorch)
+載入 export_onnx.py 匯出的模型 (.onnx + 同名 .json 設定檔)，以 onnxruntime 或 OpenCV DNN 在 CPU 上推論
+
+預處理與輸出和 PyTorch 版本相同:
+- 縮放到 input_size x input_size (PIL 雙線性，與 transforms.Resize 相同)
+- 轉為 0~1 浮點數後以 mean / std 正規化
+- 輸出 logits，predict() 回傳 (類別名稱, 信心度, 各類別機率)
+
+使用方式:
+from onnx_backend import OnnxClassifier
+classifier = OnnxClassifier("models/coin_classifier.onnx")
+pred_class, confidence, probs = classifier.predict(pil_image)
+
+需要安裝其中一個:
+pip install onnxruntime
+pip install opencv-python
+"""
+
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+# ============== 設定區 ==============
+# "auto": 有 onnxruntime 就用，否則用 OpenCV DNN
+BACKEND = "auto"
+NUM_THREADS = 0          # onnxruntime 執行緒數 (0 = 預設值)
+
+BACKENDS = ("auto", "onnxruntime", "opencv")
+
+
+# ============== 設定檔 ==============
+def get_sidecar_path(model_path):
+    """模型設定檔路徑 (與 .onnx 同名的 .json)"""
+    return os.path.splitext(model_path)[0] + ".json"
+
+
+def load_sidecar(model_path):
+    """讀取匯出時寫入的預處理與類別設定"""
+    sidecar_path = get_sidecar_path(model_path)
+    if not os.path.exists(sidecar_path):
+        raise FileNotFoundError(
+            f"找不到模型設定檔: {sidecar_path}\n"
+            "請使用 export_onnx.py 重新匯出模型"
+        )
+
+    with open(sidecar_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+# ============== 執行後端 ==============
+class _OnnxRuntimeSession:
+    def __init__(self, model_path, num_threads=NUM_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class _OpenCVSession:
+    def __init__(self, model_path, num_threads=NUM_THREADS):
+        import cv2
+
+        if num_threads:
+            cv2.setNumThreads(num_threads)
+
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def run(self, batch):
+        self.net.setInput(batch)
+        return self.net.forward()
+
+
+def create_session(model_path, backend=BACKEND, num_threads=NUM_THREADS):
+    """建立推論 session，回傳 (session, 實際使用的後端名稱)"""
+    if backend not in BACKENDS:
+        raise ValueError(f"不支援的後端: {backend} (可用: {', '.join(BACKENDS)})")
+
+    if backend in ("auto", "onnxruntime"):
+        try:
+            return _OnnxRuntimeSession(model_path, num_threads), "onnxruntime"
+        except ImportError:
+            if backend == "onnxruntime":
+                raise ImportError("需要安裝 onnxruntime (pip install onnxruntime)")
+
+    try:
+        return _OpenCVSession(model_path, num_threads), "opencv"
+    except ImportError:
+        raise ImportError("需要安裝 onnxruntime 或 opencv-python 才能使用 ONNX 模型")
+
+
+# ============== 分類器 ==============
+class OnnxClassifier:
+    """
+    ONNX 影像分類器，與 PyTorch 版本相同的預處理與輸出
+
+    Args:
+        model_path: .onnx 模型路徑 (同目錄需有同名 .json 設定檔)
+        backend: "auto" / "onnxruntime" / "opencv"
+    """
+
+    def __init__(self, model_path, backend=BACKEND, num_threads=NUM_THREADS):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"找不到模型檔案: {model_path}\n"
+                "請先執行 export_onnx.py 匯出模型"
+            )
+
+        config = load_sidecar(model_path)
+        self.class_names = config["class_names"]
+        self.image_size = config["input_size"]
+        self.color_mode = config["color_mode"]      # "RGB" 或 "L"
+        self.mean = np.array(config["mean"], dtype=np.float32).reshape(1, -1, 1, 1)
+        self.std = np.array(config["std"], dtype=np.float32).reshape(1, -1, 1, 1)
+
+        self.session, self.backend = create_session(model_path, backend, num_threads)
+
+    def preprocess(self, images):
+        """
+        PIL Image (或 RGB ndarray) 列表 -> (N, C, H, W) float32 batch
+        """
+        arrays = []
+        for image in images:
+            if isinstance(image, np.ndarray):
+                image = Image.fromarray(image)
+            image = image.convert(self.color_mode).resize(
+                (self.image_size, self.image_size), Image.Resampling.BILINEAR
+            )
+            array = np.asarray(image, dtype=np.float32) / 255.0
+            if array.ndim == 2:
+                array = array[:, :, None]
+            arrays.append(array.transpose(2, 0, 1))
+
+        batch = np.stack(arrays)
+        return np.ascontiguousarray((batch - self.mean) / self.std, dtype=np.float32)
+
+    def run(self, batch):
+        """執行模型，輸入已預處理的 batch，回傳 logits"""
+        return np.asarray(self.session.run(np.ascontiguousarray(batch, dtype=np.float32)))
+
+    def predict_proba(self, images):
+        """影像列表 -> (N, 類別數) 機率"""
+        return softmax(self.run(self.preprocess(images)))
+
+    def predict(self, image):
+        """預測單張影像，回傳 (類別名稱, 信心度, 各類別機率)"""
+        probs = self.predict_proba([image])[0]
+        idx = int(probs.argmax())
+        return self.class_names[idx], float(probs[idx]), probs
@@ -0,0 +1,217 @@
+"""
+DAY2 共用訓練工具
+MNIST / 貓狗 / 硬幣 三個訓練腳本共用的功能
+
+CPU 最佳化訓練:
+- bfloat16 autocast (僅 CPU，且支援 AVX512-BF16 / AMX 時才啟用；GPU 訓練不受影響)
+- channels-last 記憶體格式 (oneDNN 卷積較快)
+- torch.compile (可選)
+- 運算執行緒數設定
+
+訓練狀態檢查點:
+- 完整訓練狀態 (模型、優化器、學習率調度器、亂數狀態、epoch、訓練歷史)
+- 先寫入暫存檔再改名，中斷時不會留下損壞的檔案
+- 依驗證指標的早停 (Early Stopping)
+
+使用方式 (在訓練腳本中):
+sys.path.append(os.path.join(SCRIPT_DIR, ".."))
+from train_utils import autocast, configure_threads, optimize_model, to_channels_last
+"""
+
+import contextlib
+import os
+import random
+
+import numpy as np
+import torch
+
+
+# ============== CPU 最佳化 ==============
+def configure_threads(num_threads=None, num_interop_threads=None):
+    """設定 PyTorch 運算執行緒數 (None 表示使用預設值)，回傳目前執行緒數"""
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError:
+            # 只能在第一次平行運算之前設定
+            print("警告: interop 執行緒數已無法變更")
+
+    return torch.get_num_threads()
+
+
+def bf16_supported(device):
+    """
+    CPU 是否支援 bfloat16 運算
+    bfloat16 autocast 是 CPU 訓練模式；GPU 一律回傳 False，維持原本的 fp32 訓練
+    """
+    if device.type != "cpu":
+        return False
+
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def autocast(device, enabled=True):
+    """bfloat16 自動混合精度；裝置不支援或未啟用時不做任何事"""
+    if enabled and bf16_supported(device):
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def optimize_model(model, channels_last=False, compile_model=False):
+    """
+    套用記憶體格式與編譯設定
+
+    Returns:
+        model: 原始模型 (用於 state_dict 儲存)
+        run_model: 用於前向傳播的模型 (compile 時為編譯後的版本)
+    """
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+
+    run_model = model
+    if compile_model:
+        if hasattr(torch, "compile"):
+            run_model = torch.compile(model)
+        else:
+            print("警告: 此版本 PyTorch 不支援 torch.compile，略過編譯")
+
+    return model, run_model
+
+
+def to_channels_last(data, enabled=True):
+    """將 4 維影像 batch 轉為 channels-last"""
+    if enabled and data.dim() == 4:
+        return data.contiguous(memory_format=torch.channels_last)
+    return data
+
+
+def describe_cpu_options(device, use_bf16, channels_last, compile_model):
+    """訓練開始前顯示的最佳化設定摘要"""
+    bf16 = "啟用" if use_bf16 and bf16_supported(device) else "停用"
+    if use_bf16 and not bf16_supported(device):
+        bf16 += " (僅支援 CPU)" if device.type != "cpu" else " (CPU 不支援)"
+
+    return (f"bfloat16: {bf16} | channels-last: {'啟用' if channels_last else '停用'} | "
+            f"compile: {'啟用' if compile_model else '停用'} | 執行緒: {torch.get_num_threads()}")
+
+
+# ============== 訓練狀態檢查點 ==============
+def atomic_save(obj, path):
+    """torch.save 到暫存檔後再改名 (同一檔案系統上為原子操作)"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def get_rng_state():
+    """收集 Python / NumPy / PyTorch 亂數狀態"""
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    """還原 get_rng_state() 的亂數狀態"""
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"].cpu())
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all([s.cpu() for s in state["cuda"]])
+
+
+def save_training_state(path, model, optimizer, scheduler, epoch, history, **extra):
+    """
+    儲存完整訓練狀態，可用 load_training_state() 從下一個 epoch 繼續
+
+    Args:
+        scheduler: 學習率調度器 (沒有時傳 None)
+        history: 訓練歷史 (例如各 epoch 的 loss / accuracy 列表)
+        extra: 其他要一併儲存的資料 (例如最佳準確率、早停狀態)
+    """
+    atomic_save({
+        "epoch": epoch,
+        "model_state_dict": model.state_dict(),
+        "optimizer_state_dict": optimizer.state_dict(),
+        "scheduler_state_dict": scheduler.state_dict() if scheduler is not None else None,
+        "history": history,
+        "rng_state": get_rng_state(),
+        "extra": extra,
+    }, path)
+
+
+def load_training_state(path, model, optimizer, scheduler=None, device="cpu"):
+    """
+    載入 save_training_state() 的檢查點
+
+    Returns:
+        epoch: 已完成的最後一個 epoch
+        history: 訓練歷史
+        extra: 額外儲存的資料
+    """
+    checkpoint = torch.load(path, map_location=device, weights_only=False)
+
+    model.load_state_dict(checkpoint["model_state_dict"])
+    optimizer.load_state_dict(checkpoint["optimizer_state_dict"])
+    if scheduler is not None and checkpoint["scheduler_state_dict"] is not None:
+        scheduler.load_state_dict(checkpoint["scheduler_state_dict"])
+    set_rng_state(checkpoint["rng_state"])
+
+    return checkpoint["epoch"], checkpoint["history"], checkpoint["extra"]
+
+
+class EarlyStopping:
+    """
+    早停: 指標連續 patience 個 epoch 沒有進步就停止訓練
+
+    Args:
+        patience: 容忍沒進步的 epoch 數 (0 表示停用)
+        mode: "max" (例如準確率) 或 "min" (例如 loss)
+        min_delta: 視為進步的最小變化量
+    """
+
+    def __init__(self, patience=5, mode="max", min_delta=0.0):
+        self.patience = patience
+        self.mode = mode
+        self.min_delta = min_delta
+        self.best = None
+        self.num_bad_epochs = 0
+
+    def step(self, value):
+        """記錄本 epoch 的指標，回傳是否為目前最佳"""
+        if self.best is None:
+            improved = True
+        elif self.mode == "max":
+            improved = value > self.best + self.min_delta
+        else:
+            improved = value < self.best - self.min_delta
+
+        if improved:
+            self.best = value
+            self.num_bad_epochs = 0
+        else:
+            self.num_bad_epochs += 1
+
+        return improved
+
+    @property
+    def should_stop(self):
+        return self.patience > 0 and self.num_bad_epochs >= self.patience
+
+    def state_dict(self):
+        return {"best": self.best, "num_bad_epochs": self.num_bad_epochs}
+
+    def load_state_dict(self, state):
+        self.best = state["best"]
+        self.num_bad_epochs = state["num_bad_epochs"]
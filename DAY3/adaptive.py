@@ -0,0 +1,126 @@
+"""
+自適應畫質控制 (yolo_gui.py 影片 / 攝影機迴圈使用)
+CPU 跟不上時依序降低推論解析度 (imgsz)、再改為每隔幾張畫面才推論一次，
+讓每張畫面的處理時間維持在目標 FPS 的預算內；有餘裕時再逐級恢復畫質
+
+跳過推論的畫面沿用上一次的偵測結果繪製，畫面仍然流暢
+
+使用方式:
+controller = AdaptiveController(target_fps=15)
+for frame in frames:
+    start = time.perf_counter()
+    if controller.should_infer():
+        t = time.perf_counter()
+        results = model.predict(frame, imgsz=controller.imgsz)
+        controller.record_inference(time.perf_counter() - t)
+    ...
+    controller.record_frame(time.perf_counter() - start)
+
+作者: AI Course
+日期: 2024
+"""
+
+# ============== 設定區 ==============
+# 畫質等級 (imgsz, 兩次推論之間跳過的畫面數)，由高到低
+QUALITY_LEVELS = [
+    (640, 0),
+    (512, 0),
+    (416, 0),
+    (320, 0),
+    (320, 1),
+    (320, 2),
+    (320, 3),
+]
+EMA_ALPHA = 0.2             # 時間平均的平滑係數
+COOLDOWN_FRAMES = 15        # 切換等級後至少經過幾張畫面才再次調整 (避免來回跳動)
+SLOW_MARGIN = 1.1           # 處理時間超過預算的此倍數時降級
+HEADROOM = 0.85             # 預估升級後的處理時間低於預算的此倍數時升級
+
+
+def _ema(old, value, alpha=EMA_ALPHA):
+    return value if old is None else old + alpha * (value - old)
+
+
+class AdaptiveController:
+    """依實測的處理時間調整推論解析度與跳幀數"""
+
+    def __init__(self, target_fps: float = 0, levels: list = QUALITY_LEVELS,
+                 cooldown: int = COOLDOWN_FRAMES):
+        self.target_fps = target_fps     # 0 表示關閉 (固定最高畫質)
+        self.levels = levels
+        self.cooldown = cooldown
+        self.level = 0
+
+        self._frame_time = None          # 每張畫面處理時間 (不含讀取) 的平均
+        self._infer_time = {}            # imgsz -> 單次推論時間的平均
+        self._since_change = 0
+        self._counter = 0
+
+    @property
+    def imgsz(self) -> int:
+        return self.levels[self.level][0]
+
+    @property
+    def skip(self) -> int:
+        return self.levels[self.level][1]
+
+    def should_infer(self) -> bool:
+        """這張畫面是否要推論 (否則沿用上一次的結果)"""
+        infer = self._counter % (self.skip + 1) == 0
+        self._counter += 1
+        return infer
+
+    def record_inference(self, seconds: float):
+        self._infer_time[self.imgsz] = _ema(self._infer_time.get(self.imgsz), seconds)
+
+    def record_frame(self, seconds: float):
+        """記錄一張畫面的處理時間並視需要調整等級"""
+        self._frame_time = _ema(self._frame_time, seconds)
+        self._since_change += 1
+        self._adjust()
+
+    def _set_level(self, level: int):
+        self.level = level
+        self._since_change = 0
+        self._counter = 0
+
+    def _adjust(self):
+        if not self.target_fps:
+            if self.level != 0:
+                self._set_level(0)
+            return
+
+        if self._since_change < self.cooldown:
+            return
+
+        budget = 1.0 / self.target_fps
+        if self._frame_time > budget * SLOW_MARGIN and self.level < len(self.levels) - 1:
+            self._set_level(self.level + 1)
+        elif self.level > 0 and self._predict_frame_time(self.level - 1) < budget * HEADROOM:
+            self._set_level(self.level - 1)
+
+    def _predict_frame_time(self, level: int) -> float:
+        """
+        預估某等級每張畫面的處理時間
+        = 目前的非推論開銷 + 該 imgsz 的推論時間 / (跳幀數 + 1)
+        尚未量測過的 imgsz 依像素數比例 (imgsz 平方) 由目前的推論時間推估
+        """
+        current = self._infer_time.get(self.imgsz, 0.0)
+        overhead = max(self._frame_time - current / (self.skip + 1), 0.0)
+
+        imgsz, skip = self.levels[level]
+        infer = self._infer_time.get(imgsz)
+        if infer is None:
+            infer = current * (imgsz / self.imgsz) ** 2
+
+        return overhead + infer / (skip + 1)
+
+    def describe(self) -> str:
+        """目前模式 (顯示在 Dashboard)"""
+        if not self.target_fps:
+            return f"固定畫質: imgsz {self.imgsz}"
+
+        text = f"自適應 ({self.target_fps:.0f} FPS): imgsz {self.imgsz}"
+        if self.skip:
+            text += f"，每 {self.skip + 1} 張推論 1 次"
+        return text
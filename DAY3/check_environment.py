@@ -2,13 +2,42 @@
 YOLOv11 環境檢查腳本
 檢查 GPU、CUDA、PyTorch 及相關套件是否正確安裝
 
+--json 輸出機器可讀的硬體與效能設定檔 (CPU 核心數、SIMD 指令集、OpenCV 執行緒 / IPP、
+PyTorch 執行緒設定，以及 HoughCircles、CLAHE、CoinCNN、YOLO 的計時)，
+其他工具可讀取此檔案自動選擇執行緒數、imgsz 與 batch size
+
+使用方式:
+python check_environment.py
+python check_environment.py --json                      # 輸出到 stdout
+python check_environment.py --json env_profile.json     # 存檔
+
 作者: AI Course
 日期: 2024
 """
 
+import argparse
+import contextlib
+import json
+import os
 import sys
 import platform
 import subprocess
+import time
+
+# ============== 設定區 ==============
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+COIN_DIR = os.path.join(SCRIPT_DIR, "..", "DAY2", "03_Custom")    # CoinCNN 所在目錄
+BENCH_WARMUP = 3
+BENCH_RUNS = 20
+BENCH_FRAME_SIZE = (720, 1280)       # HoughCircles / CLAHE 測試畫面 (高, 寬)
+COIN_CNN_SIZE = 224
+COIN_CNN_BATCHES = [1, 8]
+YOLO_IMGSZ = [320, 480, 640]
+TARGET_FPS = 15                      # 推薦 imgsz 時的目標 FPS
+
+# OpenCV 可偵測的 SIMD 指令集
+SIMD_FEATURES = ["SSE2", "SSE4_1", "SSE4_2", "POPCNT", "AVX", "AVX2", "FMA3",
+                 "AVX_512F", "AVX512_SKX", "NEON"]
 
 
 def print_header(title: str):
@@ -267,6 +296,238 @@ def test_yolo_model():
         print_item("YOLO 測試", f"失敗: {e}", "error")
 
 
+# ============== 硬體與效能設定檔 (--json) ==============
+def time_call(fn, runs: int = BENCH_RUNS, warmup: int = BENCH_WARMUP) -> dict:
+    """暖機後重複執行 fn，回傳毫秒統計"""
+    for _ in range(warmup):
+        fn()
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+
+    times.sort()
+    return {
+        "mean_ms": round(sum(times) / len(times), 3),
+        "p50_ms": round(times[len(times) // 2], 3),
+        "min_ms": round(times[0], 3),
+        "runs": runs,
+    }
+
+
+def cpu_profile() -> dict:
+    """CPU 核心數與 SIMD 指令集"""
+    info = {
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "logical_cores": os.cpu_count(),
+        "physical_cores": None,
+        "simd": {},
+    }
+
+    if not info["processor"] and os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo", "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    info["processor"] = line.split(":", 1)[1].strip()
+                    break
+
+    try:
+        import psutil
+        info["physical_cores"] = psutil.cpu_count(logical=False)
+    except ImportError:
+        pass
+
+    try:
+        import cv2
+        info["simd"] = {name: bool(cv2.checkHardwareSupport(getattr(cv2, f"CPU_{name}")))
+                        for name in SIMD_FEATURES if hasattr(cv2, f"CPU_{name}")}
+    except ImportError:
+        pass
+
+    try:
+        import torch
+        # PyTorch 實際使用的向量指令等級 (例如 AVX2 / AVX512)
+        info["torch_capability"] = torch.backends.cpu.get_cpu_capability()
+    except (ImportError, AttributeError):
+        pass
+
+    return info
+
+
+def opencv_profile() -> dict:
+    """OpenCV 版本、執行緒與 IPP"""
+    try:
+        import cv2
+    except ImportError:
+        return {"installed": False}
+
+    info = {
+        "installed": True,
+        "version": cv2.__version__,
+        "threads": cv2.getNumThreads(),
+        "cpus": cv2.getNumberOfCPUs(),
+        "optimized": cv2.useOptimized(),
+        "ipp": cv2.ipp.useIPP(),
+        "ipp_version": cv2.ipp.getIppVersion() if cv2.ipp.useIPP() else None,
+    }
+
+    # 平行運算框架 (TBB / OpenMP / pthreads ...) 與 CUDA
+    for line in cv2.getBuildInformation().splitlines():
+        line = line.strip()
+        if line.startswith("Parallel framework:"):
+            info["parallel_framework"] = line.split(":", 1)[1].strip()
+        elif line.startswith("NVIDIA CUDA:"):
+            info["cuda"] = line.split(":", 1)[1].strip().startswith("YES")
+
+    return info
+
+
+def torch_profile() -> dict:
+    """PyTorch 執行緒設定與後端"""
+    try:
+        import torch
+    except ImportError:
+        return {"installed": False}
+
+    info = {
+        "installed": True,
+        "version": torch.__version__,
+        "threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads(),
+        "mkldnn": torch.backends.mkldnn.is_available(),
+        "openmp": torch.backends.openmp.is_available(),
+        "cuda": torch.cuda.is_available(),
+        "gpus": [torch.cuda.get_device_name(i) for i in range(torch.cuda.device_count())],
+    }
+
+    try:
+        info["bf16"] = bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        info["bf16"] = False
+
+    return info
+
+
+def benchmark_opencv(runs: int = BENCH_RUNS) -> dict:
+    """HoughCircles 與 CLAHE (參數與 ocs_system 的 ImageProcessor 相同)"""
+    import cv2
+    import numpy as np
+
+    # 合成畫面: 灰階背景上幾個不同半徑的圓
+    h, w = BENCH_FRAME_SIZE
+    rng = np.random.default_rng(0)
+    gray = rng.integers(90, 110, size=(h, w), dtype=np.uint8)
+    for i in range(12):
+        center = (int(100 + (i % 6) * 200), int(180 + (i // 6) * 320))
+        cv2.circle(gray, center, int(40 + (i % 4) * 15), 200, -1)
+
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    blurred = cv2.GaussianBlur(gray, (9, 9), 2)
+
+    def hough():
+        cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1, minDist=80,
+                         param1=60, param2=35, minRadius=30, maxRadius=95)
+
+    return {
+        "frame": [h, w],
+        "hough_circles": time_call(hough, runs),
+        "clahe": time_call(lambda: clahe.apply(gray), runs),
+    }
+
+
+def benchmark_coin_cnn(runs: int = BENCH_RUNS) -> dict:
+    """DAY2 CoinCNN 前向傳播 (CPU，不同 batch)"""
+    import torch
+
+    sys.path.append(os.path.join(COIN_DIR, ".."))
+    sys.path.append(COIN_DIR)
+    from train_coin import CoinCNN
+
+    model = CoinCNN(num_classes=2).eval()
+    results = {"input": COIN_CNN_SIZE}
+
+    with torch.no_grad():
+        for batch in COIN_CNN_BATCHES:
+            data = torch.randn(batch, 3, COIN_CNN_SIZE, COIN_CNN_SIZE)
+            stats = time_call(lambda: model(data), runs)
+            stats["images_per_sec"] = round(batch * 1000 / stats["p50_ms"], 2)
+            results[f"batch_{batch}"] = stats
+
+    return results
+
+
+def benchmark_yolo(device: str, runs: int = BENCH_RUNS) -> dict:
+    """yolo11n 不同 imgsz 的單張推論"""
+    import numpy as np
+    from ultralytics import YOLO
+
+    model = YOLO("yolo11n.pt")
+    frame = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+
+    results = {"model": "yolo11n.pt", "device": device}
+    for imgsz in YOLO_IMGSZ:
+        stats = time_call(lambda: model.predict(frame, imgsz=imgsz, device=device, verbose=False), runs)
+        stats["fps"] = round(1000 / stats["p50_ms"], 2)
+        results[f"imgsz_{imgsz}"] = stats
+
+    return results
+
+
+def suggest_defaults(profile: dict) -> dict:
+    """依設定檔推薦預設值"""
+    cpu = profile["cpu"]
+    bench = profile["benchmarks"]
+    suggested = {"torch_threads": cpu["physical_cores"] or cpu["logical_cores"]}
+
+    yolo = bench.get("yolo")
+    if isinstance(yolo, dict) and "error" not in yolo:
+        # 達到目標 FPS 的最大 imgsz，都達不到時用最小的
+        fast_enough = [imgsz for imgsz in YOLO_IMGSZ
+                       if yolo[f"imgsz_{imgsz}"]["fps"] >= TARGET_FPS]
+        suggested["yolo_imgsz"] = max(fast_enough) if fast_enough else min(YOLO_IMGSZ)
+
+    coin = bench.get("coin_cnn")
+    if isinstance(coin, dict) and "error" not in coin:
+        # 吞吐量最高的 batch
+        suggested["coin_cnn_batch"] = max(
+            COIN_CNN_BATCHES, key=lambda b: coin[f"batch_{b}"]["images_per_sec"])
+
+    return suggested
+
+
+def collect_profile(runs: int = BENCH_RUNS, include_yolo: bool = True) -> dict:
+    """收集硬體資訊並執行效能測試 (失敗的項目記錄錯誤訊息)"""
+    profile = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu": cpu_profile(),
+        "opencv": opencv_profile(),
+        "torch": torch_profile(),
+        "benchmarks": {},
+    }
+
+    device = "cuda" if profile["torch"].get("cuda") else "cpu"
+    benchmarks = [
+        ("opencv", lambda: benchmark_opencv(runs)),
+        ("coin_cnn", lambda: benchmark_coin_cnn(runs)),
+    ]
+    if include_yolo:
+        benchmarks.append(("yolo", lambda: benchmark_yolo(device, runs)))
+
+    for name, fn in benchmarks:
+        try:
+            profile["benchmarks"][name] = fn()
+        except Exception as e:
+            profile["benchmarks"][name] = {"error": f"{type(e).__name__}: {e}"}
+
+    profile["suggested"] = suggest_defaults(profile)
+    return profile
+
+
 def print_summary():
     """印出總結與建議"""
     print_header("環境檢查總結")
@@ -314,6 +575,29 @@ def print_summary():
 
 def main():
     """主程式"""
+    parser = argparse.ArgumentParser(description="YOLOv11 訓練環境檢查工具")
+    parser.add_argument("--json", nargs="?", const="-", default=None, metavar="PATH",
+                        help="輸出 JSON 硬體與效能設定檔 (不指定路徑時輸出到 stdout)")
+    parser.add_argument("--runs", type=int, default=BENCH_RUNS,
+                        help="每項效能測試的計時次數")
+    parser.add_argument("--skip-yolo", action="store_true",
+                        help="設定檔不測試 YOLO (不需下載 yolo11n.pt)")
+    args = parser.parse_args()
+
+    if args.json is not None:
+        # 套件載入 / 下載訊息改印到 stderr，stdout 只輸出 JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            profile = collect_profile(args.runs, include_yolo=not args.skip_yolo)
+
+        text = json.dumps(profile, ensure_ascii=False, indent=2)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+            print(f"設定檔已儲存: {args.json}")
+        return
+
     print("\n" + "=" * 60)
     print("     YOLOv11 訓練環境檢查工具")
     print("=" * 60)
@@ -1,6 +1,11 @@
 """
 YOLOv11 硬幣檢測即時推理腳本
 支援攝影機即時偵測與單張圖片預測
+高解析度畫面可使用切片推論 (--slice，見 sliced_inference.py)
+
+影片預測使用三段式管線 (以有界佇列串接):
+解碼執行緒 -> 批次推論 (主執行緒) -> 繪製與寫檔執行緒
+長影片的總耗時接近最慢的單一階段，而不是三者相加
 
 作者: AI Course
 日期: 2024
@@ -11,17 +16,16 @@ import cv2
 import numpy as np
 import os
 import argparse
+import queue
+import threading
+import time
 
+from postprocess import CoinAnnotator, Detections
+from sliced_inference import TILE_OVERLAP, TILE_SIZE, predict_sliced
 
-# 硬幣面額對應表
-COIN_VALUES = {
-    '1h': 1, '1t': 1,
-    '5h': 5, '5t': 5,
-    '10h': 10, '10t': 10,
-    '50h': 50, '50t': 50,
-    '0': 0,
-    'test': 0,
-}
+# 影片管線設定
+VIDEO_BATCH_SIZE = 8        # 每次 model.predict 處理的畫面數
+PIPELINE_QUEUE_SIZE = 4     # 階段之間最多暫存的批次數 (限制記憶體用量)
 
 
 def load_model(model_path: str):
@@ -31,73 +35,57 @@ def load_model(model_path: str):
     return YOLO(model_path)
 
 
-def calculate_total(detections: list) -> int:
-    """計算偵測到的硬幣總金額"""
-    total = 0
-    for class_name in detections:
-        total += COIN_VALUES.get(class_name, 0)
-    return total
+# 繪製器 (快取面額 LUT 與標籤大小)
+_annotator = CoinAnnotator()
+
+
+def calculate_total(detections_list: list) -> int:
+    """計算偵測到的硬幣總金額 (每個 Detections 以面額 LUT 內積計算)"""
+    return sum(_annotator.total_value(detections) for detections in detections_list)
+
 
+def detect(model, frames: list, conf: float = 0.25, slicing: dict = None) -> list:
+    """
+    偵測多張畫面，回傳每張的 Detections
+    slicing 為 {"tile_size": ..., "overlap": ...} 時使用切片推論 (每張畫面的方塊合併成一次推論)
+    """
+    if slicing:
+        return [predict_sliced(model, frame, conf, **slicing) for frame in frames]
 
-def process_results(results, frame, show_total: bool = True):
-    """處理偵測結果並繪製在畫面上"""
+    results = model.predict(frames, conf=conf, verbose=False)
+    return [Detections.from_result(result) for result in results]
+
+
+def annotate_detections(frame, detections_list: list, show_total: bool = True, copy: bool = False):
+    """
+    將偵測結果繪製在畫面上，回傳 (繪製後畫面, 偵測到的類別名稱列表)
+    預設直接畫在 frame 上；需要保留原畫面時使用 copy=True (繪製在重複使用的緩衝區)
+    """
 
     detected_coins = []
-    annotated_frame = frame.copy()
-
-    for result in results:
-        boxes = result.boxes
-        names = result.names
-
-        for box in boxes:
-            # 取得邊界框座標
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            conf = float(box.conf[0])
-            cls_id = int(box.cls[0])
-            class_name = names[cls_id]
-
-            detected_coins.append(class_name)
-
-            # 繪製邊界框
-            color = (0, 255, 0)  # 綠色
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
-
-            # 繪製標籤
-            label = f"{class_name} {conf:.2f}"
-            value = COIN_VALUES.get(class_name, 0)
-            if value > 0:
-                label += f" (${value})"
-
-            # 計算標籤背景大小
-            (label_w, label_h), _ = cv2.getTextSize(
-                label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2
-            )
-            cv2.rectangle(
-                annotated_frame,
-                (x1, y1 - label_h - 10),
-                (x1 + label_w, y1),
-                color, -1
-            )
-            cv2.putText(
-                annotated_frame, label,
-                (x1, y1 - 5),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2
-            )
+    annotated_frame = frame
+    total = 0
+
+    for i, detections in enumerate(detections_list):
+        annotated_frame = _annotator.annotate(annotated_frame, detections, show_total=False,
+                                              copy=copy and i == 0)
+        detected_coins.extend(detections.class_names())
+        total += _annotator.total_value(detections)
 
     # 顯示總金額
     if show_total and detected_coins:
-        total = calculate_total(detected_coins)
-        total_text = f"Total: ${total}"
-        cv2.putText(
-            annotated_frame, total_text,
-            (10, 40),
-            cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 255), 3
-        )
+        _annotator.draw_total(annotated_frame, total)
 
     return annotated_frame, detected_coins
 
 
-def run_webcam(model_path: str, camera_id: int = 0, conf: float = 0.25):
+def process_results(results, frame, show_total: bool = True, copy: bool = False):
+    """處理 ultralytics 偵測結果並繪製在畫面上"""
+    detections_list = [Detections.from_result(result) for result in results]
+    return annotate_detections(frame, detections_list, show_total, copy)
+
+
+def run_webcam(model_path: str, camera_id: int = 0, conf: float = 0.25, slicing: dict = None):
     """使用攝影機進行即時偵測"""
 
     print(f"載入模型: {model_path}")
@@ -126,10 +114,10 @@ def run_webcam(model_path: str, camera_id: int = 0, conf: float = 0.25):
         frame = cv2.flip(frame, 1)
 
         # 執行偵測
-        results = model.predict(frame, conf=conf, verbose=False)
+        detections = detect(model, [frame], conf, slicing)
 
         # 處理並繪製結果
-        annotated_frame, coins = process_results(results, frame)
+        annotated_frame, coins = annotate_detections(frame, detections)
 
         # 顯示畫面
         cv2.imshow("YOLOv11 Coin Detection", annotated_frame)
@@ -147,7 +135,8 @@ def run_webcam(model_path: str, camera_id: int = 0, conf: float = 0.25):
     cv2.destroyAllWindows()
 
 
-def predict_image(model_path: str, image_path: str, conf: float = 0.25, save: bool = True):
+def predict_image(model_path: str, image_path: str, conf: float = 0.25, save: bool = True,
+                  show: bool = True, slicing: dict = None):
     """對單張圖片進行預測"""
 
     print(f"載入模型: {model_path}")
@@ -160,13 +149,13 @@ def predict_image(model_path: str, image_path: str, conf: float = 0.25, save: bo
         return
 
     # 執行偵測
-    results = model.predict(frame, conf=conf, verbose=False)
+    detections = detect(model, [frame], conf, slicing)
 
     # 處理並繪製結果
-    annotated_frame, coins = process_results(results, frame)
+    annotated_frame, coins = annotate_detections(frame, detections)
 
     # 計算總金額
-    total = calculate_total(coins)
+    total = calculate_total(detections)
 
     print("\n偵測結果:")
     print(f"  偵測到的硬幣: {coins}")
@@ -178,15 +167,88 @@ def predict_image(model_path: str, image_path: str, conf: float = 0.25, save: bo
         print(f"  結果已儲存: {output_path}")
 
     # 顯示結果
-    cv2.imshow("Detection Result", annotated_frame)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+    if show:
+        cv2.imshow("Detection Result", annotated_frame)
+        cv2.waitKey(0)
+        cv2.destroyAllWindows()
 
     return coins, total
 
 
-def predict_video(model_path: str, video_path: str, conf: float = 0.25, save: bool = True):
-    """對影片進行預測"""
+def _put_until_stopped(q: queue.Queue, item, stop_event: threading.Event) -> bool:
+    """放入佇列；下游已停止時放棄並回傳 False (避免永遠阻塞)"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get_until_stopped(q: queue.Queue, stop_event: threading.Event):
+    """從佇列取出；上游已停止且佇列為空時回傳 None"""
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop_event.is_set():
+                return None
+
+
+def _decode_frames(cap, batch_queue, batch_size, stop_event, busy):
+    """解碼執行緒: 讀取畫面並組成批次，結束時放入 None"""
+    batch = []
+    try:
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = cap.read()
+            busy['decode'] += time.perf_counter() - start
+            if not ret:
+                break
+
+            batch.append(frame)
+            if len(batch) == batch_size:
+                if not _put_until_stopped(batch_queue, batch, stop_event):
+                    return
+                batch = []
+
+        if batch:
+            _put_until_stopped(batch_queue, batch, stop_event)
+    finally:
+        _put_until_stopped(batch_queue, None, stop_event)
+
+
+def _write_frames(result_queue, out, stop_event, busy, latest, errors):
+    """
+    繪製與寫檔執行緒: 直到收到 None 才結束
+    發生錯誤時通知其他階段停止，但仍繼續取出佇列 (上游不會卡住)
+    """
+    while True:
+        item = result_queue.get()
+        if item is None:
+            break
+        if errors:
+            continue
+
+        frames, detections_list = item
+        start = time.perf_counter()
+        try:
+            for frame, detections in zip(frames, detections_list):
+                annotated_frame, _ = annotate_detections(frame, [detections])
+                if out is not None:
+                    out.write(annotated_frame)
+                latest['frame'] = annotated_frame
+                latest['written'] += 1
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        busy['write'] += time.perf_counter() - start
+
+
+def predict_video(model_path: str, video_path: str, conf: float = 0.25, save: bool = True,
+                  show: bool = True, batch_size: int = VIDEO_BATCH_SIZE, slicing: dict = None):
+    """對影片進行預測 (解碼 / 推論 / 寫檔 三段式管線)"""
 
     print(f"載入模型: {model_path}")
     model = load_model(model_path)
@@ -198,43 +260,90 @@ def predict_video(model_path: str, video_path: str, conf: float = 0.25, save: bo
         return
 
     # 取得影片資訊
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
     # 設定輸出影片
+    out = None
     if save:
         output_path = video_path.rsplit('.', 1)[0] + "_result.mp4"
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
 
-    print("處理中... 按 'q' 退出")
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # 執行偵測
-        results = model.predict(frame, conf=conf, verbose=False)
-
-        # 處理並繪製結果
-        annotated_frame, coins = process_results(results, frame)
-
-        if save:
-            out.write(annotated_frame)
-
-        # 顯示畫面
-        cv2.imshow("Video Detection", annotated_frame)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    stop_event = threading.Event()
+    batch_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    result_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    busy = {'decode': 0.0, 'infer': 0.0, 'write': 0.0}     # 各階段實際工作時間 (不含等待)
+    latest = {'frame': None, 'written': 0}
+    errors = []
+
+    decoder = threading.Thread(target=_decode_frames,
+                               args=(cap, batch_queue, batch_size, stop_event, busy), daemon=True)
+    writer = threading.Thread(target=_write_frames,
+                              args=(result_queue, out, stop_event, busy, latest, errors), daemon=True)
+
+    print(f"處理中... (批次 {batch_size} 張)" + (" 按 'q' 退出" if show else ""))
+
+    start_time = time.perf_counter()
+    decoder.start()
+    writer.start()
+
+    inferred = 0
+    try:
+        while not stop_event.is_set():
+            batch = _get_until_stopped(batch_queue, stop_event)
+            if batch is None:
+                break
+
+            # 執行偵測 (一次處理整個批次)
+            start = time.perf_counter()
+            detections_list = detect(model, batch, conf, slicing)
+            busy['infer'] += time.perf_counter() - start
+            inferred += len(batch)
+
+            result_queue.put((batch, detections_list))
+
+            # 顯示最新一張已繪製的畫面 (不影響管線的處理速度)
+            if show and latest['frame'] is not None:
+                cv2.imshow("Video Detection", latest['frame'])
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    print("使用者中斷")
+                    break
+
+            if total_frames > 0 and inferred % (batch_size * 25) < batch_size:
+                print(f"  進度: {inferred}/{total_frames}")
+    finally:
+        # 停止解碼，寫完已推論的畫面後結束寫檔執行緒
+        stop_event.set()
+        result_queue.put(None)
+        writer.join()
+        decoder.join()
+
+    elapsed = time.perf_counter() - start_time
 
     cap.release()
-    if save:
+    if out is not None:
         out.release()
         print(f"結果已儲存: {output_path}")
-    cv2.destroyAllWindows()
+    if show:
+        cv2.destroyAllWindows()
+
+    if errors:
+        print(f"錯誤: 繪製或寫檔失敗: {errors[0]}")
+
+    # 效能摘要
+    written = latest['written']
+    print()
+    print("=" * 50)
+    print(f"畫面數: {written} | 總耗時: {elapsed:.2f} 秒 | 平均: {written / max(elapsed, 1e-9):.1f} FPS")
+    for stage, label in (('decode', '解碼'), ('infer', '推論'), ('write', '繪製/寫檔')):
+        stage_fps = written / busy[stage] if busy[stage] > 0 else float('inf')
+        print(f"  {label:8} 工作時間 {busy[stage]:7.2f} 秒 ({stage_fps:.1f} FPS)")
+    bottleneck = max(busy, key=busy.get)
+    print(f"  瓶頸階段: {bottleneck}")
+    print("=" * 50)
 
 
 if __name__ == "__main__":
@@ -243,21 +352,39 @@ if __name__ == "__main__":
     parser.add_argument("--model", type=str, required=True,
                        help="模型路徑 (.pt 檔案)")
     parser.add_argument("--source", type=str, default="0",
-                       help="來源: 0=攝影機, 或圖片/影片路徑")
+                       help="來源: 0=攝影機, 或圖片/影片路徑; 多個來源以逗號分隔 (例如 0,1)")
     parser.add_argument("--conf", type=float, default=0.25,
                        help="信心閾值")
     parser.add_argument("--no-save", action="store_true",
                        help="不儲存結果")
+    parser.add_argument("--headless", action="store_true",
+                       help="不開啟顯示視窗 (伺服器或批次處理)")
+    parser.add_argument("--batch", type=int, default=VIDEO_BATCH_SIZE,
+                       help="影片推論時每批次的畫面數")
+    parser.add_argument("--slice", action="store_true",
+                       help="切片推論 (高解析度畫面中的小硬幣)")
+    parser.add_argument("--tile", type=int, default=TILE_SIZE,
+                       help="切片推論的方塊大小")
+    parser.add_argument("--overlap", type=float, default=TILE_OVERLAP,
+                       help="切片推論的方塊重疊比例")
 
     args = parser.parse_args()
 
+    slicing = {"tile_size": args.tile, "overlap": args.overlap} if args.slice else None
+
     # 判斷來源類型
-    if args.source == "0" or args.source.isdigit():
+    if "," in args.source:
+        # 多路攝影機 / 影片 (共用一個模型批次推論)
+        from multi_stream import parse_sources, run_multi_stream
+        run_multi_stream(args.model, parse_sources(args.source), args.conf, show=not args.headless)
+    elif args.source == "0" or args.source.isdigit():
         # 攝影機
-        run_webcam(args.model, int(args.source), args.conf)
+        run_webcam(args.model, int(args.source), args.conf, slicing)
     elif args.source.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
         # 影片
-        predict_video(args.model, args.source, args.conf, not args.no_save)
+        predict_video(args.model, args.source, args.conf, not args.no_save,
+                      show=not args.headless, batch_size=args.batch, slicing=slicing)
     else:
         # 圖片
-        predict_image(args.model, args.source, args.conf, not args.no_save)
+        predict_image(args.model, args.source, args.conf, not args.no_save,
+                      show=not args.headless, slicing=slicing)
@@ -0,0 +1,285 @@
+"""
+YOLOv11 多路攝影機 / 影片批次推論
+一台電腦接多台攝影機時，只載入一個模型服務所有來源
+
+架構:
+- 每個來源各有一條讀取執行緒，只保留最新一張畫面 (推論跟不上時自動丟棄舊畫面)
+- 每個 tick 將所有來源「尚未處理的最新畫面」合併成一次 model.predict
+- 結果依來源分送，各自繪製與統計
+
+使用方式:
+python multi_stream.py --model best.pt --sources 0,1
+python multi_stream.py --model best.pt --sources 0,1,line3.mp4 --headless
+python inference.py --model best.pt --source 0,1          # 同上 (來源以逗號分隔)
+
+作者: AI Course
+日期: 2024
+"""
+
+import argparse
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# ============== 設定區 ==============
+CAMERA_WIDTH = 1280
+CAMERA_HEIGHT = 720
+TILE_WIDTH = 640            # 拼接顯示時每個畫面的寬度
+STATS_INTERVAL = 5.0        # headless 模式每隔幾秒輸出一次統計
+
+
+def parse_sources(text: str) -> list:
+    """'0,1,video.mp4' -> [0, 1, 'video.mp4']"""
+    sources = []
+    for item in text.split(','):
+        item = item.strip()
+        if item:
+            sources.append(int(item) if item.isdigit() else item)
+    return sources
+
+
+# ============== 讀取執行緒 ==============
+class StreamGrabber:
+    """
+    背景執行緒持續讀取一個來源 (攝影機編號或影片檔)，只保留最新一張畫面
+    影片檔依原始 FPS 播放並循環，否則讀取執行緒會以最快速度跳過大部分畫面
+    """
+
+    def __init__(self, source, flip: bool = False, width: int = CAMERA_WIDTH, height: int = CAMERA_HEIGHT):
+        self.source = source
+        self.is_file = not isinstance(source, int)
+        self.name = os.path.basename(source) if self.is_file else f"cam{source}"
+        self.flip = flip
+
+        self.cap = cv2.VideoCapture(source)
+        self.frame_interval = 0.0
+        if self.cap.isOpened():
+            if self.is_file:
+                fps = self.cap.get(cv2.CAP_PROP_FPS)
+                self.frame_interval = 1.0 / fps if fps > 0 else 0.0
+            else:
+                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        self._lock = threading.Lock()
+        self._frame = None
+        self.frame_id = 0        # 每讀到一張新畫面 +1
+        self._running = False
+        self._thread = None
+
+    def is_opened(self) -> bool:
+        return self.cap.isOpened()
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        next_time = time.perf_counter()
+        while self._running:
+            ret, frame = self.cap.read()
+            if not ret:
+                if self.is_file:
+                    # 影片播完從頭開始
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                time.sleep(0.01)
+                continue
+
+            if self.flip:
+                frame = cv2.flip(frame, 1)
+
+            with self._lock:
+                self._frame = frame
+                self.frame_id += 1
+
+            if self.frame_interval:
+                next_time += self.frame_interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_time = time.perf_counter()
+
+    def latest(self):
+        """回傳 (畫面編號, 最新畫面)，尚未讀到畫面時為 (0, None)"""
+        with self._lock:
+            return self.frame_id, self._frame
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self.cap.release()
+
+
+def open_streams(sources: list, flip_cameras: bool = False) -> list:
+    """開啟並啟動所有來源，任何一個無法開啟時關閉已開啟的來源並丟出 RuntimeError"""
+    grabbers = []
+    for source in sources:
+        grabber = StreamGrabber(source, flip=flip_cameras and not isinstance(source, str))
+        if not grabber.is_opened():
+            grabber.stop()
+            for opened in grabbers:
+                opened.stop()
+            raise RuntimeError(f"無法開啟來源: {source}")
+        grabbers.append(grabber)
+
+    for grabber in grabbers:
+        grabber.start()
+    return grabbers
+
+
+# ============== 批次推論 ==============
+class MultiStreamRunner:
+    """
+    一個模型服務多個來源
+    tick() 取出每個來源尚未處理的最新畫面，合併成一次 model.predict
+    """
+
+    def __init__(self, model, grabbers: list, conf: float = 0.25):
+        self.model = model
+        self.grabbers = grabbers
+        self.conf = conf
+
+        self._last_ids = [0] * len(grabbers)
+        self.processed = [0] * len(grabbers)     # 各來源已推論的畫面數
+        self.batches = 0
+        self.start_time = time.perf_counter()
+
+    def tick(self) -> list:
+        """回傳 [(來源索引, 畫面, 結果), ...]，沒有任何新畫面時回傳空列表"""
+        indices = []
+        frames = []
+        for i, grabber in enumerate(self.grabbers):
+            frame_id, frame = grabber.latest()
+            if frame is None or frame_id == self._last_ids[i]:
+                continue
+
+            self._last_ids[i] = frame_id
+            indices.append(i)
+            frames.append(frame)
+
+        if not frames:
+            return []
+
+        results = self.model.predict(frames, conf=self.conf, verbose=False)
+
+        for i in indices:
+            self.processed[i] += 1
+        self.batches += 1
+
+        return list(zip(indices, frames, results))
+
+    def fps(self) -> list:
+        """各來源的平均推論 FPS"""
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9)
+        return [count / elapsed for count in self.processed]
+
+    def summary(self) -> str:
+        fps = self.fps()
+        lines = [f"  {grabber.name:16} {count:6d} 張  {rate:6.1f} FPS"
+                 for grabber, count, rate in zip(self.grabbers, self.processed, fps)]
+        avg_batch = sum(self.processed) / max(self.batches, 1)
+        lines.append(f"  總計: {sum(fps):.1f} FPS | 推論 {self.batches} 次 | 平均批次 {avg_batch:.1f} 張")
+        return "\n".join(lines)
+
+
+def make_mosaic(frames: list, names: list, tile_width: int = TILE_WIDTH) -> np.ndarray:
+    """將多個畫面縮放後拼接成格狀 (尚無畫面的來源顯示黑色)"""
+    tile_height = tile_width * 9 // 16
+    cols = int(np.ceil(np.sqrt(len(frames))))
+    rows = int(np.ceil(len(frames) / cols))
+    mosaic = np.zeros((rows * tile_height, cols * tile_width, 3), dtype=np.uint8)
+
+    for i, (frame, name) in enumerate(zip(frames, names)):
+        y0 = (i // cols) * tile_height
+        x0 = (i % cols) * tile_width
+
+        if frame is not None:
+            h, w = frame.shape[:2]
+            scale = min(tile_width / w, tile_height / h)
+            new_w, new_h = int(w * scale), int(h * scale)
+            mosaic[y0:y0 + new_h, x0:x0 + new_w] = cv2.resize(frame, (new_w, new_h))
+
+        cv2.putText(mosaic, name, (x0 + 10, y0 + tile_height - 15),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+    return mosaic
+
+
+# ============== 命令列執行 ==============
+def run_multi_stream(model_path: str, sources: list, conf: float = 0.25, show: bool = True):
+    """多路來源即時偵測"""
+    from inference import annotate_detections, calculate_total, load_model
+    from postprocess import Detections
+
+    print(f"載入模型: {model_path}")
+    model = load_model(model_path)
+
+    print(f"開啟 {len(sources)} 個來源: {sources}")
+    try:
+        grabbers = open_streams(sources, flip_cameras=True)
+    except RuntimeError as e:
+        print(f"錯誤: {e}")
+        return
+
+    runner = MultiStreamRunner(model, grabbers, conf)
+    names = [grabber.name for grabber in grabbers]
+    annotated = [None] * len(grabbers)
+    totals = [0] * len(grabbers)
+
+    print("按 'q' 退出" if show else "Ctrl+C 結束")
+    next_report = time.perf_counter() + STATS_INTERVAL
+
+    try:
+        while True:
+            outputs = runner.tick()
+            if not outputs:
+                time.sleep(0.002)
+
+            for i, frame, result in outputs:
+                detections = [Detections.from_result(result)]
+                annotated[i], _ = annotate_detections(frame, detections)
+                totals[i] = calculate_total(detections)
+
+            if show:
+                if outputs:
+                    cv2.imshow("YOLOv11 Multi-Stream", make_mosaic(annotated, names))
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+            elif time.perf_counter() >= next_report:
+                next_report += STATS_INTERVAL
+                amounts = ", ".join(f"{name}=${total}" for name, total in zip(names, totals))
+                print(f"[{sum(runner.fps()):.1f} FPS] {amounts}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for grabber in grabbers:
+            grabber.stop()
+        if show:
+            cv2.destroyAllWindows()
+
+    print()
+    print("=" * 50)
+    print(runner.summary())
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YOLOv11 多路攝影機批次推論")
+
+    parser.add_argument("--model", type=str, required=True,
+                        help="模型路徑 (.pt 檔案)")
+    parser.add_argument("--sources", type=str, default="0",
+                        help="來源 (逗號分隔): 攝影機編號或影片路徑，例如 0,1,video.mp4")
+    parser.add_argument("--conf", type=float, default=0.25,
+                        help="信心閾值")
+    parser.add_argument("--headless", action="store_true",
+                        help="不開啟顯示視窗，定期輸出統計")
+
+    args = parser.parse_args()
+    run_multi_stream(args.model, parse_sources(args.sources), args.conf, show=not args.headless)
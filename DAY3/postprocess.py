@@ -0,0 +1,285 @@
+"""
+YOLOv11 硬幣偵測結果後處理與繪製
+inference.py、multi_stream.py 與 yolo_gui.py 共用
+
+- Detections: 每個結果只做一次 tensor -> NumPy 轉換 (xyxy / conf / cls)
+- collapse_faces: NMS 只在同一類別內進行，同一枚硬幣可能同時被偵測為 10h 與 10t；
+  同面額正反面 (h / t) 重疊的框只保留信心值最高者，並移除 '0' / 'test' 類別，避免重複計算金額
+- 總金額以面額查表 (LUT) 與各類別數量做內積，不逐框查字典
+- CoinAnnotator: 直接在畫面上繪製 (不複製整張畫面)，標籤大小依類別快取
+
+使用方式:
+annotator = CoinAnnotator(GUI_STYLE)
+detections = Detections.from_result(results[0])
+annotator.annotate(frame, detections)
+total = annotator.total_value(detections)
+
+作者: AI Course
+日期: 2024
+"""
+
+import cv2
+import numpy as np
+
+
+# 硬幣面額對應表
+COIN_VALUES = {
+    '1h': 1, '1t': 1,
+    '5h': 5, '5t': 5,
+    '10h': 10, '10t': 10,
+    '50h': 50, '50t': 50,
+    '0': 0,
+    'test': 0,
+}
+
+# 繪製樣式
+INFERENCE_STYLE = {
+    "box_thickness": 2,
+    "font_scale": 0.6,
+    "label_padding": 0,          # 標籤文字左右留白
+    "color_by_value": False,     # False: 全部綠色
+    "total_scale": 1.2,
+    "total_background": False,
+}
+
+GUI_STYLE = {
+    "box_thickness": 4,
+    "font_scale": 0.7,
+    "label_padding": 5,
+    "color_by_value": True,      # 依面額使用不同顏色
+    "total_scale": 1.5,
+    "total_background": True,
+}
+
+# 類別合併設定
+COLLAPSE_FACES = True            # Detections.from_result 預設是否合併正反面
+FACE_MERGE_IOU = 0.5             # 同面額的框 IoU 超過此值視為同一枚硬幣
+IGNORED_CLASSES = ('0', 'test')  # 不是硬幣的類別 (不繪製、不計入金額)
+FACE_SUFFIXES = ('h', 't')       # 正面 / 反面
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+DEFAULT_COLOR = (0, 255, 0)      # 綠色 (BGR)
+
+# 依面額前綴的顏色 (BGR)
+DENOMINATION_COLORS = [
+    ('50', (0, 140, 255)),       # 深橙色
+    ('10', (47, 133, 205)),      # 棕色
+    ('5', (34, 139, 34)),        # 深綠色
+    ('1', (225, 105, 65)),       # 藍色
+]
+OTHER_COLOR = (128, 0, 128)      # 紫色
+
+
+def denomination_color(class_name: str) -> tuple:
+    for prefix, color in DENOMINATION_COLORS:
+        if class_name.startswith(prefix):
+            return color
+    return OTHER_COLOR
+
+
+class Detections:
+    """一張畫面的偵測結果 (NumPy 陣列)"""
+
+    __slots__ = ("xyxy", "conf", "cls", "names")
+
+    def __init__(self, xyxy: np.ndarray, conf: np.ndarray, cls: np.ndarray, names: dict):
+        self.xyxy = xyxy        # (N, 4) int32
+        self.conf = conf        # (N,) float32
+        self.cls = cls          # (N,) int64
+        self.names = names      # {類別編號: 類別名稱}
+
+    @classmethod
+    def from_result(cls, result, collapse: bool = COLLAPSE_FACES) -> "Detections":
+        """從 ultralytics Results 轉換 (整個 boxes.data 只搬到 CPU 一次)"""
+        data = result.boxes.data
+        if len(data) == 0:
+            return cls(np.empty((0, 4), np.int32), np.empty(0, np.float32),
+                       np.empty(0, np.int64), result.names)
+
+        data = data.cpu().numpy()
+        # data 欄位: x1, y1, x2, y2, conf, cls
+        detections = cls(data[:, :4].astype(np.int32), data[:, -2].astype(np.float32),
+                         data[:, -1].astype(np.int64), result.names)
+        return collapse_faces(detections) if collapse else detections
+
+    def __len__(self) -> int:
+        return len(self.cls)
+
+    def subset(self, index: np.ndarray) -> "Detections":
+        """依布林遮罩或索引取出部分偵測結果"""
+        return Detections(self.xyxy[index], self.conf[index], self.cls[index], self.names)
+
+    def class_names(self) -> list:
+        names = self.names
+        return [names[c] for c in self.cls.tolist()]
+
+    def class_counts(self) -> np.ndarray:
+        """各類別編號的數量"""
+        return np.bincount(self.cls, minlength=len(self.names))
+
+
+# 類別表 -> 面額群組 LUT 的快取 (同一個模型的 names 是同一個 dict 物件)
+_group_cache = {}
+
+
+def _denomination_groups(names: dict) -> np.ndarray:
+    """類別編號 -> 面額群組編號 (10h / 10t 同群組)，IGNORED_CLASSES 為 -1"""
+    cached = _group_cache.get(id(names))
+    if cached is not None and cached[0] is names:
+        return cached[1]
+
+    lut = np.full(max(names) + 1 if names else 0, -1, dtype=np.int64)
+    groups = {}
+    for cls_id, class_name in names.items():
+        if class_name in IGNORED_CLASSES:
+            continue
+        key = class_name[:-1] if class_name.endswith(FACE_SUFFIXES) else class_name
+        lut[cls_id] = groups.setdefault(key, len(groups))
+
+    _group_cache[id(names)] = (names, lut)
+    return lut
+
+
+def collapse_faces(detections: Detections, iou_threshold: float = FACE_MERGE_IOU) -> Detections:
+    """
+    合併同一枚硬幣的正反面偵測
+    1. 移除 IGNORED_CLASSES
+    2. 同面額群組內兩兩計算 IoU (N x N 矩陣)，被信心值更高且重疊的框覆蓋者移除
+       (一次矩陣運算決定，不逐框迴圈；每張畫面的框數很少，成本可忽略)
+    """
+    if len(detections) == 0:
+        return detections
+
+    groups = _denomination_groups(detections.names)[detections.cls]
+    valid = groups >= 0
+    if not valid.all():
+        detections = detections.subset(valid)
+        groups = groups[valid]
+    if len(detections) < 2:
+        return detections
+
+    # 依信心值由高到低排序
+    order = np.argsort(-detections.conf, kind="stable")
+    boxes = detections.xyxy[order].astype(np.float32)
+    groups = groups[order]
+
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    inter_w = np.clip(np.minimum(x2[:, None], x2) - np.maximum(x1[:, None], x1), 0, None)
+    inter_h = np.clip(np.minimum(y2[:, None], y2) - np.maximum(y1[:, None], y1), 0, None)
+    inter = inter_w * inter_h
+    iou = inter / np.maximum(areas[:, None] + areas - inter, 1e-9)
+
+    # overlap[i, j]: 排序較前 (信心值較高) 的 i 覆蓋同群組的 j
+    overlap = np.triu((iou > iou_threshold) & (groups[:, None] == groups), k=1)
+    suppressed = overlap.any(axis=0)
+    if not suppressed.any():
+        return detections
+
+    return detections.subset(np.sort(order[~suppressed]))
+
+
+class CoinAnnotator:
+    """
+    繪製偵測框、標籤與總金額
+    類別相關的資料 (面額 LUT、顏色、標籤大小) 在類別表改變時才重新計算
+    """
+
+    def __init__(self, style: dict = INFERENCE_STYLE):
+        self.style = style
+        self._names = None
+        self._value_lut = None
+        self._class_info = None     # 類別編號 -> (名稱, 面額, 顏色, 標籤大小)
+        self._buffer = None
+        self._total_sizes = {}
+
+    def _prepare(self, names: dict):
+        if names is self._names or names == self._names:
+            self._names = names
+            return
+
+        size = max(names) + 1 if names else 0
+        self._value_lut = np.zeros(size, dtype=np.int64)
+        self._class_info = {}
+
+        for cls_id, class_name in names.items():
+            value = COIN_VALUES.get(class_name, 0)
+            self._value_lut[cls_id] = value
+
+            color = denomination_color(class_name) if self.style["color_by_value"] else DEFAULT_COLOR
+
+            # 信心值固定為 0.xx 格式，數字等寬，標籤大小只需依類別計算一次
+            label = self._label(class_name, 0.0, value)
+            label_size, _ = cv2.getTextSize(label, FONT, self.style["font_scale"], 2)
+            self._class_info[cls_id] = (class_name, value, color, label_size)
+
+        self._names = names
+
+    @staticmethod
+    def _label(class_name: str, conf: float, value: int) -> str:
+        label = f"{class_name} {conf:.2f}"
+        if value > 0:
+            label += f" (${value})"
+        return label
+
+    def total_value(self, detections: Detections) -> int:
+        """總金額 = 各類別數量 · 面額 LUT"""
+        if len(detections) == 0:
+            return 0
+        self._prepare(detections.names)
+        counts = np.bincount(detections.cls, minlength=len(self._value_lut))
+        return int(counts @ self._value_lut)
+
+    def annotate(self, frame: np.ndarray, detections: Detections,
+                 show_total: bool = True, copy: bool = False) -> np.ndarray:
+        """
+        繪製並回傳畫面
+        預設直接畫在 frame 上；copy=True 時先複製到重複使用的緩衝區 (保留原畫面)，
+        回傳的緩衝區在下一次呼叫時會被覆寫
+        """
+        if copy:
+            if self._buffer is None or self._buffer.shape != frame.shape:
+                self._buffer = np.empty_like(frame)
+            np.copyto(self._buffer, frame)
+            frame = self._buffer
+
+        if len(detections) == 0:
+            return frame
+
+        self._prepare(detections.names)
+        style = self.style
+        pad = style["label_padding"]
+        text_color = (255, 255, 255) if style["color_by_value"] else (0, 0, 0)
+
+        for (x1, y1, x2, y2), conf, cls_id in zip(detections.xyxy.tolist(),
+                                                  detections.conf.tolist(),
+                                                  detections.cls.tolist()):
+            class_name, value, color, (label_w, label_h) = self._class_info[cls_id]
+
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, style["box_thickness"])
+            cv2.rectangle(frame, (x1, y1 - label_h - 10), (x1 + label_w + 2 * pad, y1), color, -1)
+            cv2.putText(frame, self._label(class_name, conf, value), (x1 + pad, y1 - 5),
+                        FONT, style["font_scale"], text_color, 2)
+
+        if show_total:
+            self.draw_total(frame, self.total_value(detections))
+
+        return frame
+
+    def draw_total(self, frame: np.ndarray, total: int):
+        """在左上角繪製總金額"""
+        total_text = f"Total: ${total}"
+        scale = self.style["total_scale"]
+
+        if not self.style["total_background"]:
+            cv2.putText(frame, total_text, (10, 40), FONT, scale, (0, 0, 255), 3)
+            return
+
+        size = self._total_sizes.get(total_text)
+        if size is None:
+            size, _ = cv2.getTextSize(total_text, FONT, scale, 3)
+            self._total_sizes[total_text] = size
+
+        tw, th = size
+        cv2.rectangle(frame, (5, 10), (tw + 20, th + 25), (0, 0, 139), -1)
+        cv2.putText(frame, total_text, (10, 50), FONT, scale, (255, 255, 255), 3)
@@ -0,0 +1,385 @@
+"""
+YOLOv11 訓練前檢查 (preflight)
+由 train_yolov11.py --mode preflight 呼叫
+
+1. 檢查 train / valid / test 的標註 (缺少標註、格式錯誤、類別超出範圍、座標超出 0~1)
+2. 建立預先縮放到 img_size 的影像快取與對應的 data.yaml (之後的實驗不必重新解碼原圖)
+3. 統計各類別在各資料集的數量
+4. 短暫量測讀圖與訓練速度，推薦 batch、workers 與 cache 設定
+5. 結果存成 dataset_cache/<img_size>/preflight.json，train_model 會自動使用
+
+作者: AI Course
+日期: 2024
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import yaml
+
+# ============== 設定區 ==============
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_YAML = os.path.join(SCRIPT_DIR, "data.yaml")
+CACHE_ROOT = os.path.join(SCRIPT_DIR, "dataset_cache")
+SPLITS = {"train": "train", "val": "val", "test": "test"}     # 輸出名稱 -> data.yaml 的鍵
+JPEG_QUALITY = 95
+CACHE_THREADS = min(8, os.cpu_count() or 1)
+PROBE_IMAGES = 64               # 讀圖速度量測的張數
+PROBE_WORKERS = [1, 2, 4, 8]
+PROBE_BATCHES = [4, 8, 16, 32]
+RAM_CACHE_RATIO = 0.5           # 快取影像佔可用記憶體比例低於此值時推薦 cache=ram
+IMBALANCE_RATIO = 0.1           # 數量低於最多類別此比例的類別列為不平衡
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def get_cache_dir(img_size: int) -> str:
+    return os.path.join(CACHE_ROOT, str(img_size))
+
+
+def load_preflight(img_size: int):
+    """
+    讀取 preflight 結果，不存在、快取不完整或原始資料已變更時回傳 None
+    (原始資料變更時印出警告，訓練改用原本的 data.yaml)
+    """
+    path = os.path.join(get_cache_dir(img_size), "preflight.json")
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+
+    if not os.path.exists(report.get("data_yaml", "")):
+        return None
+
+    with open(report["source_yaml"], "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+    if report.get("source_state") != source_state(data):
+        print("警告: preflight 之後 train / valid / test 的圖片或標註有變更，"
+              "改用原始資料 (請重新執行 --mode preflight)")
+        return None
+
+    return report
+
+
+# ============== 標註檢查 ==============
+def list_split(data: dict, key: str) -> tuple:
+    """回傳 (圖片資料夾, 標註資料夾, 圖片檔名列表)，資料夾不存在時圖片列表為空"""
+    image_dir = os.path.join(SCRIPT_DIR, data[key]) if key in data else ""
+    label_dir = os.path.join(os.path.dirname(image_dir), "labels")
+
+    if not os.path.isdir(image_dir):
+        return image_dir, label_dir, []
+
+    files = [f for f in sorted(os.listdir(image_dir)) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    return image_dir, label_dir, files
+
+
+def source_state(data: dict) -> dict:
+    """各資料集的圖片數、標註數與最新修改時間 (用來判斷快取是否過期)"""
+    state = {}
+    for split, key in SPLITS.items():
+        image_dir, label_dir, files = list_split(data, key)
+        labels = ([f for f in os.listdir(label_dir) if f.endswith(".txt")]
+                  if os.path.isdir(label_dir) else [])
+
+        paths = [os.path.join(image_dir, f) for f in files] + [os.path.join(label_dir, f) for f in labels]
+        state[split] = {
+            "images": len(files),
+            "labels": len(labels),
+            "newest_mtime": max((os.path.getmtime(p) for p in paths), default=0.0),
+        }
+    return state
+
+
+def check_label_file(path: str, num_classes: int) -> tuple:
+    """回傳 (各類別編號列表, 有效的標註行, 問題列表)"""
+    if not os.path.exists(path):
+        return [], [], ["缺少標註檔"]
+
+    classes = []
+    valid_lines = []
+    issues = []
+    seen = set()
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            parts = line.split()
+            if not parts:
+                continue
+
+            if len(parts) != 5:
+                issues.append(f"第 {line_no} 行欄位數為 {len(parts)} (應為 5)")
+                continue
+
+            try:
+                cls_id = int(parts[0])
+                cx, cy, w, h = (float(v) for v in parts[1:])
+            except ValueError:
+                issues.append(f"第 {line_no} 行無法解析")
+                continue
+
+            if not 0 <= cls_id < num_classes:
+                issues.append(f"第 {line_no} 行類別 {cls_id} 超出範圍")
+                continue
+            if w <= 0 or h <= 0 or not all(0 <= v <= 1 for v in (cx, cy, w, h)):
+                issues.append(f"第 {line_no} 行座標超出 0~1")
+                continue
+            if tuple(parts) in seen:
+                issues.append(f"第 {line_no} 行重複")
+                continue
+
+            seen.add(tuple(parts))
+            classes.append(cls_id)
+            valid_lines.append(" ".join(parts) + "\n")
+
+    return classes, valid_lines, issues
+
+
+# ============== 影像快取 ==============
+def cache_image(src: str, dst: str, img_size: int) -> tuple:
+    """
+    等比例縮放到長邊 = img_size 並寫入快取 (已是最新時略過)
+    回傳 (影像大小 (h, w) 或 None, 是否重新產生)
+    """
+    if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+        image = cv2.imread(dst)
+        if image is not None:
+            return image.shape[:2], False
+
+    image = cv2.imread(src)
+    if image is None:
+        return None, False
+
+    h, w = image.shape[:2]
+    scale = img_size / max(h, w)
+    if scale < 1:
+        image = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+    ext = os.path.splitext(dst)[1].lower()
+    params = [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY] if ext in ('.jpg', '.jpeg') else []
+    tmp_path = dst + ".tmp" + ext
+    cv2.imwrite(tmp_path, image, params)
+    os.replace(tmp_path, dst)
+
+    return image.shape[:2], True
+
+
+# ============== 速度量測 ==============
+def probe_workers(paths: list) -> dict:
+    """不同執行緒數的讀圖速度 (張/秒)"""
+    paths = paths[:PROBE_IMAGES]
+    speeds = {}
+    for workers in PROBE_WORKERS:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(cv2.imread, paths))
+        speeds[workers] = len(paths) / max(time.perf_counter() - start, 1e-9)
+    return speeds
+
+
+def probe_batches(model_name: str, img_size: int, device: str) -> dict:
+    """不同批次大小的訓練步驟速度 (張/秒)，記憶體不足的批次略過"""
+    import torch
+    from ultralytics import YOLO
+
+    dev = torch.device("cpu" if device == "cpu" or not torch.cuda.is_available() else f"cuda:{device}")
+    model = YOLO(model_name).model.to(dev).train()
+    for param in model.parameters():
+        param.requires_grad_(True)
+
+    speeds = {}
+    for batch in PROBE_BATCHES:
+        try:
+            images = torch.rand(batch, 3, img_size, img_size, device=dev)
+            for step in range(3):
+                if step == 1:
+                    # 第一步為暖機
+                    if dev.type == "cuda":
+                        torch.cuda.synchronize()
+                    start = time.perf_counter()
+                outputs = model(images)
+                loss = sum(o.float().mean() for o in outputs)
+                loss.backward()
+                model.zero_grad(set_to_none=True)
+            if dev.type == "cuda":
+                torch.cuda.synchronize()
+            speeds[batch] = batch * 2 / max(time.perf_counter() - start, 1e-9)
+        except RuntimeError as e:
+            print(f"  batch {batch}: 無法執行 ({str(e).splitlines()[0]})")
+            if dev.type == "cuda":
+                torch.cuda.empty_cache()
+            break
+
+    return speeds
+
+
+def pick_smallest_near_best(speeds: dict, ratio: float = 0.9):
+    """達到最佳速度 ratio 以上的最小設定 (節省資源)"""
+    if not speeds:
+        return None
+    best = max(speeds.values())
+    return min(k for k, v in speeds.items() if v >= best * ratio)
+
+
+# ============== 主流程 ==============
+def run_preflight(img_size: int = 640, model_size: str = "n", device: str = "cpu",
+                  data_yaml: str = DATA_YAML, probe: bool = True) -> dict:
+    with open(data_yaml, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f)
+
+    names = data["names"]
+    num_classes = len(names)
+    cache_dir = get_cache_dir(img_size)
+
+    print("=" * 60)
+    print("YOLOv11 訓練前檢查 (preflight)")
+    print("=" * 60)
+    print(f"資料配置: {data_yaml}")
+    print(f"影像快取: {cache_dir} (長邊 {img_size})")
+    print()
+
+    report = {
+        "img_size": img_size,
+        "source_yaml": data_yaml,
+        "source_state": source_state(data),
+        "splits": {},
+        "class_counts": {},
+        "issues": {},
+    }
+    cached_paths = []
+    ram_bytes = 0
+
+    for split, key in SPLITS.items():
+        image_dir, label_dir, files = list_split(data, key)
+        if not files:
+            print(f"[{split}] 找不到圖片 ({image_dir})，略過")
+            continue
+
+        out_images = os.path.join(cache_dir, split, "images")
+        out_labels = os.path.join(cache_dir, split, "labels")
+        os.makedirs(out_images, exist_ok=True)
+        os.makedirs(out_labels, exist_ok=True)
+
+        counts = np.zeros(num_classes, dtype=np.int64)
+        split_issues = {}
+
+        # 標註檢查，快取只寫入有效的行 (等比例縮放不影響 YOLO 的正規化座標)
+        for filename in files:
+            stem = os.path.splitext(filename)[0]
+            classes, valid_lines, issues = check_label_file(
+                os.path.join(label_dir, stem + ".txt"), num_classes)
+            if issues:
+                split_issues[filename] = issues
+            counts += np.bincount(np.array(classes, dtype=np.int64), minlength=num_classes)
+
+            with open(os.path.join(out_labels, stem + ".txt"), "w", encoding="utf-8") as f:
+                f.writelines(valid_lines)
+
+        # 原資料夾已刪除的圖片不留在快取中
+        for stale in set(os.listdir(out_images)) - set(files):
+            os.remove(os.path.join(out_images, stale))
+
+        # 影像快取 (多執行緒)
+        def job(filename):
+            return cache_image(os.path.join(image_dir, filename),
+                               os.path.join(out_images, filename), img_size)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=CACHE_THREADS) as executor:
+            results = list(executor.map(job, files))
+        elapsed = time.perf_counter() - start
+
+        for filename, (shape, _) in zip(files, results):
+            if shape is None:
+                split_issues.setdefault(filename, []).append("無法讀取圖片")
+            else:
+                ram_bytes += shape[0] * shape[1] * 3
+                cached_paths.append(os.path.join(out_images, filename))
+
+        rebuilt = sum(1 for _, created in results if created)
+        print(f"[{split}] {len(files)} 張 | 重新產生快取 {rebuilt} 張 ({elapsed:.1f} 秒) | "
+              f"有問題的檔案 {len(split_issues)} 個")
+        for filename, issues in list(split_issues.items())[:5]:
+            print(f"    {filename}: {'; '.join(issues[:3])}")
+
+        report["splits"][split] = {"images": len(files), "boxes": int(counts.sum())}
+        report["class_counts"][split] = {name: int(c) for name, c in zip(names, counts)}
+        report["issues"][split] = split_issues
+
+    if not cached_paths:
+        print("錯誤: 沒有任何可用的圖片")
+        return report
+
+    # 產生指向快取的 data.yaml
+    cached_yaml = os.path.join(cache_dir, "data.yaml")
+    cached_data = {"path": cache_dir, "nc": num_classes, "names": names}
+    for split in report["splits"]:
+        cached_data[split] = f"{split}/images"
+    with open(cached_yaml, "w", encoding="utf-8") as f:
+        yaml.safe_dump(cached_data, f, allow_unicode=True, sort_keys=False)
+    report["data_yaml"] = cached_yaml
+
+    # 類別分布
+    print()
+    print(f"{'類別':8}" + "".join(f"{split:>8}" for split in report["class_counts"]) + f"{'合計':>8}")
+    print("-" * 60)
+    totals = {name: sum(report["class_counts"][s][name] for s in report["class_counts"]) for name in names}
+    max_count = max(totals.values()) or 1
+    imbalanced = []
+    for name in names:
+        row = "".join(f"{report['class_counts'][s][name]:>8}" for s in report["class_counts"])
+        flag = ""
+        if totals[name] < max_count * IMBALANCE_RATIO:
+            flag = "  <- 樣本過少"
+            imbalanced.append(name)
+        print(f"{name:8}{row}{totals[name]:>8}{flag}")
+    report["imbalanced_classes"] = imbalanced
+
+    # 推薦設定
+    recommend = {"batch": 16, "workers": 8, "cache": False}
+    if probe:
+        print()
+        print("速度量測...")
+        worker_speeds = probe_workers(cached_paths)
+        for workers, speed in worker_speeds.items():
+            print(f"  讀圖 workers={workers}: {speed:.1f} 張/秒")
+        recommend["workers"] = pick_smallest_near_best(worker_speeds)
+
+        batch_speeds = probe_batches(f"yolo11{model_size}.pt", img_size, device)
+        for batch, speed in batch_speeds.items():
+            print(f"  訓練 batch={batch}: {speed:.1f} 張/秒")
+        if batch_speeds:
+            recommend["batch"] = pick_smallest_near_best(batch_speeds)
+
+        report["probe"] = {
+            "workers": {str(k): v for k, v in worker_speeds.items()},
+            "batch": {str(k): v for k, v in batch_speeds.items()},
+        }
+
+    # 快取影像放得進記憶體時直接用 RAM，否則用磁碟快取 (.npy)
+    try:
+        import psutil
+        available = psutil.virtual_memory().available
+    except ImportError:
+        available = 0
+    recommend["cache"] = "ram" if available and ram_bytes < available * RAM_CACHE_RATIO else "disk"
+    report["cache_bytes"] = ram_bytes
+    report["recommend"] = recommend
+
+    with open(os.path.join(cache_dir, "preflight.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print()
+    print("=" * 60)
+    print(f"推薦設定: batch={recommend['batch']} workers={recommend['workers']} "
+          f"cache={recommend['cache']} (影像約 {ram_bytes / 1024 ** 2:.0f} MB)")
+    print(f"快取資料配置: {cached_yaml}")
+    print("之後執行訓練會自動使用以上設定 (加上 --no-preflight 可停用)")
+    print("=" * 60)
+
+    return report
@@ -0,0 +1,292 @@
+"""
+YOLOv11 切片推論 (Sliced Inference)
+高解析度俯拍的大托盤 (例如 4K) 整張縮到 640 時，硬幣只剩幾個像素而漏偵測
+
+做法:
+1. 將畫面切成互相重疊的方塊 (tile)，另外加上整張畫面 (偵測跨越多個方塊的大硬幣)
+2. 所有方塊合併成一次 model.predict (批次推論)
+3. 偵測框平移回原圖座標，以類別感知的 NMS 合併方塊邊界上的重複偵測
+   (預設以「交集 / 較小框面積」判斷，方塊邊緣被切掉一半的硬幣也能被合併)
+4. 最後與整張推論相同，合併同面額的正反面偵測 (postprocess.collapse_faces)
+
+使用方式:
+python inference.py --model best.pt --source tray_4k.jpg --slice --tile 640 --overlap 0.2
+python sliced_inference.py --model best.pt --images valid/images --tiles 320,640 --overlaps 0.1,0.25
+
+作者: AI Course
+日期: 2024
+"""
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from postprocess import IGNORED_CLASSES, Detections, collapse_faces
+
+# ============== 設定區 ==============
+TILE_SIZE = 640                 # 方塊邊長 (像素)，也是推論的 imgsz
+TILE_OVERLAP = 0.2              # 相鄰方塊重疊比例
+INCLUDE_FULL_FRAME = True       # 是否同時推論整張畫面
+MERGE_METRIC = "ios"            # ios: 交集 / 較小框面積；iou: 交集 / 聯集
+MERGE_THRESHOLD = 0.5
+MATCH_IOU = 0.5                 # 基準測試: 與標註框 IoU 超過此值視為偵測到
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+# ============== 切片 ==============
+def make_tiles(img_w: int, img_h: int, tile_size: int = TILE_SIZE,
+               overlap: float = TILE_OVERLAP) -> list:
+    """回傳覆蓋整張畫面的方塊 [(x1, y1, x2, y2), ...]，最後一排 / 列貼齊邊緣"""
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [(x, y, min(x + tile_size, img_w), min(y + tile_size, img_h))
+            for y in starts(img_h) for x in starts(img_w)]
+
+
+# ============== 合併 ==============
+def nms(boxes: np.ndarray, scores: np.ndarray, threshold: float = MERGE_THRESHOLD,
+        metric: str = MERGE_METRIC) -> np.ndarray:
+    """貪婪 NMS，回傳保留的索引 (依分數由高到低)"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        inter_w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        inter_h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = inter_w * inter_h
+
+        if metric == "ios":
+            overlap = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        else:
+            overlap = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+
+        order = rest[overlap <= threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+def class_aware_nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+                    threshold: float = MERGE_THRESHOLD, metric: str = MERGE_METRIC) -> np.ndarray:
+    """不同類別的框不互相抑制 (依類別將座標平移到不重疊的區域)"""
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    offsets = classes[:, None].astype(np.float32) * (float(boxes.max()) + 1)
+    return nms(boxes + offsets, scores, threshold, metric)
+
+
+# ============== 推論 ==============
+def predict_sliced(model, frame: np.ndarray, conf: float = 0.25, tile_size: int = TILE_SIZE,
+                   overlap: float = TILE_OVERLAP, include_full: bool = INCLUDE_FULL_FRAME,
+                   merge_threshold: float = MERGE_THRESHOLD) -> Detections:
+    """切片推論單張畫面，回傳合併後的 Detections (原圖座標)"""
+    img_h, img_w = frame.shape[:2]
+    tiles = make_tiles(img_w, img_h, tile_size, overlap)
+
+    # 方塊直接取 view，不複製畫面
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+    offsets = [(x1, y1) for x1, y1, _, _ in tiles]
+    if include_full and len(tiles) > 1:
+        crops.append(frame)
+        offsets.append((0, 0))
+
+    # 所有方塊一次推論
+    results = model.predict(crops, imgsz=tile_size, conf=conf, verbose=False)
+
+    boxes, scores, classes = [], [], []
+    for (dx, dy), result in zip(offsets, results):
+        data = result.boxes.data
+        if len(data) == 0:
+            continue
+
+        data = data.cpu().numpy()
+        boxes.append(data[:, :4] + np.array([dx, dy, dx, dy], dtype=np.float32))
+        scores.append(data[:, -2])
+        classes.append(data[:, -1].astype(np.int64))
+
+    names = results[0].names
+    if not boxes:
+        return Detections(np.empty((0, 4), np.int32), np.empty(0, np.float32),
+                          np.empty(0, np.int64), names)
+
+    boxes = np.concatenate(boxes)
+    scores = np.concatenate(scores)
+    classes = np.concatenate(classes)
+
+    keep = class_aware_nms(boxes, scores, classes, merge_threshold)
+    return collapse_faces(Detections(boxes[keep].astype(np.int32), scores[keep].astype(np.float32),
+                                     classes[keep], names))
+
+
+# ============== 基準測試 ==============
+def load_labels(image_path: str, img_w: int, img_h: int, names: dict = None) -> tuple:
+    """
+    讀取 YOLO 格式標註 (images/ 對應 labels/)，回傳 (boxes xyxy, classes)
+    指定 names 時略過 IGNORED_CLASSES (偵測結果也會移除這些類別，保留會拉低召回率)
+    """
+    ignored = {cls_id for cls_id, name in (names or {}).items() if name in IGNORED_CLASSES}
+    image_dir, filename = os.path.split(image_path)
+    label_path = os.path.join(os.path.dirname(image_dir), "labels",
+                              os.path.splitext(filename)[0] + ".txt")
+
+    boxes, classes = [], []
+    if os.path.exists(label_path):
+        with open(label_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 5:
+                    continue
+                cls_id = int(parts[0])
+                if cls_id in ignored:
+                    continue
+                cx, cy, w, h = (float(v) for v in parts[1:5])
+                boxes.append([(cx - w / 2) * img_w, (cy - h / 2) * img_h,
+                              (cx + w / 2) * img_w, (cy + h / 2) * img_h])
+                classes.append(cls_id)
+
+    return np.array(boxes, dtype=np.float32).reshape(-1, 4), np.array(classes, dtype=np.int64)
+
+
+def count_matches(pred_boxes, pred_classes, pred_scores, gt_boxes, gt_classes,
+                  iou_threshold: float = MATCH_IOU) -> int:
+    """同類別且 IoU 超過門檻的一對一配對數 (依信心值由高到低配對)"""
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return 0
+
+    x1 = np.maximum(pred_boxes[:, None, 0], gt_boxes[None, :, 0])
+    y1 = np.maximum(pred_boxes[:, None, 1], gt_boxes[None, :, 1])
+    x2 = np.minimum(pred_boxes[:, None, 2], gt_boxes[None, :, 2])
+    y2 = np.minimum(pred_boxes[:, None, 3], gt_boxes[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+    pred_area = (pred_boxes[:, 2] - pred_boxes[:, 0]) * (pred_boxes[:, 3] - pred_boxes[:, 1])
+    gt_area = (gt_boxes[:, 2] - gt_boxes[:, 0]) * (gt_boxes[:, 3] - gt_boxes[:, 1])
+    iou = inter / np.maximum(pred_area[:, None] + gt_area[None, :] - inter, 1e-9)
+    iou[pred_classes[:, None] != gt_classes[None, :]] = 0
+
+    matched_gt = set()
+    matches = 0
+    for p in np.argsort(-pred_scores):
+        candidates = np.where(iou[p] >= iou_threshold)[0]
+        candidates = [g for g in candidates[np.argsort(-iou[p, candidates])] if g not in matched_gt]
+        if candidates:
+            matched_gt.add(candidates[0])
+            matches += 1
+
+    return matches
+
+
+def benchmark_slicing(model, image_paths: list, tile_sizes: list, overlaps: list,
+                      conf: float = 0.25, full_imgsz: int = 640):
+    """比較整張推論與各種切片設定的召回率、精確率與速度"""
+    images = []
+    for path in image_paths:
+        frame = cv2.imread(path)
+        if frame is not None:
+            h, w = frame.shape[:2]
+            images.append((frame, *load_labels(path, w, h, model.names)))
+
+    if not images:
+        print("錯誤: 沒有可用的圖片")
+        return []
+
+    configs = [("full", None, None)]
+    configs += [("sliced", tile, overlap) for tile in tile_sizes for overlap in overlaps]
+
+    # 暖機
+    model.predict(images[0][0], imgsz=full_imgsz, conf=conf, verbose=False)
+
+    rows = []
+    total_gt = sum(len(gt_classes) for _, _, gt_classes in images)
+    for mode, tile, overlap in configs:
+        matches = 0
+        num_pred = 0
+        start = time.perf_counter()
+
+        for frame, gt_boxes, gt_classes in images:
+            if mode == "full":
+                detections = Detections.from_result(
+                    model.predict(frame, imgsz=full_imgsz, conf=conf, verbose=False)[0]
+                )
+            else:
+                detections = predict_sliced(model, frame, conf, tile, overlap)
+
+            num_pred += len(detections)
+            matches += count_matches(detections.xyxy.astype(np.float32), detections.cls,
+                                     detections.conf, gt_boxes, gt_classes)
+
+        elapsed = time.perf_counter() - start
+        h, w = images[0][0].shape[:2]
+        num_tiles = 1 if mode == "full" else len(make_tiles(w, h, tile, overlap))
+        if mode != "full" and INCLUDE_FULL_FRAME and num_tiles > 1:
+            num_tiles += 1
+        rows.append({
+            "mode": "整張" if mode == "full" else f"切片 {tile} / {overlap:.0%}",
+            "tiles": num_tiles,
+            "recall": matches / max(total_gt, 1),
+            "precision": matches / max(num_pred, 1),
+            "fps": len(images) / elapsed,
+        })
+
+    print()
+    print("=" * 60)
+    print(f"圖片: {len(images)} 張 | 標註: {total_gt} 個 | 配對 IoU >= {MATCH_IOU}")
+    print(f"{'設定':20} {'方塊數':>6} {'召回率':>8} {'精確率':>8} {'張/秒':>8}")
+    print("-" * 60)
+    for row in rows:
+        print(f"{row['mode']:20} {row['tiles']:>6} {row['recall']:>8.1%} "
+              f"{row['precision']:>8.1%} {row['fps']:>8.2f}")
+    print("=" * 60)
+
+    return rows
+
+
+if __name__ == "__main__":
+    from inference import load_model
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description="YOLOv11 切片推論基準測試")
+
+    parser.add_argument("--model", type=str, required=True,
+                        help="模型路徑 (.pt 檔案)")
+    parser.add_argument("--images", type=str, default=os.path.join(script_dir, "valid", "images"),
+                        help="測試圖片資料夾 (同層需有 labels/ 標註)")
+    parser.add_argument("--tiles", type=str, default="320,640",
+                        help="方塊大小 (逗號分隔)")
+    parser.add_argument("--overlaps", type=str, default="0.1,0.25",
+                        help="重疊比例 (逗號分隔)")
+    parser.add_argument("--conf", type=float, default=0.25,
+                        help="信心閾值")
+    parser.add_argument("--imgsz", type=int, default=640,
+                        help="整張推論的 imgsz")
+
+    args = parser.parse_args()
+
+    paths = [os.path.join(args.images, f) for f in sorted(os.listdir(args.images))
+             if f.lower().endswith(IMAGE_EXTENSIONS)]
+
+    benchmark_slicing(
+        load_model(args.model), paths,
+        tile_sizes=[int(v) for v in args.tiles.split(",")],
+        overlaps=[float(v) for v in args.overlaps.split(",")],
+        conf=args.conf,
+        full_imgsz=args.imgsz,
+    )
@@ -9,17 +9,37 @@ Project COIN - 台幣硬幣檢測與辨識
 from ultralytics import YOLO
 import os
 import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from preflight import load_preflight, run_preflight
+
+
+# 基準測試設定
+BENCHMARK_FORMATS = "pytorch,onnx,openvino"
+BENCHMARK_IMGSZ = "320,480,640"
+BENCHMARK_BATCHES = "1,4"
+BENCHMARK_WARMUP = 3            # 每個組合的暖機批次數 (不計時)
+BENCHMARK_RUNS = 30             # 每個組合的計時批次數
+MAP_TOLERANCE = 0.01            # 推薦時允許的 mAP50 下降幅度 (相對於 PyTorch 最佳值)
+SYNTHETIC_SHAPE = (720, 1280, 3)
 
 
 def train_model(
     model_size: str = "n",
     epochs: int = 100,
-    batch_size: int = 16,
+    batch_size: int = None,
     img_size: int = 640,
     device: str = "0",
     project: str = "runs/detect",
     name: str = "coin_detector",
     resume: bool = False,
+    workers: int = None,
+    cache=None,
+    use_preflight: bool = True,
 ):
     """
     訓練 YOLOv11 硬幣檢測模型
@@ -32,18 +52,32 @@ def train_model(
                    l: large
                    x: xlarge (最大最準)
         epochs: 訓練輪數
-        batch_size: 批次大小
+        batch_size: 批次大小 (None: 使用 preflight 推薦值或 16)
         img_size: 輸入圖片大小
         device: 使用的設備 (0=GPU, cpu=CPU)
         project: 輸出專案目錄
         name: 實驗名稱
         resume: 是否從上次中斷處繼續訓練
+        workers: 資料載入執行緒數 (None: 使用 preflight 推薦值或 8)
+        cache: 影像快取 ram/disk/False (None: 使用 preflight 推薦值或 False)
+        use_preflight: 有同一 img_size 的 preflight 結果時，使用預先縮放的影像快取與推薦設定
     """
 
     # 取得腳本所在目錄
     script_dir = os.path.dirname(os.path.abspath(__file__))
     data_yaml = os.path.join(script_dir, "data.yaml")
 
+    # 使用 preflight 準備好的資料 (--mode preflight)
+    recommend = {"batch": 16, "workers": 8, "cache": False}
+    preflight = load_preflight(img_size) if use_preflight else None
+    if preflight is not None:
+        data_yaml = preflight["data_yaml"]
+        recommend.update(preflight["recommend"])
+
+    batch_size = recommend["batch"] if batch_size is None else batch_size
+    workers = recommend["workers"] if workers is None else workers
+    cache = recommend["cache"] if cache is None else cache
+
     # 選擇預訓練模型
     model_name = f"yolo11{model_size}.pt"
 
@@ -55,7 +89,8 @@ def train_model(
     print(f"批次大小: {batch_size}")
     print(f"圖片大小: {img_size}")
     print(f"設備: {device}")
-    print(f"資料配置: {data_yaml}")
+    print(f"Workers: {workers} | 快取: {cache}")
+    print(f"資料配置: {data_yaml}" + (" (preflight 快取)" if preflight is not None else ""))
     print("=" * 60)
 
     # 載入模型
@@ -78,6 +113,8 @@ def train_model(
         batch=batch_size,
         imgsz=img_size,
         device=device,
+        workers=workers,
+        cache=cache,
         project=project,
         name=name,
         # 資料增強設定
@@ -152,34 +189,208 @@ def export_model(model_path: str, format: str = "onnx"):
     print(f"模型已匯出為 {format} 格式")
 
 
+def load_benchmark_frames(synthetic: bool = False, count: int = 16) -> list:
+    """讀取 valid/images 的前 count 張作為測試畫面；沒有圖片或指定 synthetic 時產生隨機畫面"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    image_dir = os.path.join(script_dir, "valid", "images")
+
+    frames = []
+    if not synthetic and os.path.isdir(image_dir):
+        for filename in sorted(os.listdir(image_dir)):
+            if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
+                frame = cv2.imread(os.path.join(image_dir, filename))
+                if frame is not None:
+                    frames.append(frame)
+                    if len(frames) >= count:
+                        break
+
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, SYNTHETIC_SHAPE, dtype=np.uint8) for _ in range(count)]
+
+    return frames
+
+
+def time_inference(model, frames: list, imgsz: int, batch: int, device: str,
+                   warmup: int = BENCHMARK_WARMUP, runs: int = BENCHMARK_RUNS) -> dict:
+    """
+    以固定批次大小重複推論 (畫面不足時循環使用)
+    回傳每張畫面的延遲百分位數 (毫秒) 與每秒處理張數
+    """
+    def next_batch(i):
+        return [frames[(i * batch + k) % len(frames)] for k in range(batch)]
+
+    for i in range(warmup):
+        model.predict(next_batch(i), imgsz=imgsz, device=device, verbose=False)
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(runs):
+        batch_start = time.perf_counter()
+        model.predict(next_batch(i), imgsz=imgsz, device=device, verbose=False)
+        latencies.append((time.perf_counter() - batch_start) / batch * 1000)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p90_ms": float(np.percentile(latencies, 90)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput": runs * batch / elapsed,
+    }
+
+
+def benchmark_models(
+    model_path: str,
+    formats: list,
+    imgsz_list: list,
+    batch_list: list,
+    device: str = "cpu",
+    runs: int = BENCHMARK_RUNS,
+    synthetic: bool = False,
+    skip_val: bool = False,
+    output: str = None,
+):
+    """
+    比較各種匯出格式、輸入大小與批次大小的推論速度與 mAP50
+
+    每個組合會重新匯出 (ONNX / OpenVINO 等格式的輸入形狀固定)，
+    暖機後計時推論，再以 model.val 在驗證集上計算 mAP50
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_yaml = os.path.join(script_dir, "data.yaml")
+    if output is None:
+        output = os.path.join(script_dir, "benchmark_results.json")
+
+    frames = load_benchmark_frames(synthetic)
+    source_model = YOLO(model_path)
+
+    print("=" * 60)
+    print("YOLOv11 推論基準測試")
+    print("=" * 60)
+    print(f"模型: {model_path}")
+    print(f"格式: {', '.join(formats)} | imgsz: {imgsz_list} | batch: {batch_list}")
+    print(f"設備: {device} | 測試畫面: {len(frames)} 張{' (合成)' if synthetic else ''}")
+    print("=" * 60)
+
+    rows = []
+    for fmt in formats:
+        for imgsz in imgsz_list:
+            for batch in batch_list:
+                tag = f"[{fmt} imgsz={imgsz} batch={batch}]"
+                row = {"format": fmt, "imgsz": imgsz, "batch": batch}
+                try:
+                    if fmt in ("pytorch", "pt"):
+                        model = source_model
+                    else:
+                        exported = source_model.export(format=fmt, imgsz=imgsz, batch=batch,
+                                                       device=device, verbose=False)
+                        model = YOLO(exported, task="detect")
+
+                    row.update(time_inference(model, frames, imgsz, batch, device, runs=runs))
+
+                    row["map50"] = None
+                    if not skip_val:
+                        metrics = model.val(data=data_yaml, imgsz=imgsz, batch=batch, device=device,
+                                            plots=False, verbose=False)
+                        row["map50"] = float(metrics.box.map50)
+                except Exception as e:
+                    print(f"{tag} 失敗: {e}")
+                    continue
+
+                map_text = f"{row['map50']:.4f}" if row["map50"] is not None else "-"
+                print(f"{tag} p50 {row['p50_ms']:.2f} ms | p99 {row['p99_ms']:.2f} ms | "
+                      f"{row['throughput']:.1f} 張/秒 | mAP50 {map_text}")
+                rows.append(row)
+
+    if not rows:
+        print("沒有任何組合成功完成")
+        return []
+
+    # 結果表格 (依吞吐量排序)
+    rows.sort(key=lambda r: r["throughput"], reverse=True)
+    print("\n" + "=" * 60)
+    print(f"{'格式':12} {'imgsz':>6} {'batch':>6} {'p50(ms)':>9} {'p90(ms)':>9} "
+          f"{'p99(ms)':>9} {'張/秒':>8} {'mAP50':>7}")
+    print("-" * 60)
+    for r in rows:
+        map_text = f"{r['map50']:.4f}" if r["map50"] is not None else "-"
+        print(f"{r['format']:12} {r['imgsz']:>6} {r['batch']:>6} {r['p50_ms']:>9.2f} "
+              f"{r['p90_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['throughput']:>8.1f} {map_text:>7}")
+
+    # 推薦: 準確率不低於最佳 PyTorch 結果太多的組合中最快者
+    recommended = None
+    baseline = [r["map50"] for r in rows if r["format"] in ("pytorch", "pt") and r["map50"] is not None]
+    if baseline:
+        threshold = max(baseline) - MAP_TOLERANCE
+        candidates = [r for r in rows if r["map50"] is not None and r["map50"] >= threshold]
+        if candidates:
+            recommended = candidates[0]
+            print("-" * 60)
+            print(f"推薦: {recommended['format']} imgsz={recommended['imgsz']} "
+                  f"batch={recommended['batch']} ({recommended['throughput']:.1f} 張/秒, "
+                  f"mAP50 {recommended['map50']:.4f})")
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"model": model_path, "device": device, "synthetic": synthetic,
+                   "results": rows, "recommended": recommended}, f, ensure_ascii=False, indent=2)
+    print(f"結果已儲存: {output}")
+    print("=" * 60)
+
+    return rows
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="YOLOv11 硬幣檢測訓練腳本")
 
     parser.add_argument("--mode", type=str, default="train",
-                       choices=["train", "val", "predict", "export"],
-                       help="執行模式: train/val/predict/export")
+                       choices=["train", "val", "predict", "export", "benchmark", "preflight"],
+                       help="執行模式: train/val/predict/export/benchmark/preflight")
     parser.add_argument("--model-size", type=str, default="n",
                        choices=["n", "s", "m", "l", "x"],
                        help="模型大小")
     parser.add_argument("--epochs", type=int, default=100,
                        help="訓練輪數")
-    parser.add_argument("--batch-size", type=int, default=16,
-                       help="批次大小")
+    parser.add_argument("--batch-size", type=int, default=None,
+                       help="批次大小 (預設使用 preflight 推薦值，沒有時為 16)")
     parser.add_argument("--img-size", type=int, default=640,
                        help="圖片大小")
-    parser.add_argument("--device", type=str, default="0",
-                       help="設備 (0=GPU, cpu=CPU)")
+    parser.add_argument("--device", type=str, default=None,
+                       help="設備 (0=GPU, cpu=CPU)；預設 benchmark 模式為 cpu，其他模式為 0")
     parser.add_argument("--resume", action="store_true",
                        help="從上次中斷處繼續訓練")
+    parser.add_argument("--workers", type=int, default=None,
+                       help="資料載入執行緒數 (預設使用 preflight 推薦值，沒有時為 8)")
+    parser.add_argument("--cache", type=str, default=None, choices=["ram", "disk", "none"],
+                       help="影像快取 (預設使用 preflight 推薦值)")
+    parser.add_argument("--no-preflight", action="store_true",
+                       help="訓練時不使用 preflight 的影像快取與推薦設定")
+    parser.add_argument("--no-probe", action="store_true",
+                       help="preflight 不量測速度 (只檢查標註與建立快取)")
     parser.add_argument("--model-path", type=str, default=None,
                        help="模型路徑 (用於 val/predict/export)")
     parser.add_argument("--source", type=str, default=None,
                        help="預測來源 (圖片/影片路徑或 0 表示攝影機)")
     parser.add_argument("--export-format", type=str, default="onnx",
                        help="匯出格式")
+    parser.add_argument("--formats", type=str, default=BENCHMARK_FORMATS,
+                       help="基準測試的格式 (逗號分隔): pytorch, onnx, openvino, torchscript ...")
+    parser.add_argument("--imgsz-list", type=str, default=BENCHMARK_IMGSZ,
+                       help="基準測試的輸入大小 (逗號分隔)")
+    parser.add_argument("--batch-list", type=str, default=BENCHMARK_BATCHES,
+                       help="基準測試的批次大小 (逗號分隔)")
+    parser.add_argument("--runs", type=int, default=BENCHMARK_RUNS,
+                       help="基準測試每個組合的計時批次數")
+    parser.add_argument("--synthetic", action="store_true",
+                       help="基準測試使用隨機畫面 (不讀取 valid/images)")
+    parser.add_argument("--skip-val", action="store_true",
+                       help="基準測試不計算 mAP50 (只測速度)")
 
     args = parser.parse_args()
 
+    if args.device is None:
+        # 基準測試用於選擇 CPU 後端，預設不使用 GPU
+        args.device = "cpu" if args.mode == "benchmark" else "0"
+
     if args.mode == "train":
         train_model(
             model_size=args.model_size,
@@ -188,6 +399,9 @@ if __name__ == "__main__":
             img_size=args.img_size,
             device=args.device,
             resume=args.resume,
+            workers=args.workers,
+            cache=False if args.cache == "none" else args.cache,
+            use_preflight=not args.no_preflight,
         )
 
     elif args.mode == "val":
@@ -207,3 +421,26 @@ if __name__ == "__main__":
             print("錯誤: 匯出模式需要指定 --model-path")
         else:
             export_model(args.model_path, args.export_format)
+
+    elif args.mode == "benchmark":
+        if args.model_path is None:
+            print("錯誤: 基準測試模式需要指定 --model-path")
+        else:
+            benchmark_models(
+                args.model_path,
+                formats=[f.strip() for f in args.formats.split(",") if f.strip()],
+                imgsz_list=[int(v) for v in args.imgsz_list.split(",")],
+                batch_list=[int(v) for v in args.batch_list.split(",")],
+                device=args.device,
+                runs=args.runs,
+                synthetic=args.synthetic,
+                skip_val=args.skip_val,
+            )
+
+    elif args.mode == "preflight":
+        run_preflight(
+            img_size=args.img_size,
+            model_size=args.model_size,
+            device=args.device,
+            probe=not args.no_probe,
+        )
@@ -2,34 +2,48 @@
 YOLOv11 硬幣檢測 GUI 應用程式
 使用 CustomTkinter 建立現代化介面
 
+啟動時視窗先出現，ultralytics / torch 在背景執行緒匯入 (模型狀態顯示載入中)，
+各模組的匯入時間印在主控台並附加到 startup_times.jsonl
+
 作者: AI Course
 日期: 2024
 """
 
+import time
+
+_START_TIME = time.perf_counter()
+
 import customtkinter as ctk
+import tkinter as tk
 from tkinter import filedialog, messagebox
 import cv2
 from PIL import Image, ImageTk
+import sys
 import threading
 import os
 import numpy as np
 
+from adaptive import AdaptiveController
+from multi_stream import MultiStreamRunner, make_mosaic, open_streams, parse_sources
+from postprocess import GUI_STYLE, CoinAnnotator, Detections
+
+# 背景匯入與啟動紀錄與 ocs_system 共用 (紀錄格式相同，兩邊的 startup_times.jsonl 可直接比較)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ocs_system"))
+from utils.startup import BackgroundImporter, append_startup_log
+
+_GUI_IMPORT_TIME = time.perf_counter() - _START_TIME
+
+# ============== 設定區 ==============
+PRELOAD_MODULES = ["torch", "ultralytics"]     # 視窗出現後在背景匯入
+PRELOAD_DELAY_MS = 100                         # 等視窗畫出來再開始匯入
+PRELOAD_POLL_MS = 100
+STARTUP_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_times.jsonl")
+
 # 設定 CustomTkinter 外觀
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
 
-# 硬幣面額對應表
-COIN_VALUES = {
-    '1h': 1, '1t': 1,
-    '5h': 5, '5t': 5,
-    '10h': 10, '10t': 10,
-    '50h': 50, '50t': 50,
-    '0': 0,
-    'test': 0,
-}
-
-
 class YOLOApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -43,12 +57,66 @@ class YOLOApp(ctk.CTk):
         self.model = None
         self.model_path = ctk.StringVar(value="尚未載入模型")
         self.conf_threshold = ctk.DoubleVar(value=0.25)
+        self.target_fps = ctk.IntVar(value=0)       # 0 = 關閉自適應畫質
         self.is_running = False
         self.cap = None
+        self.grabbers = []          # 多台攝影機的讀取執行緒
         self.current_source = None
+        self.annotator = CoinAnnotator(GUI_STYLE)
+
+        # 畫面顯示: 處理執行緒只留下最新一張，Tk 執行緒重複使用同一個緩衝區與 PhotoImage
+        self._frame_lock = threading.Lock()
+        self._pending_frame = None
+        self._render_scheduled = False
+        self._display_buffer = None
+        self._photo = None
+        self.display_fps = 0.0
+        self._display_count = 0
+        self._display_fps_start = time.perf_counter()
+
+        # 背景匯入 ultralytics (模型載入前等待完成)
+        self.importer = BackgroundImporter(PRELOAD_MODULES)
+        self._window_shown = None
 
         # 建立 UI
         self.create_widgets()
+        self.after(PRELOAD_DELAY_MS, self._start_preload)
+
+    def _start_preload(self):
+        """視窗出現後開始在背景匯入耗時的套件"""
+        self._window_shown = time.perf_counter() - _START_TIME
+        self.model_status.configure(text="● 背景載入 YOLO 套件...", text_color="yellow")
+        self.importer.start()
+        self.after(PRELOAD_POLL_MS, self._poll_preload)
+
+    def _poll_preload(self):
+        if self.importer.is_done():
+            self._on_preload_done()
+        else:
+            self.after(PRELOAD_POLL_MS, self._poll_preload)
+
+    def _on_preload_done(self):
+        """背景匯入完成: 更新狀態並記錄啟動時間"""
+        ready = time.perf_counter() - _START_TIME
+
+        if self.model is None and str(self.select_model_btn.cget("state")) == "normal":
+            if self.importer.error:
+                self.model_status.configure(text="● YOLO 套件載入失敗", text_color="red")
+            else:
+                self.model_status.configure(text="● 模型未載入", text_color="red")
+
+        timings = {"gui modules": _GUI_IMPORT_TIME}
+        timings.update(self.importer.timings)
+
+        print("⏱️ 模組匯入時間:")
+        print(f"  {'gui modules':28} {_GUI_IMPORT_TIME * 1000:8.0f} ms (視窗出現前)")
+        print(self.importer.report())
+        print(f"  視窗出現: {self._window_shown:.2f} 秒")
+        print(f"  YOLO 就緒: {ready:.2f} 秒")
+        if self.importer.error:
+            print(f"  背景匯入失敗: {self.importer.error}")
+
+        append_startup_log(STARTUP_LOG, timings, window_shown=self._window_shown, ready=ready)
 
     def create_widgets(self):
         """建立所有 UI 元件 - 三欄式布局"""
@@ -68,12 +136,20 @@ class YOLOApp(ctk.CTk):
         self.display_frame = ctk.CTkFrame(main_container)
         self.display_frame.pack(side="left", fill="both", expand=True, padx=(0, 10))
 
-        self.image_label = ctk.CTkLabel(
+        self.display_canvas = tk.Canvas(
             self.display_frame,
+            bg="#2b2b2b",
+            highlightthickness=0
+        )
+        self.display_canvas.pack(expand=True, fill="both", padx=10, pady=10)
+        self._image_item = self.display_canvas.create_image(0, 0, anchor="center")
+        self._placeholder_item = self.display_canvas.create_text(
+            0, 0,
             text="請載入模型並選擇來源",
-            font=ctk.CTkFont(size=16)
+            fill="gray70",
+            font=("Arial", 16)
         )
-        self.image_label.pack(expand=True, fill="both")
+        self.display_canvas.bind("<Configure>", self._on_display_resize)
 
         # ===== 右側：統計 Dashboard =====
         self.dashboard_frame = ctk.CTkFrame(main_container, width=280)
@@ -156,6 +232,43 @@ class YOLOApp(ctk.CTk):
         )
         self.conf_slider.pack(fill="x", padx=8, pady=(3, 8))
 
+        # ----- 目標 FPS (自適應畫質) -----
+        fps_section = ctk.CTkFrame(self.control_frame)
+        fps_section.pack(fill="x", padx=8, pady=5)
+
+        fps_header = ctk.CTkFrame(fps_section, fg_color="transparent")
+        fps_header.pack(fill="x", padx=8, pady=(8, 3))
+
+        ctk.CTkLabel(
+            fps_header,
+            text="目標 FPS",
+            font=ctk.CTkFont(size=12, weight="bold")
+        ).pack(side="left")
+
+        self.target_fps_label = ctk.CTkLabel(
+            fps_header,
+            text="關閉",
+            font=ctk.CTkFont(size=12, weight="bold"),
+            text_color="#00BFFF"
+        )
+        self.target_fps_label.pack(side="right")
+
+        ctk.CTkSlider(
+            fps_section,
+            from_=0,
+            to=30,
+            number_of_steps=30,
+            variable=self.target_fps,
+            command=self.update_target_fps_label
+        ).pack(fill="x", padx=8, pady=(3, 2))
+
+        ctk.CTkLabel(
+            fps_section,
+            text="跟不上時自動降低解析度 / 跳幀",
+            font=ctk.CTkFont(size=9),
+            text_color="gray60"
+        ).pack(pady=(0, 8))
+
         # ----- 來源選擇區 -----
         source_section = ctk.CTkFrame(self.control_frame)
         source_section.pack(fill="x", padx=8, pady=5)
@@ -193,6 +306,26 @@ class YOLOApp(ctk.CTk):
         )
         self.webcam_btn.pack(fill="x", padx=8, pady=2)
 
+        camera_row = ctk.CTkFrame(source_section, fg_color="transparent")
+        camera_row.pack(fill="x", padx=8, pady=2)
+
+        ctk.CTkLabel(
+            camera_row,
+            text="攝影機編號",
+            font=ctk.CTkFont(size=10)
+        ).pack(side="left")
+
+        self.camera_entry = ctk.CTkEntry(camera_row, width=110, height=26)
+        self.camera_entry.insert(0, "0")
+        self.camera_entry.pack(side="right")
+
+        ctk.CTkLabel(
+            source_section,
+            text="多台以逗號分隔，例如 0,1",
+            font=ctk.CTkFont(size=9),
+            text_color="gray60"
+        ).pack(anchor="e", padx=8)
+
         self.stop_btn = ctk.CTkButton(
             source_section,
             text="⏹ 停止偵測",
@@ -365,10 +498,24 @@ class YOLOApp(ctk.CTk):
         )
         self.fps_label.pack(pady=(5, 0))
 
+        # ===== 目前畫質模式 =====
+        self.mode_label = ctk.CTkLabel(
+            status_section,
+            text="",
+            font=ctk.CTkFont(size=10),
+            text_color="gray50"
+        )
+        self.mode_label.pack(pady=(2, 0))
+
     def update_conf_label(self, value):
         """更新信心閾值標籤"""
         self.conf_label.configure(text=f"{value:.2f}")
 
+    def update_target_fps_label(self, value):
+        """更新目標 FPS 標籤"""
+        value = int(value)
+        self.target_fps_label.configure(text=f"{value}" if value > 0 else "關閉")
+
     def select_model(self):
         """選擇並載入模型"""
         file_path = filedialog.askopenfilename(
@@ -391,6 +538,11 @@ class YOLOApp(ctk.CTk):
     def _load_model_thread(self):
         """在獨立線程中載入模型"""
         try:
+            if not self.importer.is_done():
+                self.after(0, lambda: self.model_status.configure(text="● 等待 YOLO 套件載入..."))
+                self.importer.wait()
+                self.after(0, lambda: self.model_status.configure(text="● 載入中..."))
+
             from ultralytics import YOLO
             model_path = self._loading_model_path
             model = YOLO(model_path)
@@ -493,8 +645,17 @@ class YOLOApp(ctk.CTk):
             self.start_webcam()
 
     def start_webcam(self):
-        """開啟攝影機"""
-        self.cap = cv2.VideoCapture(0)
+        """開啟攝影機 (多個編號時改用多路批次推論)"""
+        cameras = parse_sources(self.camera_entry.get() or "0")
+        if not cameras or not all(isinstance(c, int) for c in cameras):
+            messagebox.showerror("錯誤", "攝影機編號需為數字，多台以逗號分隔")
+            return
+
+        if len(cameras) > 1:
+            self.start_multi_webcam(cameras)
+            return
+
+        self.cap = cv2.VideoCapture(cameras[0])
         if not self.cap.isOpened():
             messagebox.showerror("錯誤", "無法開啟攝影機")
             return
@@ -510,11 +671,63 @@ class YOLOApp(ctk.CTk):
         thread = threading.Thread(target=self.video_loop, daemon=True)
         thread.start()
 
+    def start_multi_webcam(self, cameras):
+        """開啟多台攝影機，共用同一個模型批次推論"""
+        try:
+            self.grabbers = open_streams(cameras, flip_cameras=True)
+        except RuntimeError as e:
+            messagebox.showerror("錯誤", str(e))
+            return
+
+        self.is_running = True
+        self.current_source = "webcam"
+        self.webcam_btn.configure(text="📹 關閉攝影機")
+        self.stop_btn.configure(state="normal")
+
+        thread = threading.Thread(target=self.multi_stream_loop, daemon=True)
+        thread.start()
+
+    def multi_stream_loop(self):
+        """多台攝影機處理迴圈: 每次將各台的最新畫面合併成一次推論"""
+        grabbers = self.grabbers
+        runner = MultiStreamRunner(self.model, grabbers)
+        names = [grabber.name for grabber in grabbers]
+        annotated = [None] * len(grabbers)
+        coins_per_stream = [[] for _ in grabbers]
+
+        try:
+            while self.is_running:
+                runner.conf = self.conf_threshold.get()
+                outputs = runner.tick()
+                if not outputs:
+                    time.sleep(0.002)
+                    continue
+
+                for i, frame, result in outputs:
+                    annotated[i], coins_per_stream[i] = self.process_results([result], frame)
+
+                mosaic = make_mosaic(annotated, names)
+                coins = [coin for stream_coins in coins_per_stream for coin in stream_coins]
+                fps_text = f"推論 FPS: {sum(runner.fps()):.1f} ({len(grabbers)} 台)"
+
+                self.submit_frame(mosaic, coins, fps_text)
+        finally:
+            for grabber in grabbers:
+                grabber.stop()
+
+        self.after(0, self.on_video_stopped)
+
     def video_loop(self):
-        """影片/攝影機處理迴圈"""
-        import time
+        """
+        影片/攝影機處理迴圈
+        設定目標 FPS 時由 AdaptiveController 調整 imgsz 與跳幀，跳過的畫面沿用上一次的偵測結果
+        """
+        controller = AdaptiveController()
+        last_detections = []
         frame_count = 0
-        start_time = time.time()
+        infer_count = 0
+        window_start = time.perf_counter()
+        fps_text = ""
 
         while self.is_running and self.cap is not None:
             ret, frame = self.cap.read()
@@ -525,27 +738,38 @@ class YOLOApp(ctk.CTk):
                 else:
                     break
 
+            # 處理時間不含讀取 (攝影機讀取會等待下一張畫面)
+            start = time.perf_counter()
+
             if self.current_source == "webcam":
                 frame = cv2.flip(frame, 1)
 
-            results = self.model.predict(
-                frame,
-                conf=self.conf_threshold.get(),
-                verbose=False
-            )
+            controller.target_fps = self.target_fps.get()
+            if controller.should_infer():
+                infer_start = time.perf_counter()
+                results = self.model.predict(
+                    frame,
+                    imgsz=controller.imgsz,
+                    conf=self.conf_threshold.get(),
+                    verbose=False
+                )
+                controller.record_inference(time.perf_counter() - infer_start)
+                last_detections = [Detections.from_result(result) for result in results]
+                infer_count += 1
 
-            annotated_frame, coins = self.process_results(results, frame)
+            annotated_frame, coins = self.draw_detections(last_detections, frame)
+            controller.record_frame(time.perf_counter() - start)
 
-            # 計算 FPS
+            # 計算 FPS (每秒更新一次)
             frame_count += 1
-            elapsed = time.time() - start_time
-            if elapsed > 0:
-                fps = frame_count / elapsed
-                fps_text = f"FPS: {fps:.1f}"
-            else:
-                fps_text = ""
+            elapsed = time.perf_counter() - window_start
+            if elapsed >= 1.0:
+                fps_text = f"處理 FPS: {frame_count / elapsed:.1f} | 推論 {infer_count / elapsed:.1f} 次/秒"
+                frame_count = 0
+                infer_count = 0
+                window_start = time.perf_counter()
 
-            self.after(0, lambda f=annotated_frame, c=coins, ft=fps_text: self.update_gui(f, c, ft))
+            self.submit_frame(annotated_frame, coins, fps_text, controller.describe())
 
         self.after(0, self.on_video_stopped)
 
@@ -557,109 +781,102 @@ class YOLOApp(ctk.CTk):
         self.webcam_btn.configure(text="📹 開啟攝影機")
         self.stop_btn.configure(state="disabled")
         self.fps_label.configure(text="")
+        self.mode_label.configure(text="")
+
+    def submit_frame(self, frame, coins, fps_text="", mode_text=""):
+        """
+        由處理執行緒呼叫: 只保留最新一張待顯示的畫面
+        介面來不及顯示時，舊畫面直接被新畫面取代，不會在事件佇列中堆積
+        """
+        with self._frame_lock:
+            self._pending_frame = (frame, coins, fps_text, mode_text)
+            if self._render_scheduled:
+                return
+            self._render_scheduled = True
+
+        self.after(0, self._render_pending)
 
-    def update_gui(self, frame, coins, fps_text=""):
+    def _render_pending(self):
+        with self._frame_lock:
+            pending = self._pending_frame
+            self._pending_frame = None
+            self._render_scheduled = False
+
+        if pending is not None:
+            self.update_gui(*pending)
+
+    def update_gui(self, frame, coins, fps_text="", mode_text=""):
         """更新 GUI"""
         if self.is_running:
             self.display_frame_on_gui(frame)
             self.update_detection_results(coins)
             if fps_text:
-                self.fps_label.configure(text=fps_text)
+                self.fps_label.configure(text=f"{fps_text}\n顯示 FPS: {self.display_fps:.1f}")
+            self.mode_label.configure(text=mode_text)
 
     def process_results(self, results, frame):
-        """處理偵測結果"""
-        detected_coins = []
-        annotated_frame = frame.copy()
-
-        for result in results:
-            boxes = result.boxes
-            names = result.names
-
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                conf = float(box.conf[0])
-                cls_id = int(box.cls[0])
-                class_name = names[cls_id]
-
-                detected_coins.append(class_name)
-
-                # 根據硬幣類型選擇顏色 (BGR)
-                if class_name.startswith('50'):
-                    color = (0, 140, 255)       # 深橙色
-                    text_color = (255, 255, 255)
-                elif class_name.startswith('10'):
-                    color = (47, 133, 205)      # 棕色
-                    text_color = (255, 255, 255)
-                elif class_name.startswith('5'):
-                    color = (34, 139, 34)       # 深綠色
-                    text_color = (255, 255, 255)
-                elif class_name.startswith('1'):
-                    color = (225, 105, 65)      # 藍色
-                    text_color = (255, 255, 255)
-                else:
-                    color = (128, 0, 128)       # 紫色
-                    text_color = (255, 255, 255)
-
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 4)
+        """處理偵測結果 (直接繪製在 frame 上，顏色依面額區分)"""
+        return self.draw_detections([Detections.from_result(result) for result in results], frame)
 
-                value = COIN_VALUES.get(class_name, 0)
-                label = f"{class_name} {conf:.2f}"
-                if value > 0:
-                    label += f" (${value})"
+    def draw_detections(self, detections_list, frame):
+        """繪製 Detections 並回傳 (畫面, 偵測到的類別名稱列表)"""
+        detected_coins = []
+        total = 0
 
-                (label_w, label_h), _ = cv2.getTextSize(
-                    label, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2
-                )
-                cv2.rectangle(
-                    annotated_frame,
-                    (x1, y1 - label_h - 10),
-                    (x1 + label_w + 10, y1),
-                    color, -1
-                )
-                cv2.putText(
-                    annotated_frame, label,
-                    (x1 + 5, y1 - 5),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, text_color, 2
-                )
+        for detections in detections_list:
+            self.annotator.annotate(frame, detections, show_total=False)
+            detected_coins.extend(detections.class_names())
+            total += self.annotator.total_value(detections)
 
         # 顯示總金額
         if detected_coins:
-            total = sum(COIN_VALUES.get(c, 0) for c in detected_coins)
-            total_text = f"Total: ${total}"
-            (tw, th), _ = cv2.getTextSize(total_text, cv2.FONT_HERSHEY_SIMPLEX, 1.5, 3)
-            cv2.rectangle(annotated_frame, (5, 10), (tw + 20, th + 25), (0, 0, 139), -1)
-            cv2.putText(
-                annotated_frame, total_text,
-                (10, 50),
-                cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3
-            )
+            self.annotator.draw_total(frame, total)
+
+        return frame, detected_coins
 
-        return annotated_frame, detected_coins
+    def _on_display_resize(self, event):
+        """顯示區大小改變時置中圖片與提示文字"""
+        self.display_canvas.coords(self._image_item, event.width // 2, event.height // 2)
+        self.display_canvas.coords(self._placeholder_item, event.width // 2, event.height // 2)
 
     def display_frame_on_gui(self, frame):
-        """在 GUI 上顯示影像"""
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        """
+        在 GUI 上顯示影像
+        縮放與色彩轉換寫入同一個緩衝區，再貼到同一個 PhotoImage (大小改變時才重新建立)
+        """
+        display_width = self.display_canvas.winfo_width()
+        display_height = self.display_canvas.winfo_height()
+
+        h, w = frame.shape[:2]
+        if display_width > 1 and display_height > 1:
+            scale = min(display_width / w, display_height / h)
+            new_w, new_h = max(1, int(w * scale)), max(1, int(h * scale))
+        else:
+            new_w, new_h = w, h
 
-        display_width = self.display_frame.winfo_width() - 20
-        display_height = self.display_frame.winfo_height() - 20
+        if self._display_buffer is None or self._display_buffer.shape[:2] != (new_h, new_w):
+            self._display_buffer = np.empty((new_h, new_w, 3), dtype=np.uint8)
+            self._photo = ImageTk.PhotoImage("RGB", (new_w, new_h))
+            self.display_canvas.itemconfig(self._image_item, image=self._photo)
+            self.display_canvas.itemconfig(self._placeholder_item, state="hidden")
 
-        if display_width > 0 and display_height > 0:
-            h, w = frame_rgb.shape[:2]
-            scale = min(display_width / w, display_height / h)
-            new_w, new_h = int(w * scale), int(h * scale)
-            frame_resized = cv2.resize(frame_rgb, (new_w, new_h))
+        buffer = self._display_buffer
+        if (new_w, new_h) == (w, h):
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffer)
         else:
-            frame_resized = frame_rgb
+            # 先縮小再轉色彩，只需處理顯示大小的像素
+            cv2.resize(frame, (new_w, new_h), dst=buffer, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(buffer, cv2.COLOR_BGR2RGB, dst=buffer)
 
-        image = Image.fromarray(frame_resized)
-        photo = ctk.CTkImage(
-            light_image=image,
-            dark_image=image,
-            size=(frame_resized.shape[1], frame_resized.shape[0])
-        )
+        self._photo.paste(Image.fromarray(buffer))
 
-        self.image_label.configure(image=photo, text="")
-        self.image_label.image = photo
+        # 顯示 FPS (每秒更新一次)
+        self._display_count += 1
+        elapsed = time.perf_counter() - self._display_fps_start
+        if elapsed >= 1.0:
+            self.display_fps = self._display_count / elapsed
+            self._display_count = 0
+            self._display_fps_start = time.perf_counter()
 
     def update_detection_results(self, coins):
         """更新偵測結果顯示 (Dashboard)"""
@@ -720,6 +937,7 @@ class YOLOApp(ctk.CTk):
         self.stop_btn.configure(state="disabled")
         self.status_label.configure(text="● 等待偵測...", text_color="gray60")
         self.fps_label.configure(text="")
+        self.mode_label.configure(text="")
 
     def on_closing(self):
         """關閉視窗時的處理"""
@@ -0,0 +1,327 @@
+"""
+手勢事件串流
+將 MediaPipe 的 multi_hand_landmarks 轉換成手勢事件 (手指數、捏合、揮動)，
+透過本機 TCP (每行一個 JSON) 發布，其他程式 (例如計算機) 訂閱即可使用，不必重新執行 MediaPipe
+
+事件格式 (每行一個 JSON):
+    {"type": "fingers", "hand": "Right", "count": 3, "time": 1712345678.123}
+    {"type": "pinch_start", "hand": "Right", "x": 0.52, "y": 0.41, "time": ...}
+    {"type": "pinch_end", "hand": "Right", "time": ...}
+    {"type": "swipe", "hand": "Left", "direction": "right", "time": ...}
+    {"type": "hand_lost", "hand": "Left", "time": ...}
+
+使用方式:
+    python hand_tracking.py --publish              # 追蹤並發布事件 (預設 port 5555)
+    python gesture_events.py                        # 訂閱並印出事件
+
+    # 在其他程式中訂閱
+    from gesture_events import subscribe
+    for event in subscribe():
+        if event["type"] == "fingers":
+            print(event["count"])
+
+安裝套件:
+    pip install numpy
+"""
+
+import argparse
+import json
+import queue
+import socket
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# ============== 設定區 ==============
+HOST = "127.0.0.1"
+PORT = 5555
+LANDMARK_ALPHA = 0.5            # 關鍵點時間平滑係數 (越小越平滑、延遲越大)
+COUNT_WINDOW = 5                # 手指數取最近幾次偵測的多數決
+PINCH_ON = 0.25                 # 拇指與食指距離 / 手掌大小 低於此值開始捏合
+PINCH_OFF = 0.35                # 高於此值結束捏合 (遲滯，避免抖動)
+SWIPE_WINDOW = 0.4              # 揮動判斷的時間範圍 (秒)
+SWIPE_DISTANCE = 0.25           # 時間範圍內手掌移動超過此距離 (畫面比例) 視為揮動
+SWIPE_COOLDOWN = 0.6            # 兩次揮動事件的最短間隔 (秒)
+LOST_TIMEOUT = 0.5              # 手消失多久後發出 hand_lost (秒)
+
+# MediaPipe 手部關鍵點編號
+WRIST = 0
+THUMB_IP, THUMB_TIP = 3, 4
+INDEX_MCP = 5
+MIDDLE_MCP = 9
+PINKY_MCP = 17
+FINGER_PIPS = np.array([6, 10, 14, 18])      # 食指 ~ 小指第二關節
+FINGER_TIPS = np.array([8, 12, 16, 20])      # 食指 ~ 小指指尖
+PALM_POINTS = np.array([WRIST, INDEX_MCP, MIDDLE_MCP, PINKY_MCP])
+
+
+def make_event(event_type: str, hand: str, **fields) -> dict:
+    """事件 dict (time 為 Unix 時間，其他程式可用來計算延遲)"""
+    event = {"type": event_type, "hand": hand}
+    event.update(fields)
+    event["time"] = round(time.time(), 3)
+    return event
+
+
+def landmarks_to_array(hand_landmarks) -> np.ndarray:
+    """MediaPipe 關鍵點 -> (21, 3) 陣列 (正規化座標)"""
+    return np.array([(lm.x, lm.y, lm.z) for lm in hand_landmarks.landmark], dtype=np.float32)
+
+
+# ============== 手勢幾何 (向量化) ==============
+def hand_size(points: np.ndarray) -> float:
+    """手腕到中指根部的距離，用來正規化其他距離 (與手離鏡頭遠近無關)"""
+    return float(np.linalg.norm(points[MIDDLE_MCP, :2] - points[WRIST, :2])) or 1e-6
+
+
+def extended_fingers(points: np.ndarray) -> np.ndarray:
+    """
+    五根手指是否伸直 (拇指, 食指, 中指, 無名指, 小指)
+    食指 ~ 小指: 指尖離手腕比第二關節遠
+    拇指: 指尖離食指根部比拇指第一關節遠
+    """
+    xy = points[:, :2]
+    wrist = xy[WRIST]
+    tips = np.linalg.norm(xy[FINGER_TIPS] - wrist, axis=1)
+    pips = np.linalg.norm(xy[FINGER_PIPS] - wrist, axis=1)
+
+    thumb = (np.linalg.norm(xy[THUMB_TIP] - xy[INDEX_MCP])
+             > np.linalg.norm(xy[THUMB_IP] - xy[INDEX_MCP]))
+    return np.concatenate([[thumb], tips > pips])
+
+
+def pinch_distance(points: np.ndarray) -> float:
+    """拇指尖與食指尖距離 / 手掌大小"""
+    return float(np.linalg.norm(points[THUMB_TIP, :2] - points[FINGER_TIPS[0], :2])) / hand_size(points)
+
+
+def palm_center(points: np.ndarray) -> np.ndarray:
+    return points[PALM_POINTS, :2].mean(axis=0)
+
+
+# ============== 手勢引擎 ==============
+class _HandState:
+    """單手的時間狀態"""
+
+    def __init__(self):
+        self.points = None                          # 平滑後的關鍵點
+        self.counts = deque(maxlen=COUNT_WINDOW)
+        self.count = None                           # 已發布的手指數
+        self.pinching = False
+        self.track = deque()                        # (時間, 手掌中心)
+        self.last_swipe = 0.0
+        self.last_seen = 0.0
+
+
+class GestureEngine:
+    """
+    每次偵測結果呼叫 update()，回傳這次產生的事件列表
+    只有狀態改變時才產生事件 (手指數改變、開始 / 結束捏合、揮動、手消失)
+    """
+
+    def __init__(self, alpha: float = LANDMARK_ALPHA):
+        self.alpha = alpha
+        self.hands = {}                             # "Left" / "Right" -> _HandState
+
+    def update(self, multi_hand_landmarks, multi_handedness, timestamp: float = None) -> list:
+        now = time.perf_counter() if timestamp is None else timestamp
+        events = []
+        seen = set()
+
+        for i, hand_landmarks in enumerate(multi_hand_landmarks or []):
+            label = (multi_handedness[i].classification[0].label
+                     if multi_handedness and i < len(multi_handedness) else f"hand{i}")
+            if label in seen:
+                label = f"{label}{i}"
+            seen.add(label)
+
+            state = self.hands.setdefault(label, _HandState())
+            events.extend(self._update_hand(label, state, landmarks_to_array(hand_landmarks), now))
+
+        # 一段時間沒出現的手
+        for label in list(self.hands):
+            if label not in seen and now - self.hands[label].last_seen > LOST_TIMEOUT:
+                del self.hands[label]
+                events.append(make_event("hand_lost", label))
+
+        return events
+
+    def _update_hand(self, label: str, state: _HandState, points: np.ndarray, now: float) -> list:
+        events = []
+
+        # 關鍵點指數平滑 (手剛出現或離開太久時直接採用新座標)
+        if state.points is None or now - state.last_seen > LOST_TIMEOUT:
+            state.points = points
+            state.track.clear()
+        else:
+            state.points += self.alpha * (points - state.points)
+        state.last_seen = now
+        points = state.points
+
+        # 手指數: 最近幾次的多數決，穩定改變才發布
+        state.counts.append(int(extended_fingers(points).sum()))
+        values, votes = np.unique(np.array(state.counts), return_counts=True)
+        count = int(values[votes.argmax()])
+        if votes.max() > len(state.counts) // 2 and count != state.count:
+            state.count = count
+            events.append(make_event("fingers", label, count=count))
+
+        # 捏合 (遲滯門檻)
+        distance = pinch_distance(points)
+        if not state.pinching and distance < PINCH_ON:
+            state.pinching = True
+            x, y = (points[THUMB_TIP, :2] + points[FINGER_TIPS[0], :2]) / 2
+            events.append(make_event("pinch_start", label, x=round(float(x), 4), y=round(float(y), 4)))
+        elif state.pinching and distance > PINCH_OFF:
+            state.pinching = False
+            events.append(make_event("pinch_end", label))
+
+        # 揮動: 時間範圍內手掌中心的位移
+        center = palm_center(points)
+        state.track.append((now, center))
+        while state.track and now - state.track[0][0] > SWIPE_WINDOW:
+            state.track.popleft()
+
+        dx, dy = center - state.track[0][1]
+        if (max(abs(dx), abs(dy)) > SWIPE_DISTANCE and now - state.last_swipe > SWIPE_COOLDOWN
+                and not state.pinching):
+            if abs(dx) >= abs(dy):
+                direction = "right" if dx > 0 else "left"
+            else:
+                direction = "down" if dy > 0 else "up"
+            state.last_swipe = now
+            state.track.clear()
+            events.append(make_event("swipe", label, direction=direction))
+
+        return events
+
+
+# ============== 發布 / 訂閱 ==============
+class EventPublisher:
+    """
+    本機 TCP 伺服器，將事件以 JSON Lines 發送給所有連線的訂閱者
+    同一個程式內的使用者也可以用 subscribe_queue() 取得 queue.Queue
+    發送在背景執行緒進行，publish() 不會因為慢的訂閱者而阻塞偵測
+    """
+
+    def __init__(self, host: str = HOST, port: int = PORT):
+        self.host = host
+        self.port = port
+        self._clients = []
+        self._queues = []
+        self._lock = threading.Lock()
+        self._outbox = queue.Queue()
+        self._server = None
+        self.running = False
+
+    def start(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen()
+        self._server.settimeout(0.5)
+        self.running = True
+
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._send_loop, daemon=True).start()
+        print(f"手勢事件發布於 {self.host}:{self.port}")
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                client, address = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            client.settimeout(1.0)
+            with self._lock:
+                self._clients.append(client)
+            print(f"訂閱者連線: {address[0]}:{address[1]}")
+
+    def _send_loop(self):
+        while self.running:
+            try:
+                event = self._outbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            with self._lock:
+                clients = list(self._clients)
+
+            for client in clients:
+                try:
+                    client.sendall(data)
+                except OSError:
+                    # 訂閱者已斷線
+                    with self._lock:
+                        if client in self._clients:
+                            self._clients.remove(client)
+                    client.close()
+
+    def subscribe_queue(self, maxsize: int = 100) -> queue.Queue:
+        """同一程式內的訂閱者 (佇列滿時丟棄最舊的事件)"""
+        q = queue.Queue(maxsize=maxsize)
+        with self._lock:
+            self._queues.append(q)
+        return q
+
+    def publish(self, events: list):
+        for event in events:
+            self._outbox.put(event)
+            with self._lock:
+                queues = list(self._queues)
+            for q in queues:
+                if q.full():
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+                q.put_nowait(event)
+
+    def stop(self):
+        self.running = False
+        if self._server is not None:
+            self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients.clear()
+
+
+def subscribe(host: str = HOST, port: int = PORT, retry: float = 1.0):
+    """
+    連線到發布者並逐一產生事件 (dict)
+    連線中斷時每隔 retry 秒重新連線
+    """
+    while True:
+        try:
+            with socket.create_connection((host, port)) as sock:
+                for line in sock.makefile("r", encoding="utf-8"):
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+        except OSError:
+            # 連線被拒、重置或中斷 (ConnectionError 皆為 OSError 子類別)，稍後重連
+            pass
+        time.sleep(retry)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="訂閱手勢事件並印出")
+    parser.add_argument("--host", type=str, default=HOST,
+                        help="發布者位址")
+    parser.add_argument("--port", type=int, default=PORT,
+                        help="發布者 port")
+    args = parser.parse_args()
+
+    print(f"訂閱 {args.host}:{args.port} 的手勢事件，Ctrl+C 結束")
+    try:
+        for event in subscribe(args.host, args.port):
+            print(event)
+    except KeyboardInterrupt:
+        pass
@@ -1,81 +1,418 @@
 """
 MediaPipe 手部追蹤範例
-最簡單的手部偵測與關鍵點繪製
+手部偵測與關鍵點繪製 (低延遲管線版)
+
+架構 (三個階段各自執行，互不等待):
+1. 讀取執行緒: 持續讀取攝影機，只保留最新一張畫面 (偵測跟不上時自動丟棄舊畫面)
+2. 偵測執行緒: 取最新畫面縮小到 --infer-width 後執行 hands.process
+   (MediaPipe 關鍵點為 0~1 的正規化座標，直接對應回原尺寸畫面)
+3. 主執行緒: 以攝影機速度顯示最新畫面，疊上最近一次的偵測結果與各階段延遲
 
 使用方式:
     python hand_tracking.py
+    python hand_tracking.py --infer-width 480 --camera 1
+    python hand_tracking.py --publish            # 發布手勢事件 (見 gesture_events.py)
+    python hand_tracking.py --sound              # 偵測到手 / 手勢時播放提示音
 
 安裝套件:
     pip install mediapipe opencv-python
 """
 
+import argparse
+import os
+import threading
+import time
+from collections import deque
+
 import cv2
 import mediapipe as mp
+import numpy as np
+
+# ============== 設定區 ==============
+CAMERA_WIDTH = 1280
+CAMERA_HEIGHT = 720
+INFER_WIDTH = 640               # 偵測用畫面寬度 (0 = 不縮小)
+MAX_NUM_HANDS = 2
+EMA_ALPHA = 0.1                 # 延遲顯示的平滑係數
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HAND_CUE = os.path.join(REPO_DIR, "Hand Sign.wav")         # 偵測到手時的提示音
+GESTURE_CUE = os.path.join(REPO_DIR, "Hand Sign_2.wav")    # 手勢事件 (--publish) 的提示音
+CUE_COOLDOWN = 1.0              # 同一提示音的最短間隔 (秒)
+
+mp_hands = mp.solutions.hands
+mp_draw = mp.solutions.drawing_utils
+
+
+def _ema(old, value, alpha=EMA_ALPHA):
+    return value if old is None else old + alpha * (value - old)
+
+
+def landmarks_to_pixels(hand_landmarks, width: int, height: int) -> np.ndarray:
+    """正規化關鍵點 -> (21, 2) 像素座標 (對應到任何尺寸的畫面)"""
+    points = np.array([(lm.x, lm.y) for lm in hand_landmarks.landmark], dtype=np.float32)
+    return points * np.array([width, height], dtype=np.float32)
+
+
+# ============== 讀取執行緒 ==============
+class FrameGrabber:
+    """背景執行緒持續讀取攝影機 (鏡像翻轉)，只保留最新一張畫面與讀取時間"""
+
+    def __init__(self, camera_id: int = 0, width: int = CAMERA_WIDTH, height: int = CAMERA_HEIGHT):
+        self.cap = cv2.VideoCapture(camera_id)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        # 驅動程式的緩衝區只留 1 張，避免讀到舊畫面 (部分後端不支援，忽略即可)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._timestamp = 0.0
+        self.frame_id = 0
+        self.running = False
+        self._thread = None
+
+    def is_opened(self) -> bool:
+        return self.cap.isOpened()
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            timestamp = time.perf_counter()
+            if not ret:
+                break
+
+            # 水平翻轉 (鏡像)
+            frame = cv2.flip(frame, 1)
+
+            with self._cond:
+                self._frame = frame
+                self._timestamp = timestamp
+                self.frame_id += 1
+                self._cond.notify_all()
+
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+    def latest(self):
+        """回傳 (畫面編號, 畫面, 讀取時間)，尚未讀到畫面時畫面為 None"""
+        with self._cond:
+            return self.frame_id, self._frame, self._timestamp
+
+    def wait_newer(self, frame_id: int, timeout: float = 0.5):
+        """等待比 frame_id 更新的畫面，逾時或停止時回傳目前最新的畫面"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.frame_id != frame_id or not self.running, timeout)
+            return self.frame_id, self._frame, self._timestamp
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self.cap.release()
+
+
+# ============== 偵測執行緒 ==============
+class HandResult:
+    """一次偵測的結果與各階段時間"""
+
+    __slots__ = ("frame_id", "multi_hand_landmarks", "multi_handedness",
+                 "captured", "started", "finished")
+
+    def __init__(self, frame_id, multi_hand_landmarks, multi_handedness, captured, started, finished):
+        self.frame_id = frame_id
+        self.multi_hand_landmarks = multi_hand_landmarks or []
+        self.multi_handedness = multi_handedness or []
+        self.captured = captured      # 畫面讀取時間
+        self.started = started        # 開始偵測時間
+        self.finished = finished      # 偵測完成時間
+
+
+class HandDetector:
+    """
+    背景執行緒對最新畫面執行 MediaPipe Hands
+    偵測在縮小的畫面上進行；正規化的關鍵點不受縮放影響，可直接畫在原尺寸畫面上
+    """
+
+    def __init__(self, grabber: FrameGrabber, infer_width: int = INFER_WIDTH,
+                 max_num_hands: int = MAX_NUM_HANDS, on_result=None):
+        self.grabber = grabber
+        self.infer_width = infer_width
+        self.max_num_hands = max_num_hands
+        self.on_result = on_result    # 每次偵測完成後在偵測執行緒呼叫 on_result(result)
+
+        self._lock = threading.Lock()
+        self._result = None
+        self.infer_ms = None          # 偵測時間 (平滑)
+        self.wait_ms = None           # 畫面讀取後到開始偵測的等待時間 (平滑)
+        self.count = 0
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        # MediaPipe 物件只在這條執行緒中使用
+        hands = mp_hands.Hands(
+            static_image_mode=False,      # False = 影片模式 (更快)
+            max_num_hands=self.max_num_hands,
+            min_detection_confidence=0.5, # 偵測信心閾值
+            min_tracking_confidence=0.5   # 追蹤信心閾值
+        )
 
+        last_id = 0
+        try:
+            while self.running and self.grabber.running:
+                frame_id, frame, captured = self.grabber.wait_newer(last_id)
+                if frame is None or frame_id == last_id:
+                    continue
+                last_id = frame_id
 
-def main():
-    # 初始化 MediaPipe Hands
-    mp_hands = mp.solutions.hands
-    mp_draw = mp.solutions.drawing_utils
+                started = time.perf_counter()
+                h, w = frame.shape[:2]
+                if self.infer_width and w > self.infer_width:
+                    size = (self.infer_width, round(h * self.infer_width / w))
+                    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                    rgb_frame = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+                else:
+                    # BGR 轉 RGB (MediaPipe 需要 RGB)
+                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-    # 建立手部偵測器
-    hands = mp_hands.Hands(
-        static_image_mode=False,      # False = 影片模式 (更快)
-        max_num_hands=2,              # 最多偵測 2 隻手
-        min_detection_confidence=0.5, # 偵測信心閾值
-        min_tracking_confidence=0.5   # 追蹤信心閾值
-    )
+                results = hands.process(rgb_frame)
+                finished = time.perf_counter()
 
+                result = HandResult(frame_id, results.multi_hand_landmarks,
+                                    results.multi_handedness, captured, started, finished)
+                with self._lock:
+                    self._result = result
+                    self.count += 1
+                self.infer_ms = _ema(self.infer_ms, (finished - started) * 1000)
+                self.wait_ms = _ema(self.wait_ms, (started - captured) * 1000)
+
+                if self.on_result is not None:
+                    self.on_result(result)
+        finally:
+            hands.close()
+
+    def latest(self):
+        """最近一次的偵測結果 (尚未完成任何偵測時為 None)"""
+        with self._lock:
+            return self._result
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+
+# ============== 提示音 ==============
+class SoundCue:
+    """
+    非同步播放 wav 提示音 (不阻塞偵測執行緒)
+    使用 Windows 內建的 winsound；其他平台不支援時只在第一次提示
+    """
+
+    def __init__(self, path: str, cooldown: float = CUE_COOLDOWN):
+        self.path = path
+        self.cooldown = cooldown
+        self._last = 0.0
+        try:
+            import winsound
+            self._winsound = winsound
+        except ImportError:
+            self._winsound = None
+            print("警告: 此平台不支援 winsound，提示音停用")
+
+        if not os.path.exists(path):
+            print(f"警告: 找不到提示音 {path}")
+
+    def play(self):
+        now = time.perf_counter()
+        if self._winsound is None or now - self._last < self.cooldown:
+            return
+        self._last = now
+        self._winsound.PlaySound(self.path, self._winsound.SND_FILENAME | self._winsound.SND_ASYNC)
+
+
+# ============== 繪製 ==============
+def draw_hands(frame: np.ndarray, result: HandResult):
+    """繪製手部關鍵點、連接線與手腕位置"""
+    h, w = frame.shape[:2]
+    for hand_landmarks in result.multi_hand_landmarks:
+        # 繪製手部關鍵點與連接線
+        mp_draw.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+
+        # 取得手腕座標 (示範如何取得特定關鍵點；偵測用的是縮小畫面，依顯示畫面尺寸換算)
+        points = landmarks_to_pixels(hand_landmarks, w, h)
+        cx, cy = points[mp_hands.HandLandmark.WRIST].astype(int)
+
+        # 在手腕位置畫圓
+        cv2.circle(frame, (int(cx), int(cy)), 10, (0, 255, 0), -1)
+
+
+def draw_latency(frame: np.ndarray, lines: list):
+    """左上角顯示各階段延遲"""
+    for i, text in enumerate(lines):
+        y = 30 + i * 28
+        cv2.putText(frame, text, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 4)
+        cv2.putText(frame, text, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+
+
+def main(camera_id: int = 0, infer_width: int = INFER_WIDTH, max_num_hands: int = MAX_NUM_HANDS,
+         show_latency: bool = True, on_result=None, overlay=None):
+    """
+    即時手部追蹤
+
+    參數:
+        on_result: 每次偵測完成後在偵測執行緒呼叫 on_result(result)
+        overlay: 每張顯示畫面繪製後呼叫 overlay(frame)，可疊加額外資訊
+    """
     # 開啟攝影機
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    grabber = FrameGrabber(camera_id)
+    if not grabber.is_opened():
+        print(f"錯誤: 無法開啟攝影機 {camera_id}")
+        return
+
+    grabber.start()
+    detector = HandDetector(grabber, infer_width, max_num_hands, on_result)
+    detector.start()
 
     print("手部追蹤已啟動，按 'q' 退出")
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    last_id = 0
+    display_fps = None
+    result_age_ms = None
+    frame_age_ms = None
+    last_time = time.perf_counter()
+    start_time = last_time
+
+    try:
+        while grabber.running:
+            frame_id, frame, captured = grabber.wait_newer(last_id)
+            if frame is None or frame_id == last_id:
+                continue
+            last_id = frame_id
 
-        # 水平翻轉 (鏡像)
-        frame = cv2.flip(frame, 1)
+            # 畫面由讀取執行緒持有，繪製前複製一份
+            frame = frame.copy()
+            result = detector.latest()
+            if result is not None:
+                draw_hands(frame, result)
+            if overlay is not None:
+                overlay(frame)
 
-        # BGR 轉 RGB (MediaPipe 需要 RGB)
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            now = time.perf_counter()
+            display_fps = _ema(display_fps, 1.0 / max(now - last_time, 1e-6))
+            last_time = now
+            frame_age_ms = _ema(frame_age_ms, (now - captured) * 1000)
+            if result is not None:
+                # 畫面上的關鍵點來自多久之前讀取的畫面
+                result_age_ms = _ema(result_age_ms, (now - result.captured) * 1000)
 
-        # 執行手部偵測
-        results = hands.process(rgb_frame)
+            if show_latency:
+                lines = [f"Display: {display_fps:.1f} FPS | frame age {frame_age_ms:.0f} ms"]
+                if detector.infer_ms is not None:
+                    detect_fps = detector.count / max(now - start_time, 1e-6)
+                    lines.append(f"Detect: {detector.infer_ms:.0f} ms ({detect_fps:.1f} FPS) | "
+                                 f"wait {detector.wait_ms:.0f} ms")
+                if result_age_ms is not None:
+                    lines.append(f"Landmarks age: {result_age_ms:.0f} ms")
+                draw_latency(frame, lines)
 
-        # 繪製結果
-        if results.multi_hand_landmarks:
-            for hand_landmarks in results.multi_hand_landmarks:
-                # 繪製手部關鍵點與連接線
-                mp_draw.draw_landmarks(
-                    frame,
-                    hand_landmarks,
-                    mp_hands.HAND_CONNECTIONS
-                )
+            # 顯示畫面
+            cv2.imshow("Hand Tracking", frame)
 
-                # 取得手腕座標 (示範如何取得特定關鍵點)
-                h, w, _ = frame.shape
-                wrist = hand_landmarks.landmark[mp_hands.HandLandmark.WRIST]
-                cx, cy = int(wrist.x * w), int(wrist.y * h)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                break
+    finally:
+        # 釋放資源
+        detector.stop()
+        grabber.stop()
+        cv2.destroyAllWindows()
 
-                # 在手腕位置畫圓
-                cv2.circle(frame, (cx, cy), 10, (0, 255, 0), -1)
+    if detector.infer_ms is not None and result_age_ms is not None:
+        print(f"平均偵測時間: {detector.infer_ms:.1f} ms | 關鍵點延遲: {result_age_ms:.1f} ms")
 
-        # 顯示畫面
-        cv2.imshow("Hand Tracking", frame)
 
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MediaPipe 手部追蹤")
+    parser.add_argument("--camera", type=int, default=0,
+                        help="攝影機編號")
+    parser.add_argument("--infer-width", type=int, default=INFER_WIDTH,
+                        help="偵測用畫面寬度 (0 = 使用原始大小)")
+    parser.add_argument("--max-hands", type=int, default=MAX_NUM_HANDS,
+                        help="最多偵測幾隻手")
+    parser.add_argument("--no-latency", action="store_true",
+                        help="不顯示延遲資訊")
+    parser.add_argument("--publish", action="store_true",
+                        help="將手勢事件發布到本機 TCP (其他程式可訂閱)")
+    parser.add_argument("--port", type=int, default=None,
+                        help="手勢事件的 port (預設 5555)")
+    parser.add_argument("--sound", action="store_true",
+                        help="偵測到手時播放 Hand Sign.wav，手勢事件 (--publish) 播放 Hand Sign_2.wav")
+    args = parser.parse_args()
 
-    # 釋放資源
-    cap.release()
-    cv2.destroyAllWindows()
-    hands.close()
+    callbacks = []
+    overlay = None
+    publisher = None
 
+    if args.sound:
+        hand_cue = SoundCue(HAND_CUE)
+        had_hands = [False]
 
-if __name__ == "__main__":
-    main()
+        def play_hand_cue(result):
+            # 畫面中從沒有手變成有手時提示
+            has_hands = bool(result.multi_hand_landmarks)
+            if has_hands and not had_hands[0]:
+                hand_cue.play()
+            had_hands[0] = has_hands
+
+        callbacks.append(play_hand_cue)
+
+    if args.publish:
+        from gesture_events import PORT, EventPublisher, GestureEngine
+
+        engine = GestureEngine()
+        publisher = EventPublisher(port=args.port or PORT)
+        publisher.start()
+        recent = deque(maxlen=3)
+
+        gesture_cue = SoundCue(GESTURE_CUE) if args.sound else None
+
+        def publish_gestures(result):
+            # 在偵測執行緒中執行，事件產生後立即發布 (不等畫面顯示)
+            events = engine.update(result.multi_hand_landmarks, result.multi_handedness,
+                                   result.finished)
+            publisher.publish(events)
+            for event in events:
+                detail = event.get("count", event.get("direction", ""))
+                recent.append(f"{event['hand']} {event['type']} {detail}".rstrip())
+            if gesture_cue is not None and any(e["type"] in ("pinch_start", "swipe") for e in events):
+                gesture_cue.play()
+
+        callbacks.append(publish_gestures)
+
+        def overlay(frame):
+            h = frame.shape[0]
+            for i, text in enumerate(reversed(recent)):
+                cv2.putText(frame, text, (10, h - 20 - i * 28), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.7, (255, 255, 255), 2)
+
+    def on_result(result):
+        for callback in callbacks:
+            callback(result)
+
+    try:
+        main(args.camera, args.infer_width, args.max_hands, show_latency=not args.no_latency,
+             on_result=on_result if callbacks else None, overlay=overlay)
+    finally:
+        if publisher is not None:
+            publisher.stop()
@@ -5,81 +5,20 @@ import cv2
 import numpy as np
 import json
 import os
+import sys
 from collections import OrderedDict
 
-import torch
-import torch.nn as nn
-from torchvision import transforms
-
-# ============== Model Definition (Copied from predict_coin.py) ==============
-class CoinCNN(nn.Module):
-    def __init__(self, num_classes=2):
-        super(CoinCNN, self).__init__()
-
-        self.features = nn.Sequential(
-            nn.Conv2d(3, 32, kernel_size=3, padding=1),
-            nn.BatchNorm2d(32),
-            nn.ReLU(inplace=True),
-            nn.MaxPool2d(2, 2),
-
-            nn.Conv2d(32, 64, kernel_size=3, padding=1),
-            nn.BatchNorm2d(64),
-            nn.ReLU(inplace=True),
-            nn.MaxPool2d(2, 2),
-
-            nn.Conv2d(64, 128, kernel_size=3, padding=1),
-            nn.BatchNorm2d(128),
-            nn.ReLU(inplace=True),
-            nn.MaxPool2d(2, 2),
-
-            nn.Conv2d(128, 256, kernel_size=3, padding=1),
-            nn.BatchNorm2d(256),
-            nn.ReLU(inplace=True),
-            nn.MaxPool2d(2, 2),
-
-            nn.Conv2d(256, 512, kernel_size=3, padding=1),
-            nn.BatchNorm2d(512),
-            nn.ReLU(inplace=True),
-            nn.MaxPool2d(2, 2),
-        )
-
-        self.classifier = nn.Sequential(
-            nn.AdaptiveAvgPool2d((1, 1)),
-            nn.Flatten(),
-            nn.Linear(512, 256),
-            nn.ReLU(inplace=True),
-            nn.Dropout(0.5),
-            nn.Linear(256, num_classes)
-        )
-
-    def forward(self, x):
-        x = self.features(x)
-        x = self.classifier(x)
-        return x
-
-# ============== Preprocessing (Copied from predict_coin.py) ==============
-def get_transform(image_size=224): # IMAGE_SIZE from predict_coin.py
-    return transforms.Compose([
-        transforms.Resize((image_size, image_size)),
-        transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406],
-                             [0.229, 0.224, 0.225])
-    ])
-
-# ============== Prediction (Adapted from predict_coin.py) ==============
-def predict_coin(model, image_tensor, class_names, device):
-    """進行硬幣分類預測"""
-    image_tensor = image_tensor.to(device)
-
-    with torch.no_grad():
-        output = model(image_tensor)
-        probabilities = torch.softmax(output, dim=1)
-        confidence, predicted = torch.max(probabilities, 1)
-
-    predicted_class = class_names[predicted.item()]
-    confidence_value = confidence.item()
-
-    return predicted_class, confidence_value
+# Classifier backend: "torch" (PyTorch .pth) or "onnx" (.onnx exported by DAY2/export_onnx.py)
+# onnx 不需要載入 PyTorch，程式啟動與 CPU 推論都比較快
+CLASSIFIER_BACKEND = "torch"
+
+if CLASSIFIER_BACKEND == "onnx":
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "DAY2"))
+    from onnx_backend import OnnxClassifier
+else:
+    import torch
+    from coin_torch import CoinCNN, get_transform, predict_coin
+
 
 class ImageProcessorApp(tk.Tk):
     def __init__(self):
@@ -98,7 +37,9 @@ class ImageProcessorApp(tk.Tk):
         self.tails_count_var = tk.StringVar(value="反面 (Tails): N/A")
         
         # Classifier Model Setup
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.device = None
+        if CLASSIFIER_BACKEND == "torch":
+            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.classifier_model = None
         self.classifier_class_names = None
         self.classifier_transform = None
@@ -192,7 +133,8 @@ class ImageProcessorApp(tk.Tk):
         """載入訓練好的硬幣分類模型"""
         # SCRIPT_DIR for GUI.py
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(script_dir, "models", "coin_classifier.pth")
+        model_file = "coin_classifier.onnx" if CLASSIFIER_BACKEND == "onnx" else "coin_classifier.pth"
+        model_path = os.path.join(script_dir, "models", model_file)
         
         if not os.path.exists(model_path):
             messagebox.showwarning(
@@ -203,6 +145,13 @@ class ImageProcessorApp(tk.Tk):
             return
 
         try:
+            if CLASSIFIER_BACKEND == "onnx":
+                self.classifier_model = OnnxClassifier(model_path)
+                self.classifier_class_names = self.classifier_model.class_names
+                print(f"硬幣分類模型已從 {model_path} 載入 ({self.classifier_model.backend})")
+                print(f"分類類別: {self.classifier_class_names}")
+                return
+
             checkpoint = torch.load(model_path, map_location=self.device, weights_only=False)
             self.classifier_class_names = checkpoint['class_names']
             image_size = checkpoint.get('image_size', 224) # Default IMAGE_SIZE for predict_coin.py
@@ -360,7 +309,7 @@ class ImageProcessorApp(tk.Tk):
             total_calculated_weight += assigned_weight
             
             pred_class, conf_value = None, 0.0
-            if self.classifier_model and self.classifier_transform:
+            if self.classifier_model:
                 circle_data_raw = p_circle['original_circle']
                 center_int = (int(circle_data_raw[0]), int(circle_data_raw[1]))
                 radius_int = int(circle_data_raw[2])
@@ -374,8 +323,11 @@ class ImageProcessorApp(tk.Tk):
                 if roi_to_predict.size > 0:
                     try:
                         roi_pil = Image.fromarray(cv2.cvtColor(roi_to_predict, cv2.COLOR_BGR2RGB))
-                        image_tensor = self.classifier_transform(roi_pil).unsqueeze(0)
-                        pred_class, conf_value = predict_coin(self.classifier_model, image_tensor, self.classifier_class_names, self.device)
+                        if CLASSIFIER_BACKEND == "onnx":
+                            pred_class, conf_value, _ = self.classifier_model.predict(roi_pil)
+                        else:
+                            image_tensor = self.classifier_transform(roi_pil).unsqueeze(0)
+                            pred_class, conf_value = predict_coin(self.classifier_model, image_tensor, self.classifier_class_names, self.device)
                         if pred_class == 'heads':
                             heads_count += 1
                         elif pred_class == 'tails':
@@ -0,0 +1,78 @@
+"""
+CoinCNN PyTorch 分類器 (GUI.py 在 CLASSIFIER_BACKEND = "torch" 時載入)
+獨立成模組，使用 onnx 後端時不會匯入 PyTorch
+"""
+
+import torch
+import torch.nn as nn
+from torchvision import transforms
+
+# ============== Model Definition (Copied from predict_coin.py) ==============
+class CoinCNN(nn.Module):
+    def __init__(self, num_classes=2):
+        super(CoinCNN, self).__init__()
+
+        self.features = nn.Sequential(
+            nn.Conv2d(3, 32, kernel_size=3, padding=1),
+            nn.BatchNorm2d(32),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+
+            nn.Conv2d(32, 64, kernel_size=3, padding=1),
+            nn.BatchNorm2d(64),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+
+            nn.Conv2d(64, 128, kernel_size=3, padding=1),
+            nn.BatchNorm2d(128),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+
+            nn.Conv2d(128, 256, kernel_size=3, padding=1),
+            nn.BatchNorm2d(256),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+
+            nn.Conv2d(256, 512, kernel_size=3, padding=1),
+            nn.BatchNorm2d(512),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2, 2),
+        )
+
+        self.classifier = nn.Sequential(
+            nn.AdaptiveAvgPool2d((1, 1)),
+            nn.Flatten(),
+            nn.Linear(512, 256),
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.5),
+            nn.Linear(256, num_classes)
+        )
+
+    def forward(self, x):
+        x = self.features(x)
+        x = self.classifier(x)
+        return x
+
+# ============== Preprocessing (Copied from predict_coin.py) ==============
+def get_transform(image_size=224): # IMAGE_SIZE from predict_coin.py
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406],
+                             [0.229, 0.224, 0.225])
+    ])
+
+# ============== Prediction (Adapted from predict_coin.py) ==============
+def predict_coin(model, image_tensor, class_names, device):
+    """進行硬幣分類預測"""
+    image_tensor = image_tensor.to(device)
+
+    with torch.no_grad():
+        output = model(image_tensor)
+        probabilities = torch.softmax(output, dim=1)
+        confidence, predicted = torch.max(probabilities, 1)
+
+    predicted_class = class_names[predicted.item()]
+    confidence_value = confidence.item()
+
+    return predicted_class, confidence_value
@@ -1,9 +1,20 @@
 """
 OCS System - GUI Launcher
 啟動 CustomTkinter 圖形介面版本 V2 (改進版)
+
+先顯示輕量的 tkinter 載入畫面，cv2 / numpy / customtkinter 與核心模組在背景執行緒匯入，
+完成後才建立主視窗；各模組的匯入時間記錄在 startup_times.jsonl
+(加上 --no-splash 則與舊版相同，直接匯入後開啟主視窗)
 """
 
+import time
+
+_START_TIME = time.perf_counter()
+
+import argparse
 import sys
+import tkinter as tk
+from tkinter import ttk
 from pathlib import Path
 
 # 設定 Windows 控制台編碼 (解決 emoji 顯示問題)
@@ -15,19 +26,104 @@ if sys.platform == 'win32':
 # 加入專案路徑
 sys.path.append(str(Path(__file__).parent))
 
-from ui.main_window import OCSMainWindowV2
+from utils.startup import BackgroundImporter, append_startup_log
+
+# 背景匯入的模組 (較底層的套件在前，時間才能分開計算)
+HEAVY_MODULES = [
+    "numpy",
+    "cv2",
+    "PIL.ImageTk",
+    "customtkinter",
+    "core.image_processor",
+    "core.coin_classifier",
+    "ui.main_window",
+]
+STARTUP_LOG = str(Path(__file__).parent / "startup_times.jsonl")
+POLL_MS = 50
+
+
+def show_splash(importer: BackgroundImporter) -> float:
+    """
+    顯示載入畫面直到背景匯入完成
+    回傳載入畫面出現的時間 (距離程式啟動的秒數)
+    """
+    splash = tk.Tk()
+    splash.title("OCS")
+    splash.overrideredirect(True)
+    splash.configure(bg="#2b2b2b")
+
+    width, height = 360, 120
+    x = (splash.winfo_screenwidth() - width) // 2
+    y = (splash.winfo_screenheight() - height) // 2
+    splash.geometry(f"{width}x{height}+{x}+{y}")
+
+    tk.Label(splash, text="🪙 OCS 硬幣辨識系統", font=("Arial", 16, "bold"),
+             fg="white", bg="#2b2b2b").pack(pady=(18, 6))
+    status = tk.Label(splash, text="載入中...", fg="gray70", bg="#2b2b2b")
+    status.pack()
+    progress = ttk.Progressbar(splash, mode="indeterminate", length=280)
+    progress.pack(pady=8)
+    progress.start(15)
+
+    splash.update()
+    shown = time.perf_counter() - _START_TIME
+
+    def poll():
+        if importer.is_done():
+            progress.stop()
+            splash.destroy()
+            return
+        if importer.current:
+            status.configure(text=f"載入中... {importer.current}")
+        splash.after(POLL_MS, poll)
+
+    splash.after(POLL_MS, poll)
+    splash.mainloop()
+    return shown
 
 
 def main():
     """啟動 GUI"""
+    parser = argparse.ArgumentParser(description="OCS 硬幣辨識系統 GUI")
+    parser.add_argument("--no-splash", action="store_true",
+                        help="不顯示載入畫面，直接匯入後開啟主視窗")
+    args = parser.parse_args()
+
     print("=" * 50)
     print("🪙 OCS 硬幣辨識系統 V2 - 改進版 GUI")
     print("=" * 50)
     print("正在啟動圖形介面...")
     print()
-    
+
+    importer = BackgroundImporter(HEAVY_MODULES)
+
     try:
+        if args.no_splash:
+            importer.start()
+            importer.wait()
+            shown = None
+        else:
+            importer.start()
+            shown = show_splash(importer)
+
+        if importer.error:
+            raise ImportError(importer.error)
+
+        from ui.main_window import OCSMainWindowV2
+
         app = OCSMainWindowV2()
+        app.update_idletasks()
+        ready = time.perf_counter() - _START_TIME
+
+        print("⏱️ 模組匯入時間:")
+        print(importer.report())
+        if shown is not None:
+            print(f"  載入畫面出現: {shown:.2f} 秒")
+        print(f"  主視窗就緒: {ready:.2f} 秒")
+        print()
+        append_startup_log(STARTUP_LOG, importer.timings, splash=not args.no_splash,
+                           window_shown=shown if shown is not None else ready, ready=ready)
+
         app.mainloop()
     except Exception as e:
         print(f"❌ 啟動失敗: {e}")
@@ -0,0 +1,82 @@
+"""
+Startup Module
+背景匯入耗時的套件 (cv2、numpy、customtkinter ...) 並記錄每個模組的匯入時間，
+讓視窗 (啟動畫面) 先出現，匯入時間變長時也能從紀錄中看出來
+"""
+
+import importlib
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+class BackgroundImporter:
+    """在背景執行緒依序匯入模組，記錄各自花費的時間"""
+
+    def __init__(self, modules: List[str]):
+        """
+        Args:
+            modules: 模組名稱 (依序匯入；先列出較底層的套件，時間才不會全算在最後一個模組上)
+        """
+        self.modules = modules
+        self.timings: Dict[str, float] = {}   # 模組名稱 -> 匯入秒數
+        self.error: Optional[str] = None
+        self.current: Optional[str] = None    # 正在匯入的模組 (顯示在載入畫面)
+        self._done = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        try:
+            for name in self.modules:
+                self.current = name
+                start = time.perf_counter()
+                importlib.import_module(name)
+                self.timings[name] = time.perf_counter() - start
+        except Exception as e:
+            self.error = f"{self.current}: {e}"
+        finally:
+            self.current = None
+            self._done.set()
+
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def total(self) -> float:
+        return sum(self.timings.values())
+
+    def report(self) -> str:
+        """匯入時間表 (由慢到快)"""
+        lines = [f"  {name:28} {seconds * 1000:8.0f} ms"
+                 for name, seconds in sorted(self.timings.items(), key=lambda item: -item[1])]
+        lines.append(f"  {'總計':26} {self.total() * 1000:8.0f} ms")
+        return "\n".join(lines)
+
+
+def append_startup_log(path: str, timings: Dict[str, float], **extra):
+    """
+    將一次啟動的時間 (秒) 以 JSON Lines 附加到紀錄檔，方便比較不同版本的啟動時間
+
+    Args:
+        path: 紀錄檔路徑
+        timings: 模組名稱 -> 匯入秒數
+        extra: 其他欄位 (例如 window_shown、ready)
+    """
+    record = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "imports": {name: round(seconds, 4) for name, seconds in timings.items()},
+    }
+    record.update({key: round(value, 4) if isinstance(value, float) else value
+                   for key, value in extra.items()})
+
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"⚠️ 無法寫入啟動紀錄 {path}: {e}")